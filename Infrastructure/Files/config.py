@@ -14,3 +14,52 @@ import os
 
 application_file_path = os.path.dirname(os.path.abspath(__file__))
 
+
+# Serve community radius searches from the in-process spatial index (Logic/SpatialIndex.py).
+# Set URBANHIVE_COMMUNITY_SPATIAL_INDEX=0 to query MongoDB's 2dsphere index with $geoNear instead.
+community_spatial_index_enabled = os.environ.get("URBANHIVE_COMMUNITY_SPATIAL_INDEX", "1") == "1"
+
+# Cache in front of the community radius search (Logic/RadiusSearchCache.py).
+radius_search_cache_enabled = os.environ.get("URBANHIVE_RADIUS_SEARCH_CACHE", "1") == "1"
+radius_search_cache_ttl_seconds = float(os.environ.get("URBANHIVE_RADIUS_SEARCH_CACHE_TTL_SECONDS", "60"))
+radius_search_cache_max_entries = int(os.environ.get("URBANHIVE_RADIUS_SEARCH_CACHE_MAX_ENTRIES", "1024"))
+
+# MongoDB connection. One client (and one connection pool) is shared by the whole process; see Infrastructure/database.py.
+mongo_uri = os.environ.get("URBANHIVE_MONGO_URI", "mongodb://localhost:27017/UrbanHive")
+mongo_database = os.environ.get("URBANHIVE_MONGO_DATABASE", "UrbanHive")
+mongo_max_pool_size = int(os.environ.get("URBANHIVE_MONGO_MAX_POOL_SIZE", "100"))
+mongo_min_pool_size = int(os.environ.get("URBANHIVE_MONGO_MIN_POOL_SIZE", "0"))
+# How long a request waits for a free pooled connection, and for a reachable server, before failing
+mongo_wait_queue_timeout_ms = int(os.environ.get("URBANHIVE_MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+mongo_server_selection_timeout_ms = int(os.environ.get("URBANHIVE_MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+# Create missing indexes (Infrastructure/indexes.py) in a background thread at startup instead of blocking create_app.
+index_bootstrap_background = os.environ.get("URBANHIVE_INDEX_BOOTSTRAP_BACKGROUND", "1") == "1"
+
+# Keyset pagination of the list endpoints (/users, /communities/get_all, /events/get_all_events)
+page_default_limit = int(os.environ.get("URBANHIVE_PAGE_DEFAULT_LIMIT", "100"))
+page_max_limit = int(os.environ.get("URBANHIVE_PAGE_MAX_LIMIT", "1000"))
+# Documents fetched per round trip by the streaming mode (?stream=1) of the list endpoints
+stream_batch_size = int(os.environ.get("URBANHIVE_STREAM_BATCH_SIZE", "500"))
+
+# Read-through cache of users by 'id' and communities by 'area' (Infrastructure/cached_collection.py).
+# Set URBANHIVE_ENTITY_CACHE=0 to read every document from MongoDB.
+entity_cache_enabled = os.environ.get("URBANHIVE_ENTITY_CACHE", "1") == "1"
+entity_cache_ttl_seconds = float(os.environ.get("URBANHIVE_ENTITY_CACHE_TTL_SECONDS", "30"))
+entity_cache_max_entries = int(os.environ.get("URBANHIVE_ENTITY_CACHE_MAX_ENTRIES", "2048"))
+
+# Debugging aid: report the number of MongoDB round trips of every request in the X-Mongo-Round-Trips header.
+mongo_round_trip_header = os.environ.get("URBANHIVE_MONGO_ROUND_TRIP_HEADER", "0") == "1"
+
+# Event invitations (Infrastructure/invitations.py): guest ids per UpdateMany, and the guest list length above which
+# add_event returns before the invitations are sent, leaving them to a background worker
+invitation_batch_size = int(os.environ.get("URBANHIVE_INVITATION_BATCH_SIZE", "1000"))
+invitation_defer_threshold = int(os.environ.get("URBANHIVE_INVITATION_DEFER_THRESHOLD", "5000"))
+
+# Friend, community and event requests (Infrastructure/inbox.py). MongoDB's TTL monitor deletes pending requests
+# nobody answered after inbox_pending_ttl_days, and answered ones inbox_resolved_ttl_days after the answer.
+inbox_pending_ttl_days = float(os.environ.get("URBANHIVE_INBOX_PENDING_TTL_DAYS", "30"))
+inbox_resolved_ttl_days = float(os.environ.get("URBANHIVE_INBOX_RESOLVED_TTL_DAYS", "7"))
+
+# Number of latest post and event ids a community document keeps (Infrastructure/community_summary.py)
+community_recent_items = int(os.environ.get("URBANHIVE_COMMUNITY_RECENT_ITEMS", "20"))
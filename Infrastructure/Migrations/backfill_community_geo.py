@@ -0,0 +1,67 @@
+"""
+One-time migration that backfills the GeoJSON 'geo' field on existing communities.
+
+Communities created before the radius search moved to a 2dsphere index only have the
+'location.latitude' / 'location.longitude' pair (often stored as strings). This script converts
+that pair into a GeoJSON Point stored under 'geo', and makes sure the 2dsphere index exists.
+
+The migration is idempotent: communities that already have a 'geo' field are skipped.
+
+Usage (from the repository root):
+    python Infrastructure/Migrations/backfill_community_geo.py
+"""
+import os
+import sys
+
+# Make the repository root and the Infrastructure directory importable, like app.py expects
+infrastructure_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, infrastructure_path)
+sys.path.insert(0, os.path.dirname(infrastructure_path))
+
+from pymongo import GEOSPHERE, UpdateOne
+
+from database import DataBase
+from Logic.GeoPoint import GeoPoint
+
+
+def backfill_community_geo(db, batch_size=500):
+    """
+    Add a GeoJSON 'geo' field to every community that does not have one yet.
+
+    Parameters:
+    - db (Database): The UrbanHive database.
+    - batch_size (int): How many updates to send to MongoDB per bulk write.
+
+    Returns:
+    - tuple: (updated, skipped) where skipped counts communities with a missing or invalid location.
+    """
+    communities = db['communities']
+
+    updated = 0
+    skipped = 0
+    operations = []
+    for community in communities.find({"geo": {"$exists": False}}, {"_id": 1, "area": 1, "location": 1}):
+        try:
+            geo = GeoPoint.from_location(community["location"])
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Skipping community '{community.get('area')}': invalid location ({e})")
+            skipped += 1
+            continue
+
+        operations.append(UpdateOne({"_id": community["_id"]}, {"$set": {"geo": geo}}))
+        if len(operations) >= batch_size:
+            updated += communities.bulk_write(operations, ordered=False).modified_count
+            operations = []
+
+    if operations:
+        updated += communities.bulk_write(operations, ordered=False).modified_count
+
+    # Build the index after the backfill so it is created over complete data in one pass
+    communities.create_index([("geo", GEOSPHERE)])
+
+    return updated, skipped
+
+
+if __name__ == "__main__":
+    updated_count, skipped_count = backfill_community_geo(DataBase().db)
+    print(f"Backfilled 'geo' on {updated_count} communities, skipped {skipped_count}")
@@ -0,0 +1,101 @@
+"""
+One-time migration that moves the attendance of events into the rsvps collection (see Infrastructure/attendance.py)
+and removes the arrays it was recorded in.
+
+Attendance is collected from:
+- events.attending (accepted invitations) and events.attendees (confirmed join requests),
+- the initiator of every event,
+- users.events (accepted invitations and created events) and users.attending_events (confirmed join requests).
+
+RSVPs are upserted by (event_id, user_id), then the attendee_count of every event is recomputed from the
+collection, so the migration can be run again after a partial run. Attendance of events that no longer exist is
+dropped.
+
+Usage (from the repository root):
+    python Infrastructure/Migrations/move_attendance.py
+"""
+import os
+import sys
+
+# Make the repository root and the Infrastructure directory importable, like app.py expects
+infrastructure_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, infrastructure_path)
+sys.path.insert(0, os.path.dirname(infrastructure_path))
+
+from pymongo import UpdateOne
+
+from attendance import Attendance
+from database import DataBase
+from indexes import REQUIRED_INDEXES, IndexManager
+
+
+def legacy_attendance(db):
+    """
+    Collects the (event_id, user_id) pairs recorded in events and users.
+    """
+    pairs = set()
+    for event in db["events"].find({}, {"event_id": 1, "initiator": 1, "attending": 1, "attendees": 1}):
+        if event.get("initiator"):
+            pairs.add((event["event_id"], event["initiator"]))
+        for user_id in (event.get("attending") or []) + (event.get("attendees") or []):
+            pairs.add((event["event_id"], user_id))
+
+    for user in db["users"].find({"$or": [{"events.0": {"$exists": True}}, {"attending_events.0": {"$exists": True}}]},
+                                 {"id": 1, "events": 1, "attending_events": 1}):
+        event_ids = [event.get("event_id") for event in user.get("events") or []] + (user.get("attending_events") or [])
+        pairs.update((event_id, user["id"]) for event_id in event_ids if event_id)
+    return pairs
+
+
+def move_attendance(db, batch_size=500):
+    """
+    Moves the attendance of events into the rsvps collection and removes the old arrays.
+
+    Parameters:
+    - db (Database): The UrbanHive database.
+    - batch_size (int): How many RSVPs to upsert per bulk write.
+
+    Returns:
+    - int: The number of RSVPs added (RSVPs added by an earlier run are not counted).
+    """
+    attendance = Attendance(db["rsvps"], db["events"])
+    IndexManager(db, {"rsvps": REQUIRED_INDEXES["rsvps"]}).ensure_indexes()
+
+    fields = {"event_id": 1, "event_name": 1, "community_name": 1, "start_time": 1, "end_time": 1}
+    events = {event["event_id"]: event for event in db["events"].find({}, fields)}
+
+    added = 0
+    operations = []
+    for event_id, user_id in legacy_attendance(db):
+        event = events.get(event_id)
+        if event is None:
+            continue
+        rsvp = attendance.new_rsvp(event, user_id)
+        # The time of the answer was not recorded; the creation of the event is the closest known time
+        rsvp["responded_at"] = event["_id"].generation_time.replace(tzinfo=None)
+        operations.append(UpdateOne({"event_id": event_id, "user_id": user_id}, {"$setOnInsert": rsvp}, upsert=True))
+        if len(operations) >= batch_size:
+            added += db["rsvps"].bulk_write(operations, ordered=False).upserted_count
+            operations = []
+
+    if operations:
+        added += db["rsvps"].bulk_write(operations, ordered=False).upserted_count
+
+    counts = {result["_id"]: result["count"]
+              for result in db["rsvps"].aggregate([{"$group": {"_id": "$event_id", "count": {"$sum": 1}}}])}
+    count_updates = [UpdateOne({"_id": event["_id"]}, {"$set": {"attendee_count": counts.get(event_id, 0)}})
+                     for event_id, event in events.items()]
+    for start in range(0, len(count_updates), batch_size):
+        db["events"].bulk_write(count_updates[start:start + batch_size], ordered=False)
+
+    # Only remove the old copies once every RSVP is in the collection
+    db["events"].update_many({"$or": [{"attending": {"$exists": True}}, {"attendees": {"$exists": True}}]},
+                             {"$unset": {"attending": "", "attendees": ""}})
+    db["users"].update_many({"$or": [{"events": {"$exists": True}}, {"attending_events": {"$exists": True}}]},
+                            {"$unset": {"events": "", "attending_events": ""}})
+    return added
+
+
+if __name__ == "__main__":
+    added_count = move_attendance(DataBase().db)
+    print(f"Added {added_count} RSVPs")
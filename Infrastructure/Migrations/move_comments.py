@@ -0,0 +1,83 @@
+"""
+One-time migration that moves the comments embedded in posts ('posting.comments') to the comments collection,
+and replaces them by the comment_count of each post.
+
+Embedded comments have no date; they get the date of their post plus one millisecond per position, so the thread
+keeps its order. Comments are upserted by their comment_id and the counts are recomputed from the collection, so
+the migration can be run again after a partial run.
+
+Run it right after deploying, since the routes only read the comments collection.
+
+Usage (from the repository root):
+    python Infrastructure/Migrations/move_comments.py
+"""
+import datetime
+import os
+import sys
+
+# Make the repository root and the Infrastructure directory importable, like app.py expects
+infrastructure_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, infrastructure_path)
+sys.path.insert(0, os.path.dirname(infrastructure_path))
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from database import DataBase
+from indexes import REQUIRED_INDEXES, IndexManager
+
+
+def post_created_at(post):
+    """
+    Returns the date a post was created: its post_date once normalized, or the time its '_id' was generated.
+    """
+    if isinstance(post.get("post_date"), datetime.datetime):
+        return post["post_date"]
+    return post["_id"].generation_time.replace(tzinfo=None)
+
+
+def move_comments(db):
+    """
+    Moves the embedded comments of every post to the comments collection.
+
+    Parameters:
+    - db (Database): The UrbanHive database.
+
+    Returns:
+    - int: The number of posts whose comments were moved.
+    """
+    IndexManager(db, {"comments": REQUIRED_INDEXES["comments"]}).ensure_indexes()
+
+    moved_posts = 0
+    for post in db["posting"].find({"comments": {"$exists": True}}, {"post_id": 1, "post_date": 1, "comments": 1}):
+        created_at = post_created_at(post)
+        operations = []
+        for position, comment in enumerate(post["comments"] or []):
+            if not comment.get("comment_id"):
+                continue
+            document = {field: value for field, value in comment.items() if field != "_id"}
+            document.update(post_id=post["post_id"], created_at=created_at + datetime.timedelta(milliseconds=position))
+            operations.append(UpdateOne({"comment_id": comment["comment_id"]}, {"$setOnInsert": document}, upsert=True))
+        if operations:
+            db["comments"].bulk_write(operations, ordered=False)
+
+        # Only remove the embedded copies once they are all in the collection
+        comment_count = db["comments"].count_documents({"post_id": post["post_id"]})
+        db["posting"].update_one({"_id": post["_id"]},
+                                 {"$set": {"comment_count": comment_count}, "$unset": {"comments": ""}})
+        moved_posts += 1
+
+    db["posting"].update_many({"comment_count": {"$exists": False}}, {"$set": {"comment_count": 0}})
+
+    # The index served the lookups of posts by their embedded comments
+    try:
+        db["posting"].drop_index("comments.comment_id_1")
+    except OperationFailure:
+        pass
+
+    return moved_posts
+
+
+if __name__ == "__main__":
+    moved_count = move_comments(DataBase().db)
+    print(f"Moved the comments of {moved_count} posts")
@@ -0,0 +1,114 @@
+"""
+One-time migration that replaces the posts and events embedded in community documents by the bounded summaries of
+community_summary.py (counts and the ids of the latest items), and shortens the events embedded in user documents.
+
+For every community:
+- embedded posts and events missing from the 'posting' and 'events' collections are copied there first,
+- post_count, recent_post_ids, event_count and recent_event_ids are computed from those collections,
+- the embedded 'posts' and 'events' arrays are removed.
+
+The events a user created were embedded whole, guest list and attendees included; they are replaced by the same
+short form the invited users get (see add_event in RESTEvents.py).
+
+Until the migration has run, the routes read both layouts. The summaries are recomputed from the collections on
+every run, so the migration can be run again after a partial run.
+
+Usage (from the repository root):
+    python Infrastructure/Migrations/move_community_content.py
+"""
+import os
+import sys
+
+# Make the repository root and the Infrastructure directory importable, like app.py expects
+infrastructure_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, infrastructure_path)
+sys.path.insert(0, os.path.dirname(infrastructure_path))
+
+from pymongo import DESCENDING, UpdateOne
+
+from database import DataBase
+from community_summary import SUMMARY_FIELDS
+from Infrastructure.Files import config
+
+# kind -> (collection holding the items, field naming their community, order of the latest items)
+CONTENT_COLLECTIONS = {"posts": ("posting", "community_area", [("post_date", DESCENDING), ("_id", DESCENDING)]),
+                       "events": ("events", "community_name", [("_id", DESCENDING)])}
+
+# Fields of the short form of an event embedded in user documents -> field of the event document
+USER_EVENT_FIELDS = {"event_request": "event_name", "event_id": "event_id", "community_name": "community_name",
+                     "location": "location", "event_type": "event_type", "start_time": "start_time",
+                     "end_time": "end_time"}
+
+
+def user_event(event):
+    """
+    Returns the short form of an event embedded in a user document.
+    """
+    return {field: event.get(source) for field, source in USER_EVENT_FIELDS.items()}
+
+
+def write_in_batches(collection, operations, batch_size):
+    for start in range(0, len(operations), batch_size):
+        collection.bulk_write(operations[start:start + batch_size], ordered=False)
+
+
+def community_update(db, community, recent_items):
+    """
+    Copies the embedded items of a community to their collections and returns the update replacing them by the
+    summary fields.
+    """
+    area = community["area"]
+    summary = {}
+    for kind, (collection_name, community_field, latest_first) in CONTENT_COLLECTIONS.items():
+        count_field, ids_field, embedded_field, id_field = SUMMARY_FIELDS[kind]
+        collection = db[collection_name]
+
+        # The routes wrote every item to both places, so this only copies items a partial write left behind
+        copies = [UpdateOne({id_field: item[id_field]},
+                            {"$setOnInsert": {**{field: value for field, value in item.items() if field != "_id"},
+                                              community_field: area}},
+                            upsert=True)
+                  for item in community.get(embedded_field) or [] if item.get(id_field)]
+        if copies:
+            collection.bulk_write(copies, ordered=False)
+
+        summary[count_field] = collection.count_documents({community_field: area})
+        summary[ids_field] = [item[id_field] for item in
+                              collection.find({community_field: area}, {id_field: 1})
+                              .sort(latest_first).limit(recent_items)]
+
+    return UpdateOne({"_id": community["_id"]},
+                     {"$set": summary, "$unset": {embedded_field: "" for _, _, embedded_field, _ in
+                                                  SUMMARY_FIELDS.values()}})
+
+
+def move_community_content(db, batch_size=500, recent_items=config.community_recent_items):
+    """
+    Replaces the embedded posts and events of every community by summaries, and shortens the events embedded in
+    user documents.
+
+    Parameters:
+    - db (Database): The UrbanHive database.
+    - batch_size (int): How many documents to update per bulk write.
+    - recent_items (int): How many ids of the latest posts and events a community keeps.
+
+    Returns:
+    - tuple: (communities updated, users updated).
+    """
+    community_updates = [community_update(db, community, recent_items)
+                         for community in db["communities"].find({}, {"area": 1, "posts": 1, "events": 1})]
+    write_in_batches(db["communities"], community_updates, batch_size)
+
+    # Events embedded whole carry their guest list, the short form does not
+    user_updates = [UpdateOne({"_id": user["_id"]},
+                              {"$set": {"events": [user_event(event) if "guests" in event else event
+                                                   for event in user["events"]]}})
+                    for user in db["users"].find({"events.guests": {"$exists": True}}, {"events": 1})]
+    write_in_batches(db["users"], user_updates, batch_size)
+
+    return len(community_updates), len(user_updates)
+
+
+if __name__ == "__main__":
+    communities_count, users_count = move_community_content(DataBase().db)
+    print(f"Updated {communities_count} communities and {users_count} users")
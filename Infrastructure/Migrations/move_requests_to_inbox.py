@@ -0,0 +1,155 @@
+"""
+One-time migration that moves the pending requests stored in users, communities and events into the inbox
+collection (see Infrastructure/inbox.py), and removes them from those documents.
+
+Moved requests:
+- users.requests: friend requests (both sides of a request become one inbox request), event invitations and
+  community join requests.
+- users.communityRequest: community invitations. The sender's copy names the receiver; a receiver whose sender's
+  copy was overwritten by a later invitation keeps the invitation without a sender.
+- communities.join_request: the last join request of each community, with its request id.
+- events.requests_to_join: requests to join an event, addressed to its initiator.
+
+Every moved request gets a request id derived from its sender, recipient and subject, and is upserted by it, so the
+migration can be run again after a partial run without duplicating requests.
+
+Usage (from the repository root):
+    python Infrastructure/Migrations/move_requests_to_inbox.py
+"""
+import os
+import sys
+import uuid
+
+# Make the repository root and the Infrastructure directory importable, like app.py expects
+infrastructure_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, infrastructure_path)
+sys.path.insert(0, os.path.dirname(infrastructure_path))
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from database import DataBase
+from inbox import Inbox
+from indexes import REQUIRED_INDEXES, IndexManager
+
+PENDING_FRIEND_STATUSES = {"pending": "sent", "wait for response": "received"}
+
+
+def legacy_requests(db):
+    """
+    Collects the pending requests stored in users, communities and events.
+
+    Returns:
+    - dict: key -> (kind, sender_id, recipient_id, payload, request_id, created_at). Keys identify a request
+      independently of the document it was read from, so both copies of a friend request give one entry.
+    """
+    found = {}
+    initiators = {event["event_id"]: event.get("initiator")
+                  for event in db["events"].find({}, {"event_id": 1, "initiator": 1}) if "event_id" in event}
+
+    for user in db["users"].find({"$or": [{"requests.0": {"$exists": True}}, {"communityRequest": {"$exists": True}}]},
+                                 {"id": 1, "name": 1, "requests": 1, "communityRequest": 1}):
+        user_id = user.get("id")
+        for entry in user.get("requests") or []:
+            if "event_request" in entry:
+                payload = {field: value for field, value in entry.items() if field != "status"}
+                found[(Inbox.EVENT_INVITE, user_id, entry.get("event_id"))] = (
+                    Inbox.EVENT_INVITE, initiators.get(entry.get("event_id")), user_id, payload, None, None)
+            elif "community_name_request" in entry:
+                area = entry["community_name_request"]
+                found.setdefault((Inbox.COMMUNITY_JOIN, user_id, area),
+                                 (Inbox.COMMUNITY_JOIN, user_id, area, {"area": area}, None, None))
+            elif "id" in entry and entry.get("status") in PENDING_FRIEND_STATUSES:
+                # Requests to join an event ({"event_id", "date", "status"}) are moved from the event instead
+                if PENDING_FRIEND_STATUSES[entry["status"]] == "sent":
+                    sender_id, recipient_id = user_id, entry["id"]
+                    names = {"sender_name": user.get("name"), "receiver_name": entry.get("name")}
+                else:
+                    sender_id, recipient_id = entry["id"], user_id
+                    names = {"sender_name": entry.get("name"), "receiver_name": user.get("name")}
+                found.setdefault((Inbox.FRIEND, sender_id, recipient_id),
+                                 (Inbox.FRIEND, sender_id, recipient_id, names, None, None))
+
+        community_request = user.get("communityRequest")
+        if isinstance(community_request, dict) and community_request.get("community request"):
+            area = community_request["community request"]
+            status = str(community_request.get("status", ""))
+            if status.startswith("pending from "):
+                receiver_id = status[len("pending from "):]
+                found[(Inbox.COMMUNITY_INVITE, receiver_id, area)] = (
+                    Inbox.COMMUNITY_INVITE, user_id, receiver_id, {"area": area}, None, None)
+            else:
+                found.setdefault((Inbox.COMMUNITY_INVITE, user_id, area),
+                                 (Inbox.COMMUNITY_INVITE, None, user_id, {"area": area}, None, None))
+
+    for community in db["communities"].find({"join_request": {"$exists": True}}, {"area": 1, "join_request": 1}):
+        join_request = community["join_request"]
+        area = community.get("area")
+        found[(Inbox.COMMUNITY_JOIN, join_request.get("sender_id"), area)] = (
+            Inbox.COMMUNITY_JOIN, join_request.get("sender_id"), area,
+            {"area": area, "sender_name": join_request.get("sender_name"), "content": join_request.get("content")},
+            join_request.get("request_id"), None)
+
+    for event in db["events"].find({"requests_to_join.0": {"$exists": True}},
+                                   {"event_id": 1, "initiator": 1, "community_name": 1, "requests_to_join": 1}):
+        for join_request in event["requests_to_join"]:
+            user_id = join_request.get("user_id")
+            found[(Inbox.EVENT_JOIN, user_id, event["event_id"])] = (
+                Inbox.EVENT_JOIN, user_id, event.get("initiator"),
+                {"event_id": event["event_id"], "community_name": event.get("community_name")},
+                None, join_request.get("date"))
+
+    return found
+
+
+def move_requests_to_inbox(db, batch_size=500):
+    """
+    Moves the pending requests into the inbox collection and removes them from users, communities and events.
+
+    Parameters:
+    - db (Database): The UrbanHive database.
+    - batch_size (int): How many requests to upsert per bulk write.
+
+    Returns:
+    - int: The number of requests added to the inbox (requests moved by an earlier run are not counted).
+    """
+    inbox = Inbox(db["inbox"])
+    IndexManager(db, {"inbox": REQUIRED_INDEXES["inbox"]}).ensure_indexes()
+
+    moved = 0
+    operations = []
+    for key, (kind, sender_id, recipient_id, payload, request_id, created_at) in legacy_requests(db).items():
+        document = inbox.new_request(kind, sender_id, recipient_id, payload)
+        document["request_id"] = request_id or str(uuid.uuid5(uuid.NAMESPACE_URL, f"urbanhive-inbox:{key!r}"))
+        if created_at is not None:
+            document["created_at"] = created_at
+
+        operations.append(UpdateOne({"request_id": document["request_id"]}, {"$setOnInsert": document},
+                                    upsert=True))
+        if len(operations) >= batch_size:
+            moved += inbox.collection.bulk_write(operations, ordered=False).upserted_count
+            operations = []
+
+    if operations:
+        moved += inbox.collection.bulk_write(operations, ordered=False).upserted_count
+
+    # Only remove the old copies once every request is in the inbox
+    db["users"].update_many({"$or": [{"requests": {"$exists": True}}, {"communityRequest": {"$exists": True}}]},
+                            {"$unset": {"requests": "", "communityRequest": ""}})
+    db["communities"].update_many({"join_request": {"$exists": True}}, {"$unset": {"join_request": ""}})
+    db["communities"].update_many({"events.requests_to_join": {"$exists": True}},
+                                  {"$unset": {"events.$[].requests_to_join": ""}})
+    db["events"].update_many({"requests_to_join": {"$exists": True}}, {"$unset": {"requests_to_join": ""}})
+
+    # The index served the lookups of communities by their join request
+    try:
+        db["communities"].drop_index("join_request.request_id_1")
+    except OperationFailure:
+        pass
+
+    return moved
+
+
+if __name__ == "__main__":
+    moved_count = move_requests_to_inbox(DataBase().db)
+    print(f"Moved {moved_count} requests to the inbox")
@@ -0,0 +1,84 @@
+"""
+One-time migration that converts the start and end times of events stored as strings to BSON dates.
+
+add_event stores start_time and end_time as dates (see Infrastructure/dates.py), and the RSVPs copy them (see
+Infrastructure/attendance.py), so "my events" can be sorted chronologically on the (user_id, start_time) index.
+Older events and their RSVPs kept the strings the client sent; until they are converted they sort after every dated
+event, and among themselves by the text of the string. Strings that are not ISO 8601 dates are left as they are and
+counted.
+
+Only documents whose times are still strings are read, so the migration can be run again after a partial run.
+
+Usage (from the repository root):
+    python Infrastructure/Migrations/normalize_event_times.py
+"""
+import os
+import sys
+
+# Make the repository root and the Infrastructure directory importable, like app.py expects
+infrastructure_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, infrastructure_path)
+sys.path.insert(0, os.path.dirname(infrastructure_path))
+
+from pymongo import UpdateOne
+
+from database import DataBase
+from dates import parse_date
+
+# Collections holding the times of events
+COLLECTIONS = ("events", "rsvps")
+TIME_FIELDS = ("start_time", "end_time")
+
+
+def normalize_field(collection, field, batch_size):
+    """
+    Converts the string values of one field of a collection to BSON dates.
+
+    Returns:
+    - tuple: (values converted, values that could not be parsed).
+    """
+    converted = 0
+    invalid = 0
+    operations = []
+    for document in collection.find({field: {"$type": "string"}}, {field: 1}):
+        try:
+            value = parse_date(document[field])
+        except ValueError:
+            invalid += 1
+            continue
+
+        # The condition on the old value keeps a document edited since it was read from being overwritten
+        operations.append(UpdateOne({"_id": document["_id"], field: document[field]}, {"$set": {field: value}}))
+        if len(operations) >= batch_size:
+            converted += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+
+    if operations:
+        converted += collection.bulk_write(operations, ordered=False).modified_count
+    return converted, invalid
+
+
+def normalize_event_times(db, batch_size=500):
+    """
+    Converts the string start and end times of events and RSVPs to BSON dates.
+
+    Parameters:
+    - db (Database): The UrbanHive database.
+    - batch_size (int): How many documents to update per bulk write.
+
+    Returns:
+    - tuple: (times converted, times that could not be parsed).
+    """
+    converted = 0
+    invalid = 0
+    for collection_name in COLLECTIONS:
+        for field in TIME_FIELDS:
+            field_converted, field_invalid = normalize_field(db[collection_name], field, batch_size)
+            converted += field_converted
+            invalid += field_invalid
+    return converted, invalid
+
+
+if __name__ == "__main__":
+    converted_count, invalid_count = normalize_event_times(DataBase().db)
+    print(f"Converted {converted_count} event times, {invalid_count} could not be parsed")
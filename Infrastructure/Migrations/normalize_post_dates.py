@@ -0,0 +1,62 @@
+"""
+One-time migration that converts the post dates stored as strings to BSON dates.
+
+add_post stores post_date as a date (see Infrastructure/dates.py), which the community feed sorts and filters on.
+Older posts kept the string the client sent; until they are converted they sort after every dated post and are
+never returned by ?since. Strings that are not ISO 8601 dates are left as they are and counted.
+
+Only posts whose post_date is still a string are read, so the migration can be run again after a partial run.
+
+Usage (from the repository root):
+    python Infrastructure/Migrations/normalize_post_dates.py
+"""
+import os
+import sys
+
+# Make the repository root and the Infrastructure directory importable, like app.py expects
+infrastructure_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, infrastructure_path)
+sys.path.insert(0, os.path.dirname(infrastructure_path))
+
+from pymongo import UpdateOne
+
+from database import DataBase
+from dates import parse_date
+
+
+def normalize_post_dates(db, batch_size=500):
+    """
+    Converts the string post dates of the posting collection to BSON dates.
+
+    Parameters:
+    - db (Database): The UrbanHive database.
+    - batch_size (int): How many posts to update per bulk write.
+
+    Returns:
+    - tuple: (posts converted, posts whose date could not be parsed).
+    """
+    converted = 0
+    invalid = 0
+    operations = []
+    for post in db["posting"].find({"post_date": {"$type": "string"}}, {"post_date": 1}):
+        try:
+            post_date = parse_date(post["post_date"])
+        except ValueError:
+            invalid += 1
+            continue
+
+        # The condition on the old value keeps a post edited since it was read from being overwritten
+        operations.append(UpdateOne({"_id": post["_id"], "post_date": post["post_date"]},
+                                    {"$set": {"post_date": post_date}}))
+        if len(operations) >= batch_size:
+            converted += db["posting"].bulk_write(operations, ordered=False).modified_count
+            operations = []
+
+    if operations:
+        converted += db["posting"].bulk_write(operations, ordered=False).modified_count
+    return converted, invalid
+
+
+if __name__ == "__main__":
+    converted_count, invalid_count = normalize_post_dates(DataBase().db)
+    print(f"Converted {converted_count} post dates, {invalid_count} could not be parsed")
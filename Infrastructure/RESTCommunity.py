@@ -1,21 +1,38 @@
 import json
+import math
 import os
+import threading
 import uuid
 
 from flask import Blueprint, jsonify, request
 
 from Infrastructure.Files import config
 from database import DataBase
+from cached_collection import CachedCollection
+from inbox import Inbox, responds_to
+from attendance import Attendance
+import community_summary
+from pagination import KeysetPagination
+from streaming import stream_json_array, wants_stream
+from projection import FieldProjection
 from pymongo.errors import DuplicateKeyError
 from pymongo import errors
+from Logic.GeoPoint import GeoPoint
 from Logic.RadiusCalculator import RadiusCalculator
+from Logic.RadiusSearchCache import RadiusSearchCache
+from Logic.SpatialIndex import SpatialIndex
+from Logic.SphericalKDTree import SphericalKDTree
 from Logic.app_logger import setup_logger
 
 # Initialize database connection
 dbase = DataBase()
 db = dbase.db
-communities = db['communities']
-users = db['users']  # Assuming users collection is also accessible
+communities = CachedCollection(db['communities'], 'area')
+users = CachedCollection(db['users'], 'id')  # Assuming users collection is also accessible
+posting = db['posting']
+events = db['events']
+inbox = Inbox(db['inbox'])
+attendance = Attendance(db['rsvps'], events)
 
 # Ensure the log file directory exists
 log_file_path = os.path.join(config.application_file_path, "logs/communities/communities.log")
@@ -30,6 +47,131 @@ except Exception as e:
 # Create a Flask Blueprint for t the community routes
 community_bp = Blueprint('community', __name__)
 
+# In-process grid index of community centers keyed by the community _id, used by the radius search.
+# Neighborhood radii are small, so candidates are filtered with the bounding-box/equirectangular fast tier.
+community_index = SpatialIndex(distance_mode="fast")
+# KD-tree over the same community centers, used by the k-nearest search
+community_tree = SphericalKDTree()
+community_index_lock = threading.Lock()
+# Number of community documents the indexes were built from; None until they are first loaded
+community_index_state = {"source_count": None}
+
+# Radius search results keyed by snapped center and radius bucket. Entries are invalidated by the writes in
+# this module that add communities or change their members; other changes show up once the TTL expires.
+radius_search_cache = RadiusSearchCache(max_entries=config.radius_search_cache_max_entries,
+                                        ttl_seconds=config.radius_search_cache_ttl_seconds)
+
+pagination = KeysetPagination()
+
+
+def community_coordinates(community):
+    """
+    Returns the (latitude, longitude) of a community document, preferring its GeoJSON 'geo' field.
+    Returns None when the community has no valid location.
+    """
+    try:
+        geo = community.get("geo") or GeoPoint.from_location(community["location"])
+        longitude, latitude = geo["coordinates"]
+    except (KeyError, TypeError, ValueError):
+        return None
+    return latitude, longitude
+
+
+def refresh_community_index():
+    """
+    Loads the spatial index and the KD-tree from MongoDB on first use. They are reloaded whenever the number
+    of communities differs from the number they were built from, which picks up communities added by other
+    worker processes. Communities added by this process are inserted incrementally by add_community.
+    """
+    count = communities.estimated_document_count()
+    if count == community_index_state["source_count"]:
+        return
+
+    with community_index_lock:
+        points = []
+        for community in communities.find({}, {"geo": 1, "location": 1}):
+            coordinates = community_coordinates(community)
+            if coordinates:
+                points.append((community["_id"], *coordinates))
+
+        community_index.clear()
+        for point in points:
+            community_index.insert(*point)
+        community_tree.build(points)
+        community_index_state["source_count"] = count
+        community_logger.info(f"Community spatial indexes loaded with {len(points)} communities")
+
+
+def communities_within_radius_from_index(latitude, longitude, radius):
+    """
+    Finds the communities within the radius using the in-process spatial index, then reads the matching
+    documents in a single query.
+    """
+    refresh_community_index()
+    distances = dict(community_index.query_radius((latitude, longitude), radius))
+    if not distances:
+        return []
+
+    local_communities = list(communities.find({"_id": {"$in": list(distances)}}))
+    for community in local_communities:
+        community['distance'] = distances[community['_id']]
+    local_communities.sort(key=lambda community: community['distance'])
+    return local_communities
+
+
+def communities_within_radius_from_mongo(latitude, longitude, radius):
+    """
+    Finds the communities within the radius with a $geoNear query on the 2dsphere index.
+    """
+    center = {"type": "Point", "coordinates": [longitude, latitude]}
+    # $geoNear walks the 2dsphere index outward from the center, so only communities inside the
+    # radius are read and they come back already sorted by distance (converted to kilometers)
+    pipeline = [
+        {"$geoNear": {
+            "near": center,
+            "key": "geo",
+            "distanceField": "distance",
+            "maxDistance": radius * 1000,
+            "distanceMultiplier": 0.001,
+            "spherical": True
+        }}
+    ]
+    return list(communities.aggregate(pipeline))
+
+
+def find_communities_within_radius(latitude, longitude, radius):
+    """
+    Finds the communities within the radius with the configured backend, sorted by distance.
+    """
+    if config.community_spatial_index_enabled:
+        return communities_within_radius_from_index(latitude, longitude, radius)
+    return communities_within_radius_from_mongo(latitude, longitude, radius)
+
+
+def cached_communities_within_radius(latitude, longitude, radius):
+    """
+    Serves a radius search from the radius search cache. On a miss, every community covered by the cache key
+    is fetched and stored. The cached communities are then filtered for the exact center and radius and
+    returned as copies carrying their 'distance', sorted by distance.
+    """
+    key = radius_search_cache.key_for(latitude, longitude, radius)
+    cached = radius_search_cache.get(key)
+    if cached is None:
+        generation = radius_search_cache.generation
+        cover_lat, cover_lon, cover_radius = radius_search_cache.coverage(key)
+        cached = find_communities_within_radius(cover_lat, cover_lon, cover_radius)
+        radius_search_cache.put(key, cached, generation)
+
+    if not cached:
+        return []
+
+    latitudes, longitudes = zip(*(community_coordinates(community) for community in cached))
+    distances, mask = RadiusCalculator().within_radius((latitude, longitude), radius, latitudes, longitudes,
+                                                       mode="fast")
+    local_communities = [dict(cached[i], distance=float(distances[i])) for i in mask.nonzero()[0]]
+    local_communities.sort(key=lambda community: community['distance'])
+    return local_communities
+
 
 @community_bp.route('/communities/add_community', methods=['POST'])
 def add_community():
@@ -58,6 +200,13 @@ def add_community():
         community_logger.error("error: Manager not found, status code = 404")
         return jsonify({"error": "Manager not found"}), 404
 
+    # GeoJSON copy of the location, used by the 2dsphere index for radius searches
+    try:
+        geo = GeoPoint.from_location(location)
+    except (KeyError, TypeError, ValueError) as e:
+        community_logger.error(f"error: Invalid location, details is {str(e)}, status code = 400")
+        return jsonify({"error": "Invalid location", "details": str(e)}), 400
+
     community_id = str(uuid.uuid4())
 
     # Prepare community object
@@ -65,15 +214,24 @@ def add_community():
         "community_id": community_id,
         "area": area,
         "location": location,
+        "geo": geo,
         "rules": [],
         "communityMembers": [manager],  # Add manager to community members
         "communityManagers": [manager],  # Add manager as the community manager
-        "events": []
+        **community_summary.empty_summary()
     }
 
     try:
         users.update_one({"id": manager_id}, {"$push": {"communities": area}})
         result = communities.insert_one(community)
+
+        # Keep the spatial indexes in sync without reloading them
+        community_index.insert(result.inserted_id, geo["coordinates"][1], geo["coordinates"][0])
+        community_tree.insert(result.inserted_id, geo["coordinates"][1], geo["coordinates"][0])
+        radius_search_cache.invalidate_location(geo["coordinates"][1], geo["coordinates"][0])
+        with community_index_lock:
+            if community_index_state["source_count"] is not None:
+                community_index_state["source_count"] += 1
         community_logger.info(f"Community added id = {str(result.inserted_id)} status code = 201")
         return jsonify({"message": "Community added", "id": str(result.inserted_id)}), 201
     except DuplicateKeyError:
@@ -87,32 +245,18 @@ def add_community():
 @community_bp.route('/communities/add_user_to_community', methods=['POST'])
 def add_user_to_community():
     """
-    Endpoint to send a community join request to another user. Updates community request status
-    for both the sender and receiver.
+    Endpoint to send a community join request to another user. The invitation is stored in the receiver's inbox.
     """
     data = request.json
     receiver_id = data.get('receiver_id')
     sender_id = data.get('sender_id')
     area = data.get('community area')
 
-    # Prepare the updates for receiver and sender
-    receiver_update = {
-        "community request": area,
-        "status": "waiting for your response"
-    }
-    sender_update = {
-        "community request": area,
-        "status": f"pending from {receiver_id}"
-    }
-
     try:
-        # Update receiver's community request
-        users.update_one({"id": receiver_id}, {"$set": {"communityRequest": receiver_update}})
-
-        # Update sender's community request
-        users.update_one({"id": sender_id}, {"$set": {"communityRequest": sender_update}})
-        community_logger.info("Community request updated for both users, status code = 200")
-        return jsonify({"message": "Community request updated for both users"}), 200
+        invitation = inbox.send(Inbox.COMMUNITY_INVITE, sender_id, receiver_id, {"area": area})
+        community_logger.info("Community request sent, status code = 200")
+        return jsonify({"message": "Community request updated for both users",
+                        "request_id": invitation["request_id"]}), 200
     except errors.PyMongoError as e:
         community_logger.error(f"Database error, details is {str(e)}, status code is 500")
         return jsonify({"error": "Database error", "details": str(e)}), 500
@@ -122,7 +266,8 @@ def add_user_to_community():
 def respond_to_community_request():
     """
     Endpoint for a user to respond to a community join request. Handles both acceptance
-    and rejection of the request.
+    and rejection of the request. The request is the one with the given request_id or, without it, the pending
+    invitation from sender_id to receiver_id for the area.
     """
     data = request.json
     receiver_id = data.get('receiver_id')
@@ -130,60 +275,92 @@ def respond_to_community_request():
     response = data.get('response')
     area = data.get('area')
 
-    if response == 1:
-        # Confirming the community request
-        try:
-            # Retrieve receiver's name and location
-            receiver_user = users.find_one({"id": receiver_id}, {"name": 1, "location": 1})
-            if not receiver_user:
-                community_logger.error(f"Database error, Receiver user not found, status code is 404")
-                return jsonify({"error": "Receiver user not found"}), 404
-
-            receiver_name = receiver_user.get('name')
-            receiver_location = receiver_user.get('location')
-            receiver_email = receiver_user.get('email')
-            receiver_phone_number = receiver_user.get('phoneNumber')
-
-            # Add receiver to community's members list with id, name, and location
-            community_member_info = {"id": receiver_id, "name": receiver_name, "location": receiver_location,
-                                     "email": receiver_email, "phone_number": receiver_phone_number}
-            communities.update_one({"area": area}, {"$push": {"communityMembers": community_member_info}})
-
-            # Add location to communities collection for the receiver
-            if receiver_location:  # Ensure the location exists
-                communities.update_one({"area": area}, {"$addToSet": {"locations": receiver_location}})
-
-            # Update both users' communities list
-            users.update_one({"id": receiver_id}, {"$push": {"communities": area}})
-
-            # Remove community request for both users
-            users.update_one({"id": receiver_id}, {"$unset": {"communityRequest": ""}})
-            users.update_one({"id": sender_id}, {"$unset": {"communityRequest": ""}})
-            community_logger.info(
-                f"Community request confirmed, users updated, and location added to community, status code is 200")
-            return jsonify(
-                {"message": "Community request confirmed, users updated, and location added to community"}), 200
-        except errors.PyMongoError as e:
-            community_logger.error(f"Database error, details is {str(e)}, status code is 500")
-            return jsonify({"error": "Database error", "details": str(e)}), 500
-    elif response == 0:
-        # Declining the community request
-        try:
-            # Remove community request for both users
-            users.update_one({"id": receiver_id}, {"$unset": {"communityRequest": ""}})
-            users.update_one({"id": sender_id}, {"$unset": {"communityRequest": ""}})
-            community_logger.info(f"Community request declined and removed, status code is 200")
-            return jsonify({"message": "Community request declined and removed"}), 200
-        except errors.PyMongoError as e:
-            community_logger.error(f"Database error, details is {str(e)}, status code is 500")
-            return jsonify({"error": "Database error", "details": str(e)}), 500
+    if response not in (0, 1):
+        return jsonify({"error": "Invalid response"}), 400
+
+    if data.get('request_id'):
+        invitation_filter = {"request_id": data['request_id']}
+    else:
+        invitation_filter = {"kind": Inbox.COMMUNITY_INVITE, "recipient_id": receiver_id, "sender_id": sender_id,
+                             "payload.area": area}
+    return answer_community_invitation(invitation_filter, response == 1)
+
+
+@responds_to(Inbox.COMMUNITY_INVITE)
+def answer_community_invitation(invitation_filter, accept):
+    """
+    Answers the pending community invitation matching the filter. Accepting adds the receiver to the community's
+    members and the community to the receiver's communities, in the same transaction as the answer.
+    """
+
+    def apply_answer(session):
+        if not accept:
+            return inbox.answer(invitation_filter, accept, session=session)
+
+        # The receiver is checked before the invitation is answered, so a failed check leaves it pending
+        invitation = inbox.find_request(invitation_filter, session=session)
+        if invitation is None:
+            return None
+
+        receiver_id = invitation['recipient_id']
+        area = invitation['payload']['area']
+
+        # Retrieve receiver's name, location and contact details
+        receiver_user = users.find_one({"id": receiver_id}, {"name": 1, "location": 1, "email": 1, "phoneNumber": 1},
+                                       session=session)
+        if not receiver_user:
+            raise LookupError("Receiver user not found")
+
+        # None if the invitation was answered since it was read
+        if inbox.answer({"request_id": invitation['request_id']}, accept, session=session) is None:
+            return None
+
+        receiver_location = receiver_user.get('location')
+
+        # Add receiver to community's members list with id, name, and location
+        community_member_info = {"id": receiver_id, "name": receiver_user.get('name'), "location": receiver_location,
+                                 "email": receiver_user.get('email'),
+                                 "phone_number": receiver_user.get('phoneNumber')}
+        community_update = {"$push": {"communityMembers": community_member_info}}
+
+        # Add location to communities collection for the receiver
+        if receiver_location:  # Ensure the location exists
+            community_update["$addToSet"] = {"locations": receiver_location}
+
+        communities.update_one({"area": area}, community_update, session=session)
+        users.update_one({"id": receiver_id}, {"$push": {"communities": area}}, session=session)
+        return invitation
+
+    try:
+        invitation = DataBase.run_transaction(apply_answer)
+    except LookupError as e:
+        community_logger.error(f"Database error, {str(e)}, status code is 404")
+        return jsonify({"error": str(e)}), 404
+    except errors.PyMongoError as e:
+        community_logger.error(f"Database error, details is {str(e)}, status code is 500")
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+
+    if invitation is None:
+        community_logger.error("Community request not found, status code is 404")
+        return jsonify({"error": "Community request not found"}), 404
+
+    if not accept:
+        community_logger.info(f"Community request declined and removed, status code is 200")
+        return jsonify({"message": "Community request declined and removed"}), 200
+
+    radius_search_cache.invalidate_community(invitation['payload']['area'])
+    community_logger.info(
+        f"Community request confirmed, users updated, and location added to community, status code is 200")
+    return jsonify(
+        {"message": "Community request confirmed, users updated, and location added to community"}), 200
 
 
 @community_bp.route('/communities/delete_user_from_community', methods=['POST'])
 def delete_user_from_community():
     """
     Endpoint to remove a user from a community. Updates both the community members list and
-    the user's list of communities.
+    the user's list of communities, and removes the user's RSVPs to the community's events, whose freed
+    seats go to their waitlists.
     """
     data = request.json
     user_to_delete_id = data.get('user_to_delete_id')
@@ -192,10 +369,15 @@ def delete_user_from_community():
     try:
         # Adjusted to match only the 'id' field inside the 'communityMembers' objects
         communities.update_one({"area": area}, {"$pull": {"communityMembers": {"id": user_to_delete_id}}})
+        radius_search_cache.invalidate_community(area)
 
         # Remove community from user's list of communities
         users.update_one({"id": user_to_delete_id}, {"$pull": {"communities": area}})
-        community_logger.info(f"User removed from community successfully, status code is 200")
+
+        # Give up the user's seats at the community's events
+        promoted = DataBase.run_transaction(
+            lambda session: attendance.leave_community(area, user_to_delete_id, session=session))
+        community_logger.info(f"User removed from community successfully, promoted = {promoted}, status code is 200")
         return jsonify({"message": "User removed from community successfully"}), 200
     except errors.PyMongoError as e:
         community_logger.error(f"Database error, details is {str(e)}, status code is 500")
@@ -205,55 +387,93 @@ def delete_user_from_community():
 @community_bp.route('/communities/get_communities_by_radius_and_location', methods=['POST'])
 def get_communities_by_radius_and_location():
     """
-    Retrieves communities within a specified radius from a given location. Utilizes a
-    RadiusCalculator for determining the distance.
+    Retrieves communities within a specified radius (in kilometers) from a given location,
+    sorted by distance. Each returned community carries its 'distance' from the location in kilometers.
     """
     data = request.json
-    rd = RadiusCalculator()
-    radius = data["radius"]
-    location = data["location"]
 
-    center_location = [float(location["latitude"]), float(location["longitude"])]
+    try:
+        radius = float(data["radius"])
+        # NaN and infinity pass float() but cannot be bucketed by the cache nor used as a $geoNear distance
+        if not (math.isfinite(radius) and radius >= 0):
+            raise ValueError(f"radius must be a finite, non-negative number of kilometers, got {data['radius']!r}")
+        center = GeoPoint.from_location(data["location"])
+    except (KeyError, TypeError, ValueError) as e:
+        community_logger.error(f"error: Invalid radius or location, details is {str(e)}, status code is 400")
+        return jsonify({"error": "Invalid radius or location", "details": str(e)}), 400
 
     try:
-        count = communities.count_documents({})  # getting how many communities in the dn
-        copy_communities = []
-        for i in range(0, count):  # copy the data in to iterable list
-            com = communities.find_one_and_delete({})
-            copy_communities.insert(0, com)
-
-        locations = []
-        index = 0
-        for community in copy_communities:  # extract the locations
-            locations.insert(index, community["location"])
-            communities.insert_one(copy_communities[index])
-
-        for location in locations:  # cast the locations
-            location["latitude"] = float(location["latitude"])
-            location["longitude"] = float(location["longitude"])
-
-        # calculate the communities in the area
-        local_communities = rd.locations_within_radius(center_location, int(radius), locations)
-
-        communities_to_return = []
-        for community in local_communities:
-            community_to_add = communities.find_one({"location": community})
-            if community_to_add:
-                community_to_add['_id'] = str(community_to_add['_id'])  # Convert ObjectId to string
-                communities_to_return.append(community_to_add)
-
-        community_logger.info(f"local_communities : {communities_to_return}, status code is 200")
-        return jsonify({"local_communities": communities_to_return}), 200
+        longitude, latitude = center["coordinates"]
+        if config.radius_search_cache_enabled:
+            local_communities = cached_communities_within_radius(latitude, longitude, radius)
+        else:
+            local_communities = find_communities_within_radius(latitude, longitude, radius)
+
+        community_logger.info(f"local_communities : {local_communities}, status code is 200")
+        return jsonify({"local_communities": local_communities}), 200
     except Exception as e:
         community_logger.error(f"Database error, details is {str(e)}, status code is 500")
         return jsonify({"error": "Database error", "details": str(e)}), 500
 
 
+@community_bp.route('/communities/get_nearest_communities', methods=['POST'])
+def get_nearest_communities():
+    """
+    Retrieves the k communities closest to a given location, sorted by distance, without needing a radius.
+    Each returned community carries its 'distance' from the location in kilometers.
+    """
+    data = request.json
+
+    try:
+        k = int(data.get("k", 10))
+        center = GeoPoint.from_location(data["location"])
+    except (KeyError, TypeError, ValueError) as e:
+        community_logger.error(f"error: Invalid k or location, details is {str(e)}, status code is 400")
+        return jsonify({"error": "Invalid k or location", "details": str(e)}), 400
+
+    if k < 1:
+        community_logger.error(f"error: k must be a positive number, status code is 400")
+        return jsonify({"error": "k must be a positive number"}), 400
+
+    try:
+        refresh_community_index()
+        longitude, latitude = center["coordinates"]
+        distances = dict(community_tree.nearest((latitude, longitude), k))
+
+        nearest_communities = list(communities.find({"_id": {"$in": list(distances)}})) if distances else []
+        for community in nearest_communities:
+            community['distance'] = distances[community['_id']]
+        nearest_communities.sort(key=lambda community: community['distance'])
+
+        community_logger.info(f"nearest_communities : {nearest_communities}, status code is 200")
+        return jsonify({"nearest_communities": nearest_communities}), 200
+    except Exception as e:
+        community_logger.error(f"Database error, details is {str(e)}, status code is 500")
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+
+
+@community_bp.route('/communities/search_stats', methods=['GET'])
+def get_community_search_stats():
+    """
+    Reports how the community radius search performs: the spatial index size, how many cells and candidate
+    communities were scanned and how many were hits, and the search cache hit ratio and eviction counters.
+    """
+    stats = {
+        "spatial_index_enabled": config.community_spatial_index_enabled,
+        "spatial_index": community_index.stats(),
+        "search_cache_enabled": config.radius_search_cache_enabled,
+        "search_cache": radius_search_cache.stats()
+    }
+    community_logger.info(f"search stats = {stats}, status code is 200")
+    return jsonify(stats), 200
+
+
 @community_bp.route('/communities/details_by_area', methods=['POST'])
 def get_community_details_by_area_name():
     """
     Provides detailed information for a community based on its area name. Ensures the area
-    name is provided and the community exists.
+    name is provided and the community exists. ?fields=area,communityMembers or ?exclude=posts,events limit the
+    returned fields. 'posts' and 'events' list the latest posts and events of the community, newest first.
     """
 
     # Extract area name from query parameter
@@ -263,13 +483,36 @@ def get_community_details_by_area_name():
         community_logger.error(f"error, Area name is required, status code is 400")
         return jsonify({"error": f"Area name is required, area is {area}"}), 400
 
+    try:
+        # Excluding MongoDB's _id from the response
+        projection = FieldProjection.hide(FieldProjection.parse(request.args), '_id')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The community only keeps the ids of its latest posts and events; read them along with the requested fields
+    expanded = [kind for kind in community_summary.SUMMARY_FIELDS if FieldProjection.includes(projection, kind)]
+    read_projection = dict(projection)
+    for kind in expanded:
+        ids_field = community_summary.SUMMARY_FIELDS[kind][1]
+        if 1 in projection.values():
+            read_projection[ids_field] = 1
+        else:
+            read_projection.pop(ids_field, None)
+
     # Find the community by its area name
-    community = communities.find_one({"area": area}, {"_id": 0})  # Excluding MongoDB's _id from the response
+    community = communities.find_one({"area": area}, read_projection)
 
     if not community:
         community_logger.error(f"error, ACommunity not found status code is 404")
         return jsonify({"error": f"Community not found {area} "}), 404
 
+    collections = {"posts": posting, "events": events}
+    for kind in expanded:
+        community[kind] = community_summary.recent_items(community, kind, collections[kind])
+        ids_field = community_summary.SUMMARY_FIELDS[kind][1]
+        if not FieldProjection.includes(projection, ids_field):
+            community.pop(ids_field, None)
+
     # Return the found community details
     community_logger.info(f"community ={community} , status code is 200")
     return jsonify(community), 200
@@ -278,23 +521,33 @@ def get_community_details_by_area_name():
 @community_bp.route('/communities/get_all', methods=['GET'])
 def get_communities():
     """
-    Retrieves all communities from the database and returns them in a list.
+    Retrieves one page of communities from the database and returns them in a list.
+    Query parameters 'limit' and 'next' select the page; 'next' in the response is the token of the following page
+    (null on the last one). With ?stream=1 every community is streamed instead, for exports.
+    ?fields=area,communityMembers.id or ?exclude=posts,events limit the returned fields.
     """
 
     try:
-        # Retrieve all community documents from the database
-        all_communities = communities.find({})
+        projection = FieldProjection.parse(request.args)
+        if wants_stream(request.args):
+            return stream_json_array(communities.find({}, projection),
+                                     prefix='{"communities": ',
+                                     suffix=', "next": null}',
+                                     logger=community_logger)
+        limit, after = pagination.parse(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Convert each MongoDB document into a Python dictionary
-        communities_list = []
-        for community in all_communities:
-            # Optionally, convert the _id field from ObjectId to string if you want to include it
-            community['_id'] = str(community['_id'])
-            communities_list.append(community)
+    try:
+        # Retrieve one page of community documents from the database
+        communities_list, next_token = pagination.page(communities, limit, after, projection=projection)
 
         # Return the list of communities as JSON
-        community_logger.info(f"community list = {communities_list}")
-        return jsonify({"communities": communities_list}), 200
+        community_logger.info(f"community list = {len(communities_list)} communities")
+        response = jsonify({"communities": communities_list, "next": next_token})
+        if next_token:
+            response.headers['X-Next-Page'] = next_token
+        return response, 200
     except errors.PyMongoError as e:
         community_logger.error(f"Database error: details: {str(e)} , status code is 500")
         return jsonify({"error": "Database error", "details": str(e)}), 500
@@ -319,28 +572,10 @@ def request_to_join_community():
         community_logger.error(f" error: Community does not exist , status code is 404")
         return jsonify({"error": "Community does not exist"}), 404
 
-    # Generate a unique request ID
-    request_id = str(uuid.uuid4())
-
-    # Create the join request object for the user's requests array
-    user_join_request = {
-        "community_name_request": area,
-        "status": "pending"
-    }
-
-    # Append the join request to the user's requests array
-    users.update_one({"id": sender_id}, {"$push": {"requests": user_join_request}})
-
-    # Create the request object for the community manager
-    join_request = {
-        "request_id": request_id,
-        "sender_id": sender_id,
-        "sender_name": sender_name,
-        "content": "can i join the community?"
-    }
-
-    # Update the community document with the join request
-    communities.update_one({"area": area}, {"$set": {"join_request": join_request}})
+    # Send the join request to the community's inbox, addressed to its area
+    join_request = inbox.send(Inbox.COMMUNITY_JOIN, sender_id, area,
+                              {"area": area, "sender_name": sender_name, "content": "can i join the community?"})
+    request_id = join_request["request_id"]
 
     community_logger.info(f" Join request sent successfully, request id is {request_id} , status code is 200")
     return jsonify({"message": "Join request sent successfully", "request_id": request_id}), 200
@@ -352,40 +587,59 @@ def respond_to_community_join_request():
     request_id = data.get('request_id')
     response = data.get('response')  # Should be 0 (decline) or 1 (accept)
 
-    # Validate request_id by checking if any community has this join request
-    community = communities.find_one({"join_request.request_id": request_id})
-    if not community:
-        community_logger.error("Invalid request ID, status code is 404")
-        return jsonify({"error": "Invalid request ID"}), 404
+    if response not in (0, 1):
+        return jsonify({"error": "Invalid response"}), 400
+
+    return answer_join_request({"request_id": request_id}, response == 1)
+
 
-    # Get the area name from the community found
-    community_area = community['area']
-    # Get sender_id from the join_request in the community document
-    sender_id = community['join_request']['sender_id']
+@responds_to(Inbox.COMMUNITY_JOIN)
+def answer_join_request(join_request_filter, accept):
+    """
+    Answers the pending join request matching the filter. Accepting adds the sender to the community's members and
+    the community to the sender's communities, in the same transaction as the answer so membership is recorded on
+    both sides or neither.
+    """
+
+    def apply_answer(session):
+        if not accept:
+            return inbox.answer(join_request_filter, accept, session=session)
+
+        # The sender is checked before the request is answered, so a failed check leaves it pending
+        join_request = inbox.find_request(join_request_filter, session=session)
+        if join_request is None:
+            return None
 
-    # Retrieve the sender's user document
-    sender_user = users.find_one({"id": sender_id})
-    if not sender_user:
-        community_logger.error("errpr: Sender user not found, status code is 404")
-        return jsonify({"error": "Sender user not found"}), 404
+        community_area = join_request['recipient_id']
+        sender_id = join_request['sender_id']
+
+        # Retrieve the sender's user document
+        sender_user = users.find_one({"id": sender_id}, {"name": 1, "phoneNumber": 1, "location": 1}, session=session)
+        if not sender_user:
+            raise LookupError("Sender user not found")
+
+        # None if the request was answered since it was read
+        if inbox.answer({"request_id": join_request['request_id']}, accept, session=session) is None:
+            return None
 
-    # If response is 1, add the user to the community members and user's communities array
-    if response == 1:
         sender_details = {"id": sender_id, "name": sender_user['name'], 'phoneNumber': sender_user['phoneNumber'],
                           'location': sender_user['location']}
-        # Add the user to the community members
-        communities.update_one({"join_request.request_id": request_id}, {"$push": {"communityMembers": sender_details}})
-        # Add the community area name to the user's communities array
-        users.update_one({"id": sender_id}, {"$push": {"communities": community_area}})
-
-    # Remove the join request from the community document
-    communities.update_one({"join_request.request_id": request_id}, {"$unset": {"join_request": ""}})
-
-    # Remove the request from the user's requests array
-    user_join_request = {
-        "community_name_request": community_area,
-        "status": "pending"
-    }
-    users.update_one({"id": sender_id}, {"$pull": {"requests": user_join_request}})
+        communities.update_one({"area": community_area}, {"$push": {"communityMembers": sender_details}},
+                               session=session)
+        users.update_one({"id": sender_id}, {"$push": {"communities": community_area}}, session=session)
+        return join_request
+
+    try:
+        join_request = DataBase.run_transaction(apply_answer)
+    except LookupError as e:
+        community_logger.error(f"error: {str(e)}, status code is 404")
+        return jsonify({"error": str(e)}), 404
+
+    if join_request is None:
+        community_logger.error("Invalid request ID, status code is 404")
+        return jsonify({"error": "Invalid request ID"}), 404
+
+    if accept:
+        radius_search_cache.invalidate_community(join_request['recipient_id'])
     community_logger.info(f" JResponse processed successfully , status code is 200")
     return jsonify({"message": "Response processed successfully"}), 200
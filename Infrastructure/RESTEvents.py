@@ -1,20 +1,30 @@
 import os
-from datetime import datetime
 
 from flask import Blueprint, jsonify, request, abort
 
 from Infrastructure.Files import config
 from database import DataBase
-from pymongo.errors import DuplicateKeyError
+from cached_collection import CachedCollection
+from pagination import KeysetPagination
+from streaming import stream_json_array, wants_stream
+from projection import FieldProjection
+from inbox import Inbox, responds_to
+from attendance import Attendance
+from dates import parse_date
+from invitations import InvitationFanOut, unique_guests
+import community_summary
+from pymongo.errors import PyMongoError
 from Logic.app_logger import setup_logger
 import uuid
 
 # Initialize database connection
 dbase = DataBase()
 db = dbase.db
-communities = db['communities']
-users = db['users']
-events = db['events']
+communities = CachedCollection(db['communities'], 'area')
+users = CachedCollection(db['users'], 'id')
+events = CachedCollection(db['events'], 'event_id', cache=None)
+inbox = Inbox(db['inbox'])
+attendance = Attendance(db['rsvps'], events)
 
 # Ensure the log file directory exists
 log_file_path = os.path.join(config.application_file_path, "logs/events/events.log")
@@ -29,12 +39,16 @@ except Exception as e:
 # Create a Flask Blueprint for the event routes
 events_bp = Blueprint('events', __name__)
 
+pagination = KeysetPagination()
+fan_out = InvitationFanOut(inbox)
+
 
 @events_bp.route('/events/add_event', methods=['POST'])
 def add_event():
     """
     Creates an event based on provided data, updates related community and user documents,
-    and sends out invitations.
+    and sends out invitations. The optional 'capacity' limits the number of attendees, the initiator included;
+    users who answer once the event is full are waitlisted.
     """
 
     data = request.json
@@ -48,6 +62,19 @@ def add_event():
     start_time = data['start_time']
     end_time = data['end_time']
     guest_list = data['guest_list']
+    capacity = data.get('capacity')  # None for no limit
+
+    if capacity is not None and (not isinstance(capacity, int) or isinstance(capacity, bool) or capacity < 1):
+        events_logger.error(f"Invalid capacity: {capacity}, status code = 400")
+        return jsonify({'error': f'Invalid capacity: {capacity}'}), 400
+
+    # Stored as dates so that "my events" sorts them chronologically (see dates.py)
+    try:
+        start_time = parse_date(start_time)
+        end_time = parse_date(end_time)
+    except ValueError as e:
+        events_logger.error(f"{e}, status code = 400")
+        return jsonify({'error': str(e)}), 400
 
     event_id = str(uuid.uuid4())
 
@@ -62,29 +89,12 @@ def add_event():
         'start_time': start_time,
         'end_time': end_time,
         'guests': guest_list,
-        'attending': []
+        # The initiator attends their event; attendees are stored in the 'rsvps' collection (see attendance.py)
+        'capacity': capacity,
+        'attendee_count': 1,
+        'waitlist_count': 0
     }
 
-    # Add event reference to the community document
-    try:
-        communities.update_one(
-            {'area': community_name},
-            {'$push': {'events': event_doc}}
-        )
-        users.update_one(
-            {'id': event_initiator_id},
-            {'$push': {'events': event_doc}}
-        )
-    except Exception as e:
-        abort(400, str(e))
-
-    # Insert the event into the events database
-    event_id = None
-    try:
-        event_id = events.insert_one(event_doc).inserted_id
-    except DuplicateKeyError as e:
-        abort(400, str(e))
-
     # Create the invitation format
     invitation = {
         'event_request': event_name,
@@ -93,40 +103,121 @@ def add_event():
         'location': event_location,
         'event_type': event_type,
         'start_time': start_time,
-        'end_time': end_time,
-        'status': 'waiting for your response'
+        'end_time': end_time
     }
 
-    # Send invitations to each guest by their ID
-    for guest_id in guest_list:
-        try:
-            users.update_one(
-                {'id': guest_id},  # Query by 'id' field
-                {'$push': {'requests': invitation}}
-            )
-        except Exception as e:
-            abort(400, str(e))
-    events_logger.info(f"Event created and invitations sent!, event id = {str(event_id)}")
-    return jsonify({'message': 'Event created and invitations sent!', 'event_id': str(event_id)}), 201
+    # Insert the event, count it in the community summary, record the initiator's RSVP, and send the invitations to
+    # the inbox of each guest, in one transaction: four round trips however long the guest list is. Very long guest
+    # lists are left to a background worker once the event exists.
+    guests = unique_guests(guest_list)
+    deferred = fan_out.should_defer(guests)
+
+    def create_event(session):
+        events.insert_one(event_doc, session=session)
+        communities.update_one({'area': community_name}, community_summary.added_update('events', event_id),
+                               session=session)
+        # A new event has no RSVP yet, and its attendee_count already counts the initiator
+        attendance.rsvps.insert_one(attendance.new_rsvp(event_doc, event_initiator_id), session=session)
+        if not deferred:
+            fan_out.send(invitation, event_initiator_id, guests, session=session)
+
+    try:
+        DataBase.run_transaction(create_event)
+    except PyMongoError as e:
+        abort(400, str(e))
+    if deferred:
+        fan_out.defer(invitation, event_initiator_id, guests)
+    events_logger.info(f"Event created and invitations sent!, event id = {str(event_id)}, "
+                       f"invitations = {len(guests)}{' (deferred)' if deferred else ''}")
+    return jsonify({'message': 'Event created and invitations sent!', 'event_id': str(event_id),
+                    'invitations': len(guests), 'invitations_deferred': deferred}), 201
 
 
 @events_bp.route('/events/get_all_events', methods=['GET'])
 def get_all_events():
     """
-    Retrieves all events and returns them in a JSON-serializable format.
+    Retrieves one page of events and returns them in a JSON-serializable format.
+    Query parameters 'limit' and 'next' select the page. The body stays a plain list, so the token of the
+    following page is sent in the 'X-Next-Page' header (absent on the last page).
+    With ?stream=1 every event is streamed instead, for exports.
+    ?fields=event_id,event_name or ?exclude=guest_list limit the returned fields.
     """
 
-    all_events = events.find({})  # Retrieve all documents from the events collection
-    # Convert the events to a list of dicts, excluding the '_id' field to make them JSON serializable
-    events_list = [{key: value for key, value in event.items() if key != '_id'} for event in all_events]
-    events_logger.info(f"Events list : {events_list}")
-    return jsonify(events_list), 200
+    try:
+        # Excluding the '_id' field to make the events JSON serializable
+        projection = FieldProjection.hide(FieldProjection.parse(request.args), '_id')
+        if wants_stream(request.args):
+            return stream_json_array(events.find({}, projection), logger=events_logger)
+        limit, after = pagination.parse(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Retrieve one page of the events collection
+    events_list, next_token = pagination.page(events, limit, after, projection=projection)
+    events_logger.info(f"Events list : {len(events_list)} events")
+    response = jsonify(events_list)
+    if next_token:
+        response.headers['X-Next-Page'] = next_token
+    return response, 200
+
+
+@events_bp.route('/events/attendees/<event_id>', methods=['GET'])
+def get_event_attendees(event_id):
+    """
+    Retrieves one page of the users attending an event, in the order they answered, or with ?status=waitlisted of
+    its waitlist, in the order seats will be given.
+    Query parameters 'limit' and 'next' select the page; 'next' in the response is the token of the following page
+    (null on the last one). The event's attendee_count and waitlist_count give the totals.
+    """
+
+    status = request.args.get('status', Attendance.ATTENDING)
+    if status not in Attendance.STATUSES:
+        return jsonify({"error": f"Invalid status: {status}"}), 400
+
+    try:
+        limit, after = pagination.parse(request.args)
+        attendees, next_token = pagination.page(attendance.rsvps, limit, after,
+                                                query={"event_id": event_id, "status": status},
+                                                projection={"_id": 0, "user_id": 1, "responded_at": 1},
+                                                sort=Attendance.ATTENDEES_SORT)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    events_logger.info(f"Attendees of {event_id}: {len(attendees)} users")
+    response = jsonify({"attendees": attendees, "next": next_token})
+    if next_token:
+        response.headers['X-Next-Page'] = next_token
+    return response, 200
+
+
+@events_bp.route('/events/user_events/<user_id>', methods=['GET'])
+def get_user_events(user_id):
+    """
+    Retrieves one page of the events a user attends or is waitlisted for ('status' of each event), soonest first.
+    Query parameters 'limit' and 'next' select the page; 'next' in the response is the token of the following page
+    (null on the last one).
+    """
+
+    try:
+        limit, after = pagination.parse(request.args)
+        user_events, next_token = pagination.page(attendance.rsvps, limit, after, query={"user_id": user_id},
+                                                  projection={"_id": 0, "user_id": 0},
+                                                  sort=Attendance.USER_EVENTS_SORT)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    events_logger.info(f"Events of {user_id}: {len(user_events)} events")
+    response = jsonify({"events": user_events, "next": next_token})
+    if next_token:
+        response.headers['X-Next-Page'] = next_token
+    return response, 200
 
 
 @events_bp.route('/events/respond_to_event_request', methods=['POST'])
 def respond_to_event_request():
     """
-    Handles a user's response to an event invitation.
+    Handles a user's response to an event invitation. The invitation is the one with the given request_id or,
+    without it, the user's pending invitation to the named event of the community.
     """
 
     # Parse the incoming JSON data
@@ -138,80 +229,91 @@ def respond_to_event_request():
     event_name = data.get('event_name')
     response = data.get('response')  # This could be a boolean where True means accept, False means decline
 
-    # Fetch the user from the users collection
-    user = users.find_one({"id": user_id})
-    if not user:
-        events_logger.error("error : user not found, status code = 404")
-        return jsonify({"error": "User not found"}), 404
+    if data.get('request_id'):
+        invitation_filter = {"request_id": data['request_id']}
+    else:
+        invitation_filter = {"kind": Inbox.EVENT_INVITE, "recipient_id": user_id,
+                             "payload.community_name": community_name, "payload.event_request": event_name}
+    return answer_event_invitation(invitation_filter, bool(response))
+
+
+@responds_to(Inbox.EVENT_INVITE)
+def answer_event_invitation(invitation_filter, accept):
+    """
+    Answers the pending event invitation matching the filter. Accepting gives the user a seat at the event, or a
+    place on its waitlist when it is full, in the same transaction as the answer. Declining an invitation already
+    accepted gives the seat up, and it goes to the first waitlisted user.
+    """
+
+    def apply_answer(session):
+        if not accept:
+            invitation = inbox.answer(invitation_filter, accept, session=session)
+            if invitation is not None:
+                return invitation
+
+        # The event is checked before the invitation is answered or withdrawn, so a failed check leaves it as it was
+        invitation = inbox.find_request(invitation_filter, Inbox.PENDING if accept else Inbox.ACCEPTED,
+                                        session=session)
+        if invitation is None:
+            return None
+        event = events.find_one({"event_id": invitation['payload']['event_id']}, session=session)
+        if not event:
+            raise LookupError("Event not found")
+
+        # Both return None if the invitation was answered since it was read
+        request_filter = {"request_id": invitation['request_id']}
+        if not accept:
+            if inbox.withdraw(request_filter, session=session) is None:
+                return None
+            invitation['promoted'] = attendance.remove(event, invitation['recipient_id'], session=session)[1]
+            return invitation
+
+        if inbox.answer(request_filter, accept, session=session) is None:
+            return None
+        invitation['attendance'] = attendance.add(event, invitation['recipient_id'], session=session)
+        return invitation
 
-    # Find the request object that the user is responding to
-    event_request = next((req for req in user['requests'] if
-                          req['event_request'] == event_name and req['community_name'] == community_name), None)
-    if not event_request:
+    try:
+        invitation = DataBase.run_transaction(apply_answer)
+    except LookupError as e:
+        events_logger.error(f"error : {e}, status code = 404")
+        return jsonify({"error": str(e)}), 404
+    if invitation is None:
         events_logger.error("error : Event request not found, status code = 404")
         return jsonify({"error": "Event request not found"}), 404
 
-    # Remove the event request from the user's document
-    users.update_one(
-        {"id": user_id},
-        {"$pull": {"requests": event_request}}
-    )
-
-    # If the user accepts the invitation
-    if response:
-        # Add the user to the attending list of the event in both 'events' and 'communities' collections
-        events.update_one(
-            {"community_name": community_name, "event_name": event_name},
-            {"$push": {"attending": user_id}}
-        )
-        communities.update_one(
-            {"area": community_name, "events.event_name": event_name},
-            {"$push": {"events.$.attending": user_id}}
-        )
-
-        # Add the event data to the user's events array
-        users.update_one(
-            {"id": user_id},
-            {"$push": {"events": event_request}}
-        )
-    events_logger.info("Event response recorded and request removed, status code = 200")
-    return jsonify({"message": "Event response recorded and request removed"}), 200
+    events_logger.info(f"Event response recorded and request removed, attendance = {invitation.get('attendance')}, "
+                       f"promoted = {invitation.get('promoted', [])}, status code = 200")
+    return jsonify({"message": "Event response recorded and request removed",
+                    "attendance": invitation.get('attendance'), "promoted": invitation.get('promoted', [])}), 200
 
 
 @events_bp.route('/events/delete_event', methods=['POST'])
 def delete_event():
     """
-    Deletes an event and removes all related references in user and community documents.
+    Deletes an event and removes all related references: its RSVPs, requests and place in the community summary.
     """
 
     data = request.json
     event_id_to_delete = data['event_id']
 
-    # Check if the event exists in the 'events' collection
-    if not events.find_one({'event_id': event_id_to_delete}):
+    # Delete the event from the 'events' collection, checking that it exists
+    event = events.find_one_and_delete({'event_id': event_id_to_delete}, {'community_name': 1})
+    if not event:
         events_logger.error("Error: Event not found, status code = 404")
         return jsonify({'error': 'Event not found'}), 404
 
-    # Delete the event from the 'events' collection
-    events.delete_one({'event_id': event_id_to_delete})
-
-    # Remove the event from the 'communities' documents
-    communities.update_many(
-        {},
-        {'$pull': {'events': {'event_id': event_id_to_delete}}}
+    # Remove the event from the summary of its community
+    communities.update_one(
+        {'area': event.get('community_name')},
+        community_summary.removed_update('events', event_id_to_delete)
     )
 
-    # Remove the event from the 'users' documents
-    users.update_many(
-        {},
-        {'$pull': {'events': {'event_id': event_id_to_delete}}}
-    )
+    # Remove the attendance of the event
+    attendance.delete_event(event_id_to_delete)
 
-    # Remove any requests associated with this event from users' documents
-    users.update_many(
-        {},
-        {'$pull': {'requests': {'event_id': event_id_to_delete}}}
-    )
+    # Remove the invitations to the event and the requests to join it
+    inbox.collection.delete_many({'payload.event_id': event_id_to_delete})
     events_logger.info("Event deleted successfully!, status code = 200")
     return jsonify({'message': 'Event deleted successfully!'}), 200
 
@@ -219,7 +321,7 @@ def delete_event():
 @events_bp.route('/events/request_to_join_events', methods=['POST'])
 def request_to_join_events():
     """
-    Handles a user's request to join an event, including updating the event and user documents.
+    Handles a user's request to join an event by sending it to the inbox of the event's initiator.
     """
 
     # Parse the incoming JSON data
@@ -230,49 +332,24 @@ def request_to_join_events():
     community_name = data.get('community_name')
     event_id = data.get('event_id')
 
-    # Get the current date and time
-    current_date = datetime.utcnow()
-
     # Verify the user exists and is part of the community
-    user = db.users.find_one({"id": user_id, "communityRequest.community_name": community_name})
-    if not user:
+    user = users.find_one({"id": user_id})
+    if not user or community_name not in user.get('communities', []):
         events_logger.error("User not found or not part of the community, status code = 404")
         return jsonify({"error": "User not found or not part of the community"}), 404
 
     # Verify the event exists within the specified community in the events collection
-    event = db.events.find_one({"event_id": event_id, "community_name": community_name})
+    event = events.find_one({"event_id": event_id, "community_name": community_name})
     if not event:
         events_logger.error("Event not found in the specified community, status code = 404")
         return jsonify({"error": "Event not found in the specified community"}), 404
 
-    # Create the request object
-    request_to_join = {
-        "user_id": user_id,
-        "event_id": event_id,
-        "community_name": community_name,
-        "date": current_date,
-        "status": "pending"
-    }
-
-    # Add the request to join to the event's requests_to_join array
-    db.events.update_one(
-        {"event_id": event_id},
-        {"$push": {"requests_to_join": request_to_join}}
-    )
-
-    # Update the user's document with the request
-    db.users.update_one(
-        {"id": user_id},
-        {"$push": {"requests": {"event_id": event_id, "date": current_date, "status": "pending"}}}
-    )
-
-    # Update the community's document with the request
-    db.communities.update_one(
-        {"community_name": community_name, "events.event_id": event_id},
-        {"$push": {"events.$.requests_to_join": request_to_join}}
-    )
+    # Send the request to the inbox of the event's initiator
+    join_request = inbox.send(Inbox.EVENT_JOIN, user_id, event['initiator'],
+                              {"event_id": event_id, "community_name": community_name})
 
-    return jsonify({"message": "Request to join event has been submitted"}), 200
+    return jsonify({"message": "Request to join event has been submitted",
+                    "request_id": join_request['request_id']}), 200
 
 
 @events_bp.route('/events/confirm_or_decline_event_request', methods=['POST'])
@@ -291,58 +368,90 @@ def confirm_or_decline_event_request():
     community_name = data.get('community_name')
     response = data.get('response')  # 1 for confirm, 0 for decline
 
+    # Fetch the manager and the user in one query
+    found = users.find_many([manager_id, user_id])
+
     # Validate manager existence and authorization
-    manager = db.users.find_one({"id": manager_id})
+    manager = found.get(manager_id)
     if not manager:
         return jsonify({"error": "Manager not found or not authorized"}), 404
 
     # Validate event existence
-    event = db.events.find_one({"event_id": event_id, "community_name": community_name})
+    event = events.find_one({"event_id": event_id, "community_name": community_name})
     if not event:
         return jsonify({"error": "Event not found in the specified community"}), 404
 
     # Validate user existence
-    user = db.users.find_one({"id": user_id})
+    user = found.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
-    # Check if user has requested to join the event
-    request_to_join = next((request for requests in event['requests_to_join'] if requests['user_id'] == user_id), None)
-    if not request_to_join:
+
+    if response not in (0, 1):
+        return jsonify({"error": "Invalid response"}), 400
+
+    return answer_event_join_request({"kind": Inbox.EVENT_JOIN, "sender_id": user_id, "payload.event_id": event_id},
+                                     response == 1)
+
+
+@responds_to(Inbox.EVENT_JOIN)
+def answer_event_join_request(join_request_filter, accept):
+    """
+    Answers the pending request to join an event matching the filter. Confirming gives the user a seat at the
+    event, or a place on its waitlist when it is full, in the same transaction as the answer.
+    """
+
+    def apply_answer(session):
+        if not accept:
+            return inbox.answer(join_request_filter, accept, session=session)
+
+        # The event is checked before the request is answered, so a failed check leaves it pending
+        join_request = inbox.find_request(join_request_filter, session=session)
+        if join_request is None:
+            return None
+        event = events.find_one({"event_id": join_request['payload']['event_id']}, session=session)
+        if not event:
+            raise LookupError("Event not found")
+
+        # None if the request was answered since it was read
+        if inbox.answer({"request_id": join_request['request_id']}, accept, session=session) is None:
+            return None
+        join_request['attendance'] = attendance.add(event, join_request['sender_id'], session=session)
+        return join_request
+
+    # Check if user has requested to join the event while answering the request
+    try:
+        join_request = DataBase.run_transaction(apply_answer)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    if join_request is None:
         return jsonify({"error": "User has not requested to join the event"}), 400
 
-    # Update databases based on response (confirm or decline)
-    if response == 1:  # Confirm
-        # Add user to the event's attendees list
-        db.events.update_one(
-            {"event_id": event_id},
-            {"$push": {"attendees": user_id}}
-        )
-        # Remove request from event's requests_to_join list
-        db.events.update_one(
-            {"event_id": event_id},
-            {"$pull": {"requests_to_join": {"user_id": user_id}}}
-        )
-        # Update user's status for the event to attending
-        db.users.update_one(
-            {"id": user_id},
-            {"$push": {"attending_events": event_id}, "$pull": {"requests": {"event_id": event_id}}}
-        )
-        return jsonify({"message": "Event request has been confirmed successfully"}), 200
-    elif response == 0:  # Decline
-        # Remove request from event's requests_to_join list
-        db.events.update_one(
-            {"event_id": event_id},
-            {"$pull": {"requests_to_join": {"user_id": user_id}}}
-        )
-        # Remove request from user's requests list
-        db.users.update_one(
-            {"id": user_id},
-            {"$pull": {"requests": {"event_id": event_id}}}
-        )
-        return jsonify({"message": "Event request has been declined successfully"}), 200
+    if accept:
+        return jsonify({"message": "Event request has been confirmed successfully",
+                        "attendance": join_request.get('attendance')}), 200
+    return jsonify({"message": "Event request has been declined successfully"}), 200
 
 
+@events_bp.route('/events/cancel_attendance', methods=['POST'])
+def cancel_attendance():
+    """
+    Removes a user from the attendees or the waitlist of an event, e.g. when the initiator removes them. A freed
+    seat goes to the first waitlisted user.
+    """
 
+    data = request.get_json()
+    event_id = data.get('event_id')
+    user_id = data.get('user_id')
 
+    event = events.find_one({"event_id": event_id}, {"event_id": 1, "capacity": 1})
+    if not event:
+        events_logger.error("Error: Event not found, status code = 404")
+        return jsonify({"error": "Event not found"}), 404
 
+    removed, promoted = DataBase.run_transaction(lambda session: attendance.remove(event, user_id, session=session))
+    if removed is None:
+        events_logger.error("User does not attend the event, status code = 404")
+        return jsonify({"error": "User does not attend the event"}), 404
 
+    events_logger.info(f"User {user_id} removed from event {event_id} ({removed}), promoted = {promoted}")
+    return jsonify({"message": "Attendance cancelled", "promoted": promoted}), 200
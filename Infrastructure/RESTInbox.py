@@ -0,0 +1,81 @@
+import os
+
+from flask import Blueprint, jsonify, request
+from database import DataBase
+from inbox import Inbox, responders
+from pagination import KeysetPagination
+from Logic.app_logger import setup_logger
+from Infrastructure.Files import config
+
+# Initialize database connection
+dbase = DataBase()
+db = dbase.db
+inbox = Inbox(db['inbox'])
+
+# Ensure the log file directory exists
+log_file_path = os.path.join(config.application_file_path, "logs/inbox/inbox.log")
+os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+
+# Initialize the logger
+try:
+    inbox_logger = setup_logger('night_watch_logger', log_file_path)
+except Exception as e:
+    print(f"Error setting up logger: {e}")
+
+# Create a Flask Blueprint for the inbox routes
+inbox_bp = Blueprint('inbox', __name__)
+
+pagination = KeysetPagination()
+
+
+@inbox_bp.route('/inbox/<owner_id>', methods=['GET'])
+def get_inbox(owner_id):
+    """
+    Retrieves one page of the requests of a user, newest first, or of a community when owner_id is its area.
+    Query parameters:
+    - status: pending (default), accepted or declined.
+    - kind: friend, community_invite, community_join, event_invite or event_join. Every kind when omitted.
+    - box: received (default) for the requests sent to the owner, sent for the ones the owner sent.
+    - limit and next select the page; 'next' in the response is the token of the following page (null on the last).
+    """
+
+    try:
+        query = Inbox.listing_query(owner_id, box=request.args.get('box', 'received'),
+                                    status=request.args.get('status', Inbox.PENDING),
+                                    kind=request.args.get('kind'))
+        limit, after = pagination.parse(request.args)
+        requests_list, next_token = pagination.page(inbox.collection, limit, after, query=query,
+                                                    projection={"_id": 0}, sort=Inbox.SORT)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    inbox_logger.info(f"Inbox of {owner_id}: {len(requests_list)} requests, status code is 200")
+    response = jsonify({"requests": requests_list, "next": next_token})
+    if next_token:
+        response.headers['X-Next-Page'] = next_token
+    return response, 200
+
+
+@inbox_bp.route('/inbox/respond', methods=['POST'])
+def respond_to_inbox_request():
+    """
+    Accepts (response 1) or declines (response 0) any pending request by its request_id. The answer is applied by
+    the blueprint owning the kind of the request, like the kind-specific respond endpoints do.
+    """
+
+    data = request.get_json()
+    request_id = data.get('request_id')
+    response = data.get('response')
+
+    if response not in (0, 1):
+        return jsonify({"error": "Invalid response"}), 400
+
+    inbox_request = inbox.collection.find_one({"request_id": request_id}, {"kind": 1, "status": 1})
+    if not inbox_request:
+        inbox_logger.error(f"Request {request_id} not found, status code is 404")
+        return jsonify({"error": "Request not found"}), 404
+    if inbox_request['status'] != Inbox.PENDING:
+        inbox_logger.error(f"Request {request_id} was already answered, status code is 409")
+        return jsonify({"error": f"Request was already {inbox_request['status']}"}), 409
+
+    return responders[inbox_request['kind']]({"request_id": request_id}, response == 1)
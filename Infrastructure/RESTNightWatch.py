@@ -5,6 +5,7 @@ from datetime import datetime
 
 from Infrastructure.Files import config
 from database import DataBase
+from cached_collection import CachedCollection
 from pymongo.errors import DuplicateKeyError
 from Logic.NightWatchPositionsCalculator import NightWatchPositionsCalculator
 from Logic.app_logger import setup_logger
@@ -13,11 +14,11 @@ import uuid
 # Initialize database connection
 dbase = DataBase()
 db = dbase.db
-communities = db['communities']
-users = db['users']
-events = db['events']
-posting = db['posting']
-night_watch = db['night_watch']
+communities = CachedCollection(db['communities'], 'area')
+users = CachedCollection(db['users'], 'id')
+events = CachedCollection(db['events'], 'event_id', cache=None)
+posting = CachedCollection(db['posting'], 'post_id', cache=None)
+night_watch = CachedCollection(db['night_watch'], 'watch_id', cache=None)
 
 # Ensure the log file directory exists
 log_file_path = os.path.join(config.application_file_path, "logs/nightwatch/night_watch.log")
@@ -32,6 +33,49 @@ except Exception as e:
 # Create a Flask Blueprint for the posting routes
 night_watch_bp = Blueprint('night_watch', __name__)
 
+urgent_message = "The number of volunteers in the watch is less than the number of positions assigned to the watch"
+
+# How many times a join/leave is retried when another membership change wins the race
+membership_update_attempts = 5
+
+
+def membership_version_filter(version):
+    """
+    Returns the query value matching a watch at the given membership version. Watches created before
+    membership versions were introduced have no version, which counts as version 0.
+    """
+    return version if version else {"$in": [0, None]}
+
+
+def staffing_status_update(update, members_count, positions_amount):
+    """
+    Adds the urgent message to an update document when the watch has fewer members than positions,
+    and removes it otherwise, so the message is written in the same update as the membership.
+    """
+    if members_count < positions_amount:
+        update.setdefault("$set", {})["urgent_message"] = urgent_message
+    else:
+        update.setdefault("$unset", {})["urgent_message"] = ""
+    return update
+
+
+def watch_layout_is_current(watch, objective=None):
+    """
+    Returns True if the stored position_inlays were computed or patched for the current membership version
+    (and, when given, with the same assignment objective).
+    """
+    if objective is not None and watch.get("layout_objective", "total") != objective:
+        return False
+    return "position_inlays" in watch and watch.get("layout_version") == watch.get("membership_version", 0)
+
+
+def watch_positions(watch, community):
+    """
+    Returns the circle of positions of a watch, one per position slot, around the community's location.
+    """
+    position_calculator = NightWatchPositionsCalculator(community['location'])
+    return position_calculator.generate_circle_positions(float(watch["watch_radius"]), int(watch['positions_amount']))
+
 
 @night_watch_bp.route('/night_watch/add_night_watch', methods=['POST'])
 def add_new_night_watch():
@@ -93,7 +137,8 @@ def add_new_night_watch():
             "latitude": lat,
             "longitude": long
         },
-        "watch_members": []
+        "watch_members": [],
+        "membership_version": 0
     }
     # Prepare the night_watch entry for the community document
     community_night_watch_entry = {
@@ -125,6 +170,8 @@ def add_new_night_watch():
 def join_night_watch():
     """
     Allows a candidate to join an existing night watch, ensuring there are available positions.
+    If the watch already has a position layout, the candidate is placed in a free slot in the same atomic
+    update that adds them, so the layout stays current without being recalculated.
     """
 
     # Parse the JSON data from the request
@@ -144,23 +191,59 @@ def join_night_watch():
         night_watch_logger.error(f"Candidate not found, status code is 404")
         return jsonify({"error": "Candidate not found"}), 404
 
-    # Find the night watch entry
-    watch = night_watch.find_one({"watch_id": night_watch_id})
-    if not watch:
-        night_watch_logger.error(f"Night watch not found, status code is 404")
-        return jsonify({"error": "Night watch not found"}), 404
-
-    # Check if there is space available in the watch
-    if len(watch['watch_members']) >= int(watch['positions_amount']):
-        night_watch_logger.error(f"No positions available in this night watch, status code is 409")
-        return jsonify({"error": "No positions available in this night watch"}), 409
+    # The member's location lets the position assignment minimize how far they travel
+    member = {"id": candidate_id, "name": candidate['name']}
+    if candidate.get('location'):
+        member['location'] = candidate['location']
+    community = None
 
-    # Add candidate to the night watch
     try:
-        night_watch.update_one(
-            {"watch_id": night_watch_id},
-            {"$push": {"watch_members": {"id": candidate_id, "name": candidate['name']}}}
-        )
+        for attempt in range(membership_update_attempts):
+            # Find the night watch entry
+            watch = night_watch.find_one({"watch_id": night_watch_id})
+            if not watch:
+                night_watch_logger.error(f"Night watch not found, status code is 404")
+                return jsonify({"error": "Night watch not found"}), 404
+
+            members = watch['watch_members']
+            positions_amount = int(watch['positions_amount'])
+
+            if any(watch_member['id'] == candidate_id for watch_member in members):
+                night_watch_logger.error(f"Candidate already joined this night watch, status code is 409")
+                return jsonify({"error": "Candidate already joined this night watch"}), 409
+
+            # Check if there is space available in the watch
+            if len(members) >= positions_amount:
+                night_watch_logger.error(f"No positions available in this night watch, status code is 409")
+                return jsonify({"error": "No positions available in this night watch"}), 409
+
+            version = watch.get('membership_version', 0)
+            update = {"$push": {"watch_members": member}, "$inc": {"membership_version": 1}}
+
+            if watch_layout_is_current(watch):
+                # Patch the layout: the new member takes the free slot nearest to them, the other slots are
+                # untouched
+                if community is None:
+                    community = communities.find_one({"area": watch['community_area']}, {"location": 1})
+                positions = watch_positions(watch, community)
+                taken_slots = {inlay.get('slot') for inlay in watch['position_inlays']}
+                free_slots = [slot for slot in range(positions_amount) if slot not in taken_slots]
+                slot = NightWatchPositionsCalculator(community['location']).nearest_free_slot(positions, free_slots,
+                                                                                             member)
+                inlay = {"id": candidate_id, "name": candidate['name'], "position": positions[slot], "slot": slot}
+                update["$push"]["position_inlays"] = inlay
+                update["$set"] = {"layout_version": version + 1}
+
+            staffing_status_update(update, len(members) + 1, positions_amount)
+
+            # The version in the filter makes the update fail if the membership changed since it was read
+            result = night_watch.update_one(
+                {"watch_id": night_watch_id, "membership_version": membership_version_filter(version)}, update)
+            if result.modified_count:
+                break
+        else:
+            night_watch_logger.error(f"Night watch membership kept changing, status code is 409")
+            return jsonify({"error": "Night watch membership changed, please try again"}), 409
 
         # Add night watch info to the candidate's night_watches list
         watch_entry_for_user = {
@@ -180,6 +263,60 @@ def join_night_watch():
         return jsonify({"error": "Database error", "details": str(e)}), 500
 
 
+@night_watch_bp.route('/night_watch/leave_watch', methods=['POST'])
+def leave_night_watch():
+    """
+    Removes a member from a night watch. Only the member's slot is freed; the positions of the other
+    members are kept, in the same atomic update that removes the member.
+    """
+
+    data = request.get_json()
+
+    member_id = data.get('member_id')
+    night_watch_id = data.get('night_watch_id')
+
+    if not all([member_id, night_watch_id]):
+        night_watch_logger.error(f"Missing required fields, status code is 400")
+        return jsonify({"error": "Missing required fields"}), 400
+
+    try:
+        for attempt in range(membership_update_attempts):
+            watch = night_watch.find_one({"watch_id": night_watch_id})
+            if not watch:
+                night_watch_logger.error(f"Night watch not found, status code is 404")
+                return jsonify({"error": "Night watch not found"}), 404
+
+            members = watch['watch_members']
+            if not any(watch_member['id'] == member_id for watch_member in members):
+                night_watch_logger.error(f"Member is not part of this night watch, status code is 404")
+                return jsonify({"error": "Member is not part of this night watch"}), 404
+
+            version = watch.get('membership_version', 0)
+            update = {"$pull": {"watch_members": {"id": member_id}}, "$inc": {"membership_version": 1}}
+
+            if watch_layout_is_current(watch):
+                update["$pull"]["position_inlays"] = {"id": member_id}
+                update["$set"] = {"layout_version": version + 1}
+
+            staffing_status_update(update, len(members) - 1, int(watch['positions_amount']))
+
+            result = night_watch.update_one(
+                {"watch_id": night_watch_id, "membership_version": membership_version_filter(version)}, update)
+            if result.modified_count:
+                break
+        else:
+            night_watch_logger.error(f"Night watch membership kept changing, status code is 409")
+            return jsonify({"error": "Night watch membership changed, please try again"}), 409
+
+        users.update_one({"id": member_id}, {"$pull": {"night_watches": {"watch_id": night_watch_id}}})
+        night_watch_logger.info(f"Member successfully left night watch, status code is 200")
+        return jsonify({"message": "Member successfully left night watch"}), 200
+
+    except Exception as e:
+        night_watch_logger.error(f"Database error: details : {str(e)}, status code is 500")
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+
+
 @night_watch_bp.route('/night_watch/close_night_watch', methods=['POST'])
 def close_night_watch():
     """
@@ -225,51 +362,54 @@ def close_night_watch():
 def calculate_position_for_watch():
     """
     Calculates positions for members of a night watch based on the specified radius and positions amount.
+    The watch has one position per slot, evenly spaced on a circle around the community, and members are
+    assigned to slots to minimize their total ('objective': 'total', the default) or longest ('max') travel
+    distance. If the membership hasn't changed since the layout was stored, the stored layout is returned
+    without recalculating it.
     """
 
     data = request.get_json()
     watch_id = data.get('watch_id')
+    objective = data.get('objective', 'total')
 
     if not watch_id:
         night_watch_logger.error("Missing watch_id field, status code is 400")
         return jsonify({"error": "Missing watch_id field"}), 400
 
+    if objective not in ('total', 'max'):
+        night_watch_logger.error("Invalid objective, status code is 400")
+        return jsonify({"error": "Invalid objective, expected 'total' or 'max'"}), 400
+
     # Find the night watch entry
     watch = night_watch.find_one({"watch_id": watch_id})
     if not watch:
         night_watch_logger.error("Night watch not found, status code is 404")
         return jsonify({"error": "Night watch not found"}), 404
 
+    if watch_layout_is_current(watch, objective):
+        inlays = watch['position_inlays']
+        night_watch_logger.info(f"Positions unchanged, inlays is {inlays}, status code is 200 ")
+        return jsonify({"message": "Positions calculated and members assigned", "inlays": inlays}), 200
+
     position_amount = int(watch['positions_amount'])
     members = watch['watch_members']
-    community_area = watch['community_area']
-    community = communities.find_one({"area": community_area})
-    location = community['location']
-    radius = float(watch["watch_radius"])
-
-    position_calculator = NightWatchPositionsCalculator(location)
+    version = watch.get('membership_version', 0)
+    community = communities.find_one({"area": watch['community_area']}, {"location": 1})
 
     # Generate positions
-    positions = position_calculator.generate_circle_positions(radius, len(members))
+    positions = watch_positions(watch, community)
 
     # Assign members to positions
-    inlays = position_calculator.assign_member_to_position(positions, members)
+    position_calculator = NightWatchPositionsCalculator(community['location'])
+    inlays = position_calculator.assign_member_to_position(positions, members, objective)
 
     try:
-        # Update the night_watch document with inlays
-        night_watch.update_one(
-            {"watch_id": watch_id},
-            {
-                "$set": {
-                    "position_inlays": inlays
-                }
-            }
-        )
-
-        if len(members) < position_amount:
-            urgent_message = ("The number of volunteers in the watch is less than the number of positions assigned to "
-                              "the watch")
-            night_watch.update_one({"watch_id": watch_id}, {"$set": {"urgent_message": urgent_message}})
+        # Store the layout and the staffing status in one update. If the membership changed meanwhile the
+        # filter doesn't match, and the next call recalculates for the new membership.
+        update = {"$set": {"position_inlays": inlays, "layout_version": version, "layout_objective": objective}}
+        staffing_status_update(update, len(members), position_amount)
+        night_watch.update_one({"watch_id": watch_id, "membership_version": membership_version_filter(version)},
+                               update)
 
         night_watch_logger.info(f"Positions calculated and members assigned, inlays is {inlays}, status code is 200 ")
         return jsonify({"message": "Positions calculated and members assigned", "inlays": inlays}), 200
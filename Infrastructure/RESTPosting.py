@@ -4,6 +4,11 @@ from flask import Blueprint, jsonify, request
 
 from Infrastructure.Files import config
 from database import DataBase
+from cached_collection import CachedCollection
+import community_summary
+from datetime import datetime
+from dates import parse_date
+from pagination import KeysetPagination
 from pymongo.errors import DuplicateKeyError
 from Logic.app_logger import setup_logger
 import uuid
@@ -11,10 +16,11 @@ import uuid
 # Initialize database connection
 dbase = DataBase()
 db = dbase.db
-communities = db['communities']
-users = db['users']
-events = db['events']
-posting = db['posting']
+communities = CachedCollection(db['communities'], 'area')
+users = CachedCollection(db['users'], 'id')
+events = CachedCollection(db['events'], 'event_id', cache=None)
+posting = CachedCollection(db['posting'], 'post_id', cache=None)
+comments = db['comments']
 
 # Ensure the log file directory exists
 log_file_path = os.path.join(config.application_file_path, "logs/posting/posting.log")
@@ -29,11 +35,17 @@ except Exception as e:
 # Create a Flask Blueprint for the posting routes
 posting_bp = Blueprint('posting', __name__)
 
+# Posts of a community are listed newest first; '_id' breaks ties between posts of the same date
+FEED_SORT = [("post_date", -1), ("_id", -1)]
+# Comments of a post are listed oldest first, in the order of the thread
+THREAD_SORT = [("created_at", 1), ("_id", 1)]
+pagination = KeysetPagination()
+
 
 @posting_bp.route('/posting/add_post', methods=['POST'])
 def add_post():
     """
-    Adds a new post to both the posting collection and the corresponding community document.
+    Adds a new post to the posting collection and records it in the summary of the corresponding community document.
     Validates user membership in the community before adding the post.
     """
 
@@ -44,15 +56,21 @@ def add_post():
     user_id = data.get('user_id')
     community_area = data.get('community_area')
     post_content = data.get('post_content')  # Assumes this is a dict with 'header' and 'body'
-    post_date = data.get('post_date')  # Assumes date is a string in ISO format or similar
+    post_date = data.get('post_date')  # An ISO 8601 date, stored as a BSON date
 
     if not all([user_id, community_area, post_content, post_date]):
         # If any of the required fields are missing, return an error
         posting_logger.error(f"Missing required fields, status code is 400")
         return jsonify({"error": "Missing required fields"}), 400
 
+    try:
+        post_date = parse_date(post_date)
+    except ValueError as e:
+        posting_logger.error(f"{e}, status code is 400")
+        return jsonify({"error": str(e)}), 400
+
     # Check if the user is a member of the community
-    community = communities.find_one({"area": community_area, "communityMembers.id": user_id})
+    community = communities.find_one({"area": community_area, "communityMembers.id": user_id}, {"_id": 1})
     if not community:
         # If the community does not exist or the user is not a member, return an error
         posting_logger.error(f"User is not a member of the community, status code is 404")
@@ -75,18 +93,20 @@ def add_post():
         "user_name": user['name'],
         "community_area": community_area,
         "post_content": post_content,
-        "post_date": post_date
+        "post_date": post_date,
+        # The comments are stored in the 'comments' collection; the post only counts them
+        "comment_count": 0
     }
 
-    # Add the post to the community document
-    communities.update_one(
-        {"area": community_area},
-        {"$push": {"posts": post}}
-    )
+    # Add the post to the 'posting' collection and count it in the community document, which only keeps the ids of
+    # its latest posts
+    def store_post(session):
+        posting.insert_one(post, session=session)
+        communities.update_one({"area": community_area}, community_summary.added_update("posts", post_id),
+                               session=session)
 
-    # Add the post to the 'posting' collection
     try:
-        posting.insert_one(post)
+        DataBase.run_transaction(store_post)
         posting_logger.info(f"Post added successfully, post id is {post_id}, status code is 201")
         return jsonify({"message": "Post added successfully", "post_id": post_id}), 201
     except DuplicateKeyError:
@@ -97,11 +117,39 @@ def add_post():
         return jsonify({"error": str(e)}), 500
 
 
+@posting_bp.route('/posting/feed/<community_area>', methods=['GET'])
+def get_community_feed(community_area):
+    """
+    Retrieves one page of the posts of a community, newest first. Each post has its comment_count; the comments
+    themselves are read with /posting/comments/<post_id>.
+    Query parameters:
+    - since: An ISO 8601 date; only posts dated after it are returned, to refresh a feed the client already has.
+    - limit and next select the page; 'next' in the response is the token of the following page (null on the last).
+    """
+
+    query = {"community_area": community_area}
+    try:
+        if request.args.get('since'):
+            query["post_date"] = {"$gt": parse_date(request.args['since'])}
+        limit, after = pagination.parse(request.args)
+        posts, next_token = pagination.page(posting, limit, after, query=query,
+                                            projection={"_id": 0, "comments": 0}, sort=FEED_SORT)
+    except ValueError as e:
+        posting_logger.error(f"{e}, status code is 400")
+        return jsonify({"error": str(e)}), 400
+
+    posting_logger.info(f"Feed of {community_area}: {len(posts)} posts, status code is 200")
+    response = jsonify({"posts": posts, "next": next_token})
+    if next_token:
+        response.headers['X-Next-Page'] = next_token
+    return response, 200
+
+
 @posting_bp.route('/posting/delete_post', methods=['DELETE'])
 def delete_post():
     """
-    Deletes a post from both the posting collection and the corresponding community document.
-    Verifies the existence of the post before deletion.
+    Deletes a post and its comments from the posting and comments collections, and the post from the summary of the
+    corresponding community document. Verifies the existence of the post before deletion.
     """
 
     # Parse the JSON data from the request
@@ -116,16 +164,18 @@ def delete_post():
         return jsonify({"error": "Missing required field: post_id"}), 400
 
     # Delete the post from the 'posting' collection
-    post_delete_result = posting.delete_one({"post_id": post_id})
-    if post_delete_result.deleted_count == 0:
+    deleted_post = posting.find_one_and_delete({"post_id": post_id}, {"community_area": 1})
+    if deleted_post is None:
         # If the post was not found in the posting collection, return an error
         posting_logger.error(f"Post not found or already deleted, status code is 404")
         return jsonify({"error": "Post not found or already deleted"}), 404
 
-    # Remove the post from the community document's posts array
+    comments.delete_many({"post_id": post_id})
+
+    # Remove the post from the community document's summary
     community_update_result = communities.update_one(
-        {"posts.post_id": post_id},
-        {"$pull": {"posts": {"post_id": post_id}}}
+        {"area": deleted_post.get("community_area")},
+        community_summary.removed_update("posts", post_id)
     )
 
     # Check if the post was successfully deleted from both collections
@@ -140,8 +190,9 @@ def delete_post():
 @posting_bp.route('/posting/add_comment_to_post', methods=['POST'])
 def add_comment_to_post():
     """
-    Adds a comment to a specific post in the posting collection and updates the community document.
-    Validates the existence of the post and the user before adding the comment.
+    Adds a comment to a specific post: the comment is stored in the comments collection and the comment count of
+    the post goes up, in one transaction.
+    Validates the existence of the post before adding the comment.
     """
 
     # Parse the JSON data from the request
@@ -164,40 +215,59 @@ def add_comment_to_post():
     # Create the comment object
     comment = {
         "comment_id": comment_id,
+        "post_id": post_id,
         "text": comment_text,
         "user_id": user_id,
-        "user_name": user_name
+        "user_name": user_name,
+        "created_at": datetime.utcnow()
     }
 
-    # Update the post in the 'posting' collection with the new comment
-    post_update_result = posting.update_one(
-        {"post_id": post_id},
-        {"$push": {"comments": comment}}
-    )
+    def store_comment(session):
+        # Counting the comment also checks that the post exists
+        post_update_result = posting.update_one({"post_id": post_id}, {"$inc": {"comment_count": 1}},
+                                                session=session)
+        if post_update_result.matched_count == 0:
+            return False
+        comments.insert_one(comment, session=session)
+        return True
 
-    if post_update_result.matched_count == 0:
+    if not DataBase.run_transaction(store_comment):
         # If the post is not found in 'posting' collection, return an error
         posting_logger.error(f"Post not found in postings, status code is 404")
         return jsonify({"error": "Post not found in postings"}), 404
 
-    # Update the corresponding post in the community document's posts array
-    community_update_result = communities.update_one(
-        {"posts.post_id": post_id},
-        {"$push": {"posts.$.comments": comment}}
-    )
-
-    if community_update_result.matched_count == 0:
-        # If the post is not found in any community, return a different message
-        posting_logger.info(f"Post updated in postings but not found in any community, status code is 200")
-        return jsonify({"warning": "Post updated in postings but not found in any community"}), 200
     posting_logger.info(f"Comment added successfully, status code is 201")
     return jsonify({"message": "Comment added successfully", "comment_id": comment_id}), 201
 
 
+@posting_bp.route('/posting/comments/<post_id>', methods=['GET'])
+def get_post_comments(post_id):
+    """
+    Retrieves one page of the comments of a post, oldest first.
+    Query parameters 'limit' and 'next' select the page; 'next' in the response is the token of the following page
+    (null on the last one).
+    """
+
+    try:
+        limit, after = pagination.parse(request.args)
+        comments_list, next_token = pagination.page(comments, limit, after, query={"post_id": post_id},
+                                                    projection={"_id": 0}, sort=THREAD_SORT)
+    except ValueError as e:
+        posting_logger.error(f"{e}, status code is 400")
+        return jsonify({"error": str(e)}), 400
+
+    posting_logger.info(f"Comments of {post_id}: {len(comments_list)} comments, status code is 200")
+    response = jsonify({"comments": comments_list, "next": next_token})
+    if next_token:
+        response.headers['X-Next-Page'] = next_token
+    return response, 200
+
+
 @posting_bp.route('/posting/delete_comment_from_post', methods=['DELETE'])
 def delete_comment_from_post():
     """
-    Removes a comment from a specific post within the posting collection and updates the community document.
+    Removes a comment from a specific post: the comment is deleted from the comments collection and the comment
+    count of the post goes down, in one transaction.
     Verifies the existence of the comment before removal.
     """
 
@@ -213,35 +283,21 @@ def delete_comment_from_post():
         posting_logger.error(f"Missing post_id or comment_id, status code is 400")
         return jsonify({"error": "Missing post_id or comment_id"}), 400
 
-    # Remove the comment from the 'posting' collection
-    post_update_result = posting.update_one(
-        {"post_id": post_id},
-        {"$pull": {"comments": {"comment_id": comment_id}}}
-    )
-
-    if post_update_result.matched_count == 0:
-        # If the post is not found, return an error
-        posting_logger.error(f"Post not found, status code is 404")
-        return jsonify({"error": "Post not found"}), 404
-    elif post_update_result.modified_count == 0:
+    def remove_comment(session):
+        comment_delete_result = comments.delete_one({"comment_id": comment_id, "post_id": post_id}, session=session)
+        if comment_delete_result.deleted_count == 0:
+            return False
+        posting.update_one({"post_id": post_id}, {"$inc": {"comment_count": -1}}, session=session)
+        return True
+
+    if not DataBase.run_transaction(remove_comment):
+        if not posting.find_one({"post_id": post_id}, {"_id": 1}):
+            # If the post is not found, return an error
+            posting_logger.error(f"Post not found, status code is 404")
+            return jsonify({"error": "Post not found"}), 404
         # If the comment is not found, return an error
         posting_logger.error(f"Comment not found or already deleted, status code is 404")
         return jsonify({"error": "Comment not found or already deleted"}), 404
 
-    # Remove the comment from the corresponding community document's post
-    community_update_result = communities.update_one(
-        {"posts.post_id": post_id},
-        {"$pull": {"posts.$.comments": {"comment_id": comment_id}}}
-    )
-
-    if community_update_result.matched_count == 0:
-        # If the post is not found in the community, return a message indicating it
-        posting_logger.info(f"Post found in postings but not in any community status code is 200")
-        return jsonify({"warning": "Post found in postings but not in any community"}), 200
-    elif community_update_result.modified_count == 0:
-        # If the comment is not found in the community, return a message indicating it
-        posting_logger.info(f"Comment not found or already deleted from community status code is 200")
-        return jsonify({"warning": "Comment not found or already deleted from community"}), 200
-
     posting_logger.info(f"Comment deleted successfully, status code is 200")
     return jsonify({"message": "Comment deleted successfully"}), 200
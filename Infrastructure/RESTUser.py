@@ -2,15 +2,21 @@ import os
 
 from flask import Blueprint, jsonify, request, abort
 from database import DataBase
-from pymongo import ReturnDocument, errors
+from cached_collection import CachedCollection
+from inbox import Inbox, responds_to
+from pagination import KeysetPagination
+from streaming import stream_json_array, wants_stream
+from projection import FieldProjection
+from pymongo import ReturnDocument, UpdateOne, errors
 from Logic.app_logger import setup_logger
 from Infrastructure.Files import config
 
 # Initialize database connection
 dbase = DataBase()
 db = dbase.db
-users = db['users']
-communities = db['communities']
+users = CachedCollection(db['users'], 'id')
+communities = CachedCollection(db['communities'], 'area')
+inbox = Inbox(db['inbox'])
 
 # Ensure the log file directory exists
 log_file_path = os.path.join(config.application_file_path, "logs/user/user.log")
@@ -25,6 +31,8 @@ except Exception as e:
 # Create a Flask Blueprint for the user routes
 user_bp = Blueprint('user', __name__)
 
+pagination = KeysetPagination()
+
 online_status = 1
 offline_status = 0
 
@@ -32,19 +40,32 @@ offline_status = 0
 @user_bp.route('/users', methods=['GET'])
 def get_users():
     """
-    Retrieves all user profiles, converts MongoDB ObjectId to string for JSON serialization.
+    Retrieves one page of user profiles. The app's JSON provider serializes the ObjectId '_id' as a string.
+    Query parameters 'limit' and 'next' select the page; 'next' in the response is the token of the following page
+    (null on the last one). With ?stream=1 every user is streamed instead, for exports.
+    ?fields=id,name or ?exclude=friends,communities limit the returned fields; the password is never returned.
     """
 
     try:
-        # Fetch all user documents from the MongoDB collection
-        users_list = list(users.find())
-
-        # Convert ObjectId to string for JSON serialization
-        for user in users_list:
-            user['_id'] = str(user['_id'])
+        projection = FieldProjection.hide(FieldProjection.parse(request.args), 'password')
+        if wants_stream(request.args):
+            return stream_json_array(users.find({}, projection),
+                                     prefix='{"message": "Users fetched successfully", "users": ',
+                                     suffix=', "next": null}',
+                                     logger=user_logger)
+        limit, after = pagination.parse(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        user_logger.info(f"Users fetched successfully, users : {users_list}, status code is 200")
-        return jsonify({"message": "Users fetched successfully", "users": users_list}), 200
+    try:
+        # Fetch one page of user documents from the MongoDB collection
+        users_list, next_token = pagination.page(users, limit, after, projection=projection)
+
+        user_logger.info(f"Users fetched successfully, {len(users_list)} users, status code is 200")
+        response = jsonify({"message": "Users fetched successfully", "users": users_list, "next": next_token})
+        if next_token:
+            response.headers['X-Next-Page'] = next_token
+        return response, 200
     except Exception as e:
         # Handle exceptions
         user_logger.error(f"error {str(e)}")
@@ -72,7 +93,6 @@ def add_user():
             return jsonify({"description": "Invalid data type for latitude or longitude"}), 400
 
         user_data["friends"] = []
-        user_data["requests"] = []
         user_data["radius"] = None
         user_data["status"] = offline_status
 
@@ -82,7 +102,7 @@ def add_user():
 
         inserted = users.insert_one(user_data)
         user_data.pop("password", None)
-        user_data["_id"] = str(inserted.inserted_id)
+        user_data["_id"] = inserted.inserted_id
         user_logger.info("User added successfully, status code is 201")
         return jsonify({"message": "User added successfully", "user": user_data}), 201
     except Exception as e:
@@ -92,17 +112,20 @@ def add_user():
 
 @user_bp.route('/user/<user_id>', methods=['GET'])
 def get_user_by_id(user_id):
+    # ?fields=id,name or ?exclude=friends,communities limit the returned fields; the password is never returned
+    try:
+        projection = FieldProjection.hide(FieldProjection.parse(request.args), 'password')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Fetch the user from the MongoDB collection using the provided id
-    user = users.find_one({"id": user_id})
+    user = users.find_one({"id": user_id}, projection)
 
     # Check if the user exists
     if user is None:
         # If no user is found, return a 404 Not Found response
         return jsonify({"error": "User not found!"}), 404
 
-    # Convert ObjectId to string for the response
-    user["_id"] = str(user["_id"])
-
     # Return the user data
     # Exclude sensitive data like password from the response
     user.pop('password', None)
@@ -139,9 +162,6 @@ def update_user(user_id):
         if updated_user is None:
             abort(404, description="User not found after attempting update")
 
-        # Convert ObjectId to string for the response
-        updated_user['_id'] = str(updated_user['_id'])
-
         # Exclude sensitive data like password from the response
         updated_user.pop('password', None)
 
@@ -162,6 +182,9 @@ def delete_user(user_id):
     # Delete the user from the MongoDB collection
     users.delete_one({"id": user_id})
 
+    # Delete the requests the user sent and received, which could no longer be answered
+    inbox.collection.delete_many({"$or": [{"sender_id": user_id}, {"recipient_id": user_id}]})
+
     # Return a success message
     user_logger.info(f"User deleted successfully, status code is 200")
     return jsonify({"message": "User deleted successfully"}), 200
@@ -179,8 +202,8 @@ def check_user_password():
     if not user_data or 'id' not in user_data or 'password' not in user_data:
         return jsonify({"error": "ID and password are required"}), 400
 
-    # Fetch the user from the MongoDB collection using the provided id
-    user = users.find_one({"id": user_data['id']})
+    # Fetch the password of the user from the MongoDB collection; it is never served from the entity cache
+    user = users.find_one({"id": user_data['id']}, {"password": 1})
 
     # If the user is not found, return a 404 Not Found response
     if user is None:
@@ -258,9 +281,6 @@ def update_user_radius(user_id):
     if result is None:
         abort(404, description="User not found")
 
-    # Convert ObjectId to string for the response
-    result['_id'] = str(result['_id'])
-
     # Exclude sensitive data like password from the response
     result.pop('password', None)
 
@@ -287,22 +307,20 @@ def add_friend():
     if sender_id == receiver_id:
         return jsonify({"error": "Sender and receiver cannot be the same"}), 400
 
-    # Verify both users exist
-    sender = users.find_one({"id": sender_id})
-    receiver = users.find_one({"id": receiver_id})
+    # Verify both users exist, fetching them in one query
+    found = users.find_many([sender_id, receiver_id])
+    sender = found.get(sender_id)
+    receiver = found.get(receiver_id)
 
     if sender is None or receiver is None:
         return jsonify({"error": "Both users must exist"}), 404
 
-    # Prepare the request objects for sender and receiver
-    sender_request = {"id": receiver_id, "name": receiver["name"], "status": "pending"}
-    receiver_request = {"id": sender_id, "name": sender["name"], "status": "wait for response"}
-
-    # Update the sender and receiver 'requests' arrays
+    # Send the request to the receiver's inbox
     try:
-        users.update_one({"id": sender_id}, {"$push": {"requests": sender_request}})
-        users.update_one({"id": receiver_id}, {"$push": {"requests": receiver_request}})
-        return jsonify({"message": "Friend request sent successfully"}), 200
+        friend_request = inbox.send(Inbox.FRIEND, sender_id, receiver_id,
+                                    {"sender_name": sender["name"], "receiver_name": receiver["name"]})
+        return jsonify({"message": "Friend request sent successfully",
+                        "request_id": friend_request["request_id"]}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -311,6 +329,7 @@ def add_friend():
 def respond_to_request():
     """
     Handles the response to a friend request, allowing users to either accept or decline a friendship invitation.
+    The request is the one with the given request_id or, without it, the pending request between the two users.
     """
 
     data = request.get_json()
@@ -319,14 +338,49 @@ def respond_to_request():
     sender_id = data.get('sender_id')
     response = data.get('response')  # 1 for approve, 0 for decline
 
-    # Fetch both sender and receiver from the database
-    sender = users.find_one({"id": sender_id})
-    receiver = users.find_one({"id": receiver_id})
-
-    if not sender or not receiver:
+    # Fetch both sender and receiver from the database in one query
+    found = users.find_many([sender_id, receiver_id])
+    if not found.get(sender_id) or not found.get(receiver_id):
         return jsonify({"error": "Sender and receiver must exist"}), 404
 
-    if response == 1:  # Approve
+    if response not in (0, 1):
+        return jsonify({"error": "Invalid response"}), 400
+
+    if data.get('request_id'):
+        friend_request_filter = {"request_id": data['request_id']}
+    else:
+        friend_request_filter = {"kind": Inbox.FRIEND, **Inbox.between(sender_id, receiver_id)}
+    return answer_friend_request(friend_request_filter, response == 1)
+
+
+@responds_to(Inbox.FRIEND)
+def answer_friend_request(friend_request_filter, accept):
+    """
+    Answers the pending friend request matching the filter. Accepting adds each user to the other's friends list in
+    the same transaction as the answer, so a friendship is never one-sided.
+    """
+
+    def apply_answer(session):
+        if not accept:
+            return inbox.answer(friend_request_filter, accept, session=session)
+
+        # Both users are checked before the request is answered, so a failed check leaves it pending
+        friend_request = inbox.find_request(friend_request_filter, session=session)
+        if friend_request is None:
+            return None
+
+        sender_id = friend_request["sender_id"]
+        receiver_id = friend_request["recipient_id"]
+        found = users.find_many([sender_id, receiver_id], session=session)
+        if not found.get(sender_id) or not found.get(receiver_id):
+            raise LookupError("Sender and receiver must exist")
+
+        # None if the request was answered since it was read
+        if inbox.answer({"request_id": friend_request["request_id"]}, accept, session=session) is None:
+            return None
+        sender = found[sender_id]
+        receiver = found[receiver_id]
+
         # Prepare friend information for both sender and receiver
         sender_friend_info = {
             "friend name": receiver["name"],
@@ -340,19 +394,18 @@ def respond_to_request():
             "friend location": sender["location"]
         }
 
-        # Add each user to the other's friends list and remove the request
-        users.update_one({"id": sender_id},
-                         {"$push": {"friends": sender_friend_info}, "$pull": {"requests": {"id": receiver_id}}})
-        users.update_one({"id": receiver_id},
-                         {"$push": {"friends": receiver_friend_info}, "$pull": {"requests": {"id": sender_id}}})
-
-    elif response == 0:  # Decline
-        # Just remove the friend request from both users
-        users.update_one({"id": sender_id}, {"$pull": {"requests": {"id": receiver_id}}})
-        users.update_one({"id": receiver_id}, {"$pull": {"requests": {"id": sender_id}}})
+        users.bulk_write([
+            UpdateOne({"id": sender_id}, {"$push": {"friends": sender_friend_info}}),
+            UpdateOne({"id": receiver_id}, {"$push": {"friends": receiver_friend_info}})
+        ], ordered=False, session=session)
+        return friend_request
 
-    else:
-        return jsonify({"error": "Invalid response"}), 400
+    try:
+        friend_request = DataBase.run_transaction(apply_answer)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    if friend_request is None:
+        return jsonify({"error": "Friend request not found"}), 404
 
     return jsonify({"message": "Response processed successfully"}), 200
 
@@ -372,19 +425,13 @@ def delete_friend():
     if not receiver_id or not sender_id:
         return jsonify({"error": "Both receiver_id and sender_id must be provided"}), 400
 
-    # Attempt to delete the receiver from the sender's friends list
-    sender_update_result = users.update_one(
-        {"id": sender_id},
-        {"$pull": {"friends": {"friend id": receiver_id}}}
-    )
-
-    # Attempt to delete the sender from the receiver's friends list
-    receiver_update_result = users.update_one(
-        {"id": receiver_id},
-        {"$pull": {"friends": {"friend id": sender_id}}}
-    )
+    # Attempt to delete each user from the other's friends list, in one round trip
+    update_result = users.bulk_write([
+        UpdateOne({"id": sender_id}, {"$pull": {"friends": {"friend id": receiver_id}}}),
+        UpdateOne({"id": receiver_id}, {"$pull": {"friends": {"friend id": sender_id}}})
+    ], ordered=False)
 
-    if sender_update_result.modified_count == 0 and receiver_update_result.modified_count == 0:
+    if update_result.modified_count == 0:
         # This means neither document was updated; possibly one of the users did not have the other in their friends
         # list
         return jsonify({"error": "No changes made; check if the users are actually friends"}), 404
@@ -1,42 +1,24 @@
 import os
 
-from flask import Flask, jsonify, request
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 import socket
 import logging
 from logging.handlers import RotatingFileHandler
 from database import DataBase
+from indexes import IndexManager
+from json_provider import MongoJSONProvider
+from cached_collection import entity_cache
+from identity_map import IdentityMap
 from RESTUser import user_bp
 from RESTCommunity import community_bp
 from RESTEvents import events_bp
 from RESTPosting import posting_bp
 from RESTNightWatch import night_watch_bp
+from RESTInbox import inbox_bp
 from Infrastructure.Files import config
 
 from flask import Flask, jsonify, request
-from bson import ObjectId
-import json
-
-
-class MongoJsonEncoder(json.JSONEncoder):
-    """
-        Custom JSON encoder subclass used to serialize MongoDB ObjectId objects into JSON.
-        MongoDB uses ObjectId objects for unique identifiers, which are not serializable by default JSON encoder.
-    """
-    def default(self, obj):
-        """
-                Override the default() method to convert ObjectId to string.
-
-                Parameters:
-                    obj (object): The object to serialize.
-
-                Returns:
-                    str: The string representation of the ObjectId.
-                    Otherwise, use the standard JSON encoding for the object.
-        """
-        if isinstance(obj, ObjectId):
-            return str(obj)
-        return super().default(obj)
 
 
 def create_app():
@@ -47,7 +29,8 @@ def create_app():
             app (Flask): The configured Flask application instance.
     """
     app = Flask(__name__)
-    app.json_encoder = MongoJsonEncoder
+    # Serializes ObjectId, datetime and bytes in responses (see json_provider.py)
+    app.json = MongoJSONProvider(app)
     CORS(app)
 
     log_directory = os.path.join(config.application_file_path, "logs", "app")
@@ -59,16 +42,31 @@ def create_app():
     app.logger.addHandler(handler)
     app.logger.setLevel(logging.INFO)
 
-    # Database setup
+    # Database setup: every blueprint shares the process-wide client configured here
+    app.config.setdefault("MONGO_URI", config.mongo_uri)
+    app.config.setdefault("MONGO_DATABASE", config.mongo_database)
+    app.config.setdefault("MONGO_MAX_POOL_SIZE", config.mongo_max_pool_size)
+    app.config.setdefault("MONGO_MIN_POOL_SIZE", config.mongo_min_pool_size)
+    app.config.setdefault("MONGO_WAIT_QUEUE_TIMEOUT_MS", config.mongo_wait_queue_timeout_ms)
+    app.config.setdefault("MONGO_SERVER_SELECTION_TIMEOUT_MS", config.mongo_server_selection_timeout_ms)
+    app.config.setdefault("MONGO_ROUND_TRIP_HEADER", config.mongo_round_trip_header)
+    DataBase.init_app(app)
     dbase = DataBase()
     db = dbase.db
 
+    # Create the indexes the routes rely on (see indexes.py) and log any drift
+    IndexManager(db).bootstrap(background=config.index_bootstrap_background)
+
+    # Documents cached by a previous app instance in this process may be outdated
+    entity_cache.clear()
+
     # Register blueprints
     app.register_blueprint(user_bp)
     app.register_blueprint(community_bp)
     app.register_blueprint(events_bp)
     app.register_blueprint(posting_bp)
     app.register_blueprint(night_watch_bp)
+    app.register_blueprint(inbox_bp)
 
     # Before and after request hooks
     @app.before_request
@@ -78,6 +76,15 @@ def create_app():
         """
         app.logger.info(f'Handling request: {request.method} {request.path} from {request.remote_addr}')
 
+    @app.before_request
+    def reset_request_state():
+        """
+            Start every request with an empty identity map and round trip count. Both live on g, and an app
+            context that is already pushed (e.g. by a test) is reused by the requests handled inside it.
+        """
+        g.identity_map = IdentityMap()
+        g.mongo_round_trips = 0
+
     @app.after_request
     def after_request_logging(response):
         """
@@ -90,6 +97,9 @@ def create_app():
                     Response: The response object, possibly modified.
         """
         app.logger.info(f'Response: {response.status_code}')
+        if app.config["MONGO_ROUND_TRIP_HEADER"]:
+            # Commands sent to MongoDB by this request, counted by database.RoundTripCounter
+            response.headers['X-Mongo-Round-Trips'] = str(g.get('mongo_round_trips', 0))
         return response
 
     # Error handler
@@ -134,6 +144,21 @@ def create_app():
             return jsonify({'status': 'down', 'database': 'down', 'error': str(e)}), 500
         return jsonify({'status': 'up', 'database': 'up'}), 200
 
+    @app.route('/cache_stats', methods=['GET'])
+    def cache_stats():
+        """
+        Reports how the entity cache of users and communities performs, per collection.
+
+        Returns:
+            jsonify: JSON object with the cache settings and the per-collection entries, hits, misses and hit ratio.
+        """
+        return jsonify({
+            'enabled': config.entity_cache_enabled,
+            'ttl_seconds': entity_cache.ttl_seconds,
+            'max_entries': entity_cache.max_entries,
+            'collections': entity_cache.stats()
+        }), 200
+
     return app
 
 
@@ -0,0 +1,173 @@
+"""
+Event attendance: one RSVP document per (event, user) in the 'rsvps' collection.
+
+Attendance used to be pushed into the 'attending' array of the event and of the event copy embedded in its
+community, into the 'events' array of the user, and, for confirmed join requests, into 'attendees' and
+'attending_events' as well. An RSVP is now:
+
+    {"event_id": "<uuid>", "user_id": "311156616", "status": "attending", "responded_at": <date>,
+     "event_name": "Spring Fest", "community_name": "TestArea", "start_time": <date>, "end_time": <date>}
+
+The unique (event_id, user_id) index makes adding an attendee idempotent. "Who's coming" and the waitlist are read
+from the (event_id, status, responded_at) index and "my events" from the (user_id, start_time) index, so an RSVP
+costs a few small writes however many people attend.
+
+Events may have a capacity. The event keeps attendee_count and waitlist_count, and a seat is only ever taken by
+one conditional update of the event ("attendee_count < capacity"), so concurrent RSVPs cannot overbook it and no
+lock is needed. Users who find the event full are waitlisted in the order they answered; while anyone is
+waitlisted, new RSVPs join the waitlist too, and freed seats go to the waitlist in order (see promote).
+"""
+from datetime import datetime
+
+from pymongo import ASCENDING
+
+
+class Attendance:
+    """
+    Adds, lists, counts and waitlists the attendees of events.
+    """
+
+    ATTENDING = "attending"
+    WAITLISTED = "waitlisted"
+    STATUSES = (ATTENDING, WAITLISTED)
+
+    # Attendees (or the waitlist) in the order they answered, matching the (event_id, status, responded_at, _id) index
+    ATTENDEES_SORT = [("responded_at", ASCENDING), ("_id", ASCENDING)]
+    # A user's events soonest first, matching the (user_id, start_time, _id) index
+    USER_EVENTS_SORT = [("start_time", ASCENDING), ("_id", ASCENDING)]
+
+    # Fields of the event copied to its RSVPs, so "my events" needs no lookup of the events
+    EVENT_FIELDS = ("event_name", "community_name", "start_time", "end_time")
+
+    def __init__(self, rsvps, events, clock=datetime.utcnow):
+        """
+        Initializes the attendance.
+
+        Parameters:
+        - rsvps (Collection): The rsvps collection.
+        - events (Collection): The events collection, which holds the attendee and waitlist counts.
+        - clock (callable): Returns the current time as a naive UTC datetime, like PyMongo does.
+        """
+        self.rsvps = rsvps
+        self.events = events
+        self._clock = clock
+
+    def new_rsvp(self, event, user_id, status=ATTENDING):
+        """
+        Returns the RSVP of a user to an event document, without storing it.
+        """
+        rsvp = {"event_id": event["event_id"], "user_id": user_id, "status": status, "responded_at": self._clock()}
+        rsvp.update({field: event.get(field) for field in self.EVENT_FIELDS})
+        return rsvp
+
+    @staticmethod
+    def free_seat_filter(event):
+        """
+        Returns the filter matching the event while it has a free seat. The capacity of an event never changes, so
+        it is taken from the given document; events without one have no limit.
+        """
+        query = {"event_id": event["event_id"]}
+        if event.get("capacity") is not None:
+            query["attendee_count"] = {"$lt": event["capacity"]}
+        return query
+
+    def _insert(self, rsvp, session):
+        # An upsert rather than an insert: a duplicate key error would abort the caller's transaction
+        result = self.rsvps.update_one({"event_id": rsvp["event_id"], "user_id": rsvp["user_id"]},
+                                       {"$setOnInsert": rsvp}, upsert=True, session=session)
+        return result.upserted_id is not None
+
+    def add(self, event, user_id, session=None):
+        """
+        Gives the user a seat at the event, or a place on its waitlist when it is full.
+
+        Returns:
+        - str: ATTENDING or WAITLISTED, or None if the user already had an RSVP to the event.
+        """
+        event_id = event["event_id"]
+
+        # Take a seat, unless the event is full or others are already waiting for one
+        seat = self.events.update_one({**self.free_seat_filter(event), "waitlist_count": {"$not": {"$gt": 0}}},
+                                      {"$inc": {"attendee_count": 1}}, session=session)
+        if seat.matched_count:
+            if self._insert(self.new_rsvp(event, user_id, self.ATTENDING), session):
+                return self.ATTENDING
+            # The user already had an RSVP: give the seat back, to the waitlist if anyone joined it meanwhile
+            self.events.update_one({"event_id": event_id}, {"$inc": {"attendee_count": -1}}, session=session)
+            self.promote(event, session=session)
+            return None
+
+        if not self._insert(self.new_rsvp(event, user_id, self.WAITLISTED), session):
+            return None
+        self.events.update_one({"event_id": event_id}, {"$inc": {"waitlist_count": 1}}, session=session)
+        # A seat may have been freed between the failed update and the waitlisting
+        if user_id in self.promote(event, session=session):
+            return self.ATTENDING
+        return self.WAITLISTED
+
+    def promote(self, event, session=None):
+        """
+        Gives the free seats of the event to the waitlisted users, in the order they joined the waitlist. Every
+        seat is taken by the same conditional update as in add, so promotions never overbook the event either.
+
+        Returns:
+        - list: The ids of the promoted users.
+        """
+        event_id = event["event_id"]
+        promoted = []
+        while True:
+            seat = self.events.update_one({**self.free_seat_filter(event), "waitlist_count": {"$gt": 0}},
+                                          {"$inc": {"attendee_count": 1, "waitlist_count": -1}}, session=session)
+            if not seat.matched_count:
+                return promoted
+
+            rsvp = self.rsvps.find_one_and_update({"event_id": event_id, "status": self.WAITLISTED},
+                                                  {"$set": {"status": self.ATTENDING, "promoted_at": self._clock()}},
+                                                  projection={"user_id": 1}, sort=self.ATTENDEES_SORT,
+                                                  session=session)
+            if rsvp is None:
+                # The waitlisted user left between the two updates; whoever removed them takes the count down
+                self.events.update_one({"event_id": event_id}, {"$inc": {"attendee_count": -1, "waitlist_count": 1}},
+                                       session=session)
+                return promoted
+            promoted.append(rsvp["user_id"])
+
+    def remove(self, event, user_id, session=None):
+        """
+        Removes the user's RSVP to the event. A freed seat goes to the waitlist.
+
+        Returns:
+        - tuple: (status of the removed RSVP, or None if the user had none, ids of the promoted users).
+        """
+        rsvp = self.rsvps.find_one_and_delete({"event_id": event["event_id"], "user_id": user_id},
+                                              projection={"status": 1}, session=session)
+        if rsvp is None:
+            return None, []
+
+        counter = "attendee_count" if rsvp["status"] == self.ATTENDING else "waitlist_count"
+        self.events.update_one({"event_id": event["event_id"]}, {"$inc": {counter: -1}}, session=session)
+        return rsvp["status"], self.promote(event, session=session)
+
+    def leave_community(self, community_name, user_id, session=None):
+        """
+        Removes the user's RSVPs to the events of a community they no longer belong to. Freed seats go to the
+        waitlists.
+
+        Returns:
+        - dict: The ids of the promoted users by event_id.
+        """
+        promoted = {}
+        for rsvp in list(self.rsvps.find({"user_id": user_id, "community_name": community_name}, {"event_id": 1},
+                                         session=session)):
+            # The RSVP of a deleted event is still removed; the event updates then match nothing
+            event = (self.events.find_one({"event_id": rsvp["event_id"]}, {"event_id": 1, "capacity": 1},
+                                          session=session)
+                     or {"event_id": rsvp["event_id"]})
+            promoted[rsvp["event_id"]] = self.remove(event, user_id, session=session)[1]
+        return promoted
+
+    def delete_event(self, event_id, session=None):
+        """
+        Deletes the RSVPs of a deleted event.
+        """
+        self.rsvps.delete_many({"event_id": event_id}, session=session)
@@ -0,0 +1,286 @@
+"""
+Read-through caching of the documents the handlers look up by their key, e.g. users by 'id' and communities by
+'area'.
+
+A CachedCollection wraps a collection. find_one with a filter on the key (for example
+users.find_one({"id": user_id}) or communities.find_one({"area": area}, {"location": 1})) is served, in order, from
+the identity map of the current request, from the process-wide entity_cache and finally from MongoDB. find_many
+fetches several keys with a single $in query. Every write through the wrapper invalidates the documents it may
+change: the written key when the filter names it, otherwise the whole collection, and once more when the write was
+made in a transaction that has since ended (see DataBase.after_transaction). Writes from other processes are
+only seen once the entity_cache entries expire, so its TTL bounds how stale a cached document can be.
+
+That bound is not acceptable for credentials: a password changed through one worker must not keep working in
+another. The PRIVATE_FIELDS of a collection are therefore never cached. Documents read through the wrapper do not
+contain them, and a lookup that asks for one in its projection or filters on it (e.g. the login check,
+users.find_one({"id": user_id}, {"password": 1})) is always read from MongoDB.
+"""
+from Infrastructure.Files import config
+from Logic.EntityCache import EntityCache
+from database import DataBase
+from identity_map import request_identity_map
+
+# collection -> fields never cached, and only returned by lookups that ask for them
+PRIVATE_FIELDS = {"users": ("password",)}
+
+entity_cache = EntityCache(max_entries=config.entity_cache_max_entries,
+                           ttl_seconds=config.entity_cache_ttl_seconds)
+
+
+def apply_projection(document, projection):
+    """
+    Applies a projection of top-level fields to a full document, like MongoDB would.
+    """
+    if not projection:
+        return document
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    if any(value and field != "_id" for field, value in projection.items()):
+        fields = {field for field, value in projection.items() if value}
+        if projection.get("_id", 1):
+            fields.add("_id")
+        return {field: value for field, value in document.items() if field in fields}
+    return {field: value for field, value in document.items() if projection.get(field, 1)}
+
+
+def is_scalar(value):
+    return isinstance(value, (str, int, float, bool))
+
+
+class CachedCollection:
+    """
+    Wraps a collection so that lookups by its key go through the request's identity map and the entity cache.
+    Attributes that are not overridden here are forwarded to the wrapped collection.
+    """
+
+    def __init__(self, collection, key_field, cache=entity_cache, enabled=config.entity_cache_enabled):
+        """
+        Initializes the wrapper.
+
+        Parameters:
+        - collection (Collection): The wrapped collection (or collection proxy).
+        - key_field (str): The field identifying a document, e.g. 'id' for users.
+        - cache (EntityCache): Where documents are cached between requests, or None to only use the identity map.
+        - enabled (bool): When False the entity cache is skipped; the identity map is always used.
+        """
+        self.collection = collection
+        self.name = collection.name
+        self.key_field = key_field
+        self.cache = cache if enabled else None
+        self.private_fields = PRIVATE_FIELDS.get(self.name, ())
+        # Projection of the reads whose documents are cached
+        self.cached_projection = {field: 0 for field in self.private_fields} or None
+
+    def __getattr__(self, attribute):
+        return getattr(self.collection, attribute)
+
+    def key_of(self, filter):
+        """
+        Returns the key a filter selects a single document by, or None if it selects by anything else.
+        """
+        if isinstance(filter, dict) and len(filter) == 1:
+            key = filter.get(self.key_field)
+            if is_scalar(key):
+                return key
+        return None
+
+    def keys_of(self, filter):
+        """
+        Returns the keys a write filter is limited to ({key_field: key} or {key_field: {"$in": keys}}), or None if
+        it may match any document.
+        """
+        key = self.key_of(filter)
+        if key is not None:
+            return [key]
+        if isinstance(filter, dict) and len(filter) == 1 and isinstance(filter.get(self.key_field), dict):
+            condition = filter[self.key_field]
+            if list(condition) == ["$in"] and all(is_scalar(key) for key in condition["$in"]):
+                return list(condition["$in"])
+        return None
+
+    def split_filter(self, filter):
+        """
+        Splits a filter on the key plus equality conditions on top-level fields, e.g.
+        {"event_id": event_id, "community_name": name}, into (key, conditions). Returns (None, None) for
+        any other filter.
+        """
+        if not isinstance(filter, dict) or not is_scalar(filter.get(self.key_field)):
+            return None, None
+        conditions = {field: value for field, value in filter.items() if field != self.key_field}
+        if any(field.startswith("$") or "." in field or not is_scalar(value) for field, value in conditions.items()):
+            return None, None
+        return filter[self.key_field], conditions
+
+    def wants_private(self, projection, conditions):
+        """
+        Returns whether a lookup filters on a private field or asks for one in an inclusion projection.
+        """
+        if any(field in self.private_fields for field in conditions or ()):
+            return True
+        if isinstance(projection, (list, tuple)):
+            projection = {field: 1 for field in projection}
+        return any(projection.get(field) for field in self.private_fields) if projection else False
+
+    def lookup(self, key):
+        """
+        Returns the document of a key, without its private fields, from the identity map, the entity cache or
+        MongoDB, or None if it does not exist.
+        """
+        identity_map = request_identity_map()
+        if identity_map is not None:
+            document = identity_map.get(self.name, key)
+            if document is not None:
+                return document
+
+        document = self.cache.get(self.name, key) if self.cache is not None else None
+        if document is None:
+            generation = self.cache.generation(self.name) if self.cache is not None else None
+            document = self.collection.find_one({self.key_field: key}, self.cached_projection)
+            if document is None:
+                return None
+            if self.cache is not None:
+                self.cache.put(self.name, key, document, generation)
+
+        if identity_map is not None:
+            identity_map.put(self.name, key, document)
+        return document
+
+    def find_one(self, filter=None, *args, **kwargs):
+        """
+        Like Collection.find_one. Lookups by the key, optionally with equality conditions on other top-level
+        fields and a projection of top-level fields, go through lookup. Lookups with any other argument, such as a
+        session, are read from MongoDB.
+        """
+        projection = args[0] if args else kwargs.get("projection")
+        key, conditions = self.split_filter(filter)
+        if (key is None or len(args) > 1 or set(kwargs) - {"projection"} or
+                any("." in field for field in (projection or ())) or self.wants_private(projection, conditions)):
+            return self.collection.find_one(filter, *args, **kwargs)
+
+        document = self.lookup(key)
+        if document is None or any(document.get(field) != value for field, value in conditions.items()):
+            return None
+        return apply_projection(document, projection)
+
+    def find_many(self, keys, projection=None, session=None):
+        """
+        Fetches the documents of several keys, reading the ones that are neither in the identity map nor in the
+        entity cache with a single $in query. Reads in a transaction (with a session) skip both and read every key
+        from its snapshot.
+
+        Returns:
+        - dict: key -> document, without the keys that do not exist.
+        """
+        if session is not None:
+            return {document[self.key_field]: apply_projection(document, projection)
+                    for document in self.collection.find({self.key_field: {"$in": list(dict.fromkeys(keys))}},
+                                                         self.cached_projection, session=session)}
+
+        identity_map = request_identity_map()
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            document = identity_map.get(self.name, key) if identity_map is not None else None
+            if document is None and self.cache is not None:
+                document = self.cache.get(self.name, key)
+                if document is not None and identity_map is not None:
+                    identity_map.put(self.name, key, document)
+            if document is None:
+                missing.append(key)
+            else:
+                found[key] = document
+
+        if missing:
+            generation = self.cache.generation(self.name) if self.cache is not None else None
+            for document in self.collection.find({self.key_field: {"$in": missing}}, self.cached_projection):
+                key = document[self.key_field]
+                found[key] = document
+                if self.cache is not None:
+                    self.cache.put(self.name, key, document, generation)
+                if identity_map is not None:
+                    identity_map.put(self.name, key, document)
+
+        return {key: apply_projection(document, projection) for key, document in found.items()}
+
+    def invalidate(self, filter=None, session=None):
+        """
+        Drops the cached documents a write with this filter may change. A write in a transaction is invalidated
+        again once the transaction has ended: until it commits, a concurrent lookup still reads, and caches, the
+        document as it was.
+        """
+        identity_map = request_identity_map()
+        for key in self.keys_of(filter) or [None]:
+            if identity_map is not None:
+                identity_map.invalidate(self.name, key)
+            if self.cache is not None:
+                self.cache.invalidate(self.name, key)
+        if session is not None:
+            DataBase.after_transaction(lambda: self.invalidate(filter))
+
+    def bulk_write(self, requests, *args, **kwargs):
+        try:
+            return self.collection.bulk_write(requests, *args, **kwargs)
+        finally:
+            # Inserts (the only operations without a filter) cannot change a cached document
+            filters = [operation._filter for operation in requests if hasattr(operation, "_filter")]
+            if any(self.keys_of(filter) is None for filter in filters):
+                filters = [None]
+            for filter in filters:
+                self.invalidate(filter, kwargs.get("session"))
+
+    # Writes: each one invalidates the cached documents it may have changed, even if it failed halfway
+
+    def update_one(self, filter, *args, **kwargs):
+        try:
+            return self.collection.update_one(filter, *args, **kwargs)
+        finally:
+            self.invalidate(filter, kwargs.get("session"))
+
+    def update_many(self, filter, *args, **kwargs):
+        try:
+            return self.collection.update_many(filter, *args, **kwargs)
+        finally:
+            self.invalidate(filter, kwargs.get("session"))
+
+    def replace_one(self, filter, *args, **kwargs):
+        try:
+            return self.collection.replace_one(filter, *args, **kwargs)
+        finally:
+            self.invalidate(filter, kwargs.get("session"))
+
+    def delete_one(self, filter, *args, **kwargs):
+        try:
+            return self.collection.delete_one(filter, *args, **kwargs)
+        finally:
+            self.invalidate(filter, kwargs.get("session"))
+
+    def delete_many(self, filter, *args, **kwargs):
+        try:
+            return self.collection.delete_many(filter, *args, **kwargs)
+        finally:
+            self.invalidate(filter, kwargs.get("session"))
+
+    def find_one_and_update(self, filter, *args, **kwargs):
+        try:
+            return self.collection.find_one_and_update(filter, *args, **kwargs)
+        finally:
+            self.invalidate(filter, kwargs.get("session"))
+
+    def find_one_and_replace(self, filter, *args, **kwargs):
+        try:
+            return self.collection.find_one_and_replace(filter, *args, **kwargs)
+        finally:
+            self.invalidate(filter, kwargs.get("session"))
+
+    def find_one_and_delete(self, filter, *args, **kwargs):
+        try:
+            return self.collection.find_one_and_delete(filter, *args, **kwargs)
+        finally:
+            self.invalidate(filter, kwargs.get("session"))
+
+    def drop(self, *args, **kwargs):
+        try:
+            return self.collection.drop(*args, **kwargs)
+        finally:
+            self.invalidate(session=kwargs.get("session"))
@@ -0,0 +1,78 @@
+"""
+Bounded summaries of the posts and events of a community.
+
+Posts live in the 'posting' collection and events in the 'events' collection. A community document only keeps, for
+each of them, a count and the ids of the latest config.community_recent_items items:
+
+    {"area": "TestArea", ..., "post_count": 250, "recent_post_ids": ["<newest post_id>", ...],
+     "event_count": 12, "recent_event_ids": ["<newest event_id>", ...]}
+
+so reading a community costs the same however active it is. Communities written before the switch still embed every
+post and event in 'posts' and 'events' until Infrastructure/Migrations/move_community_content.py has run; recent_items
+reads both layouts, and removed_update also pulls the embedded copy.
+"""
+from Infrastructure.Files import config
+
+# kind -> (count field, recent ids field, embedded array of the old layout, id field of the items)
+SUMMARY_FIELDS = {
+    "posts": ("post_count", "recent_post_ids", "posts", "post_id"),
+    "events": ("event_count", "recent_event_ids", "events", "event_id"),
+}
+
+
+def empty_summary():
+    """
+    Returns the summary fields of a new community.
+    """
+    summary = {}
+    for count_field, ids_field, _, _ in SUMMARY_FIELDS.values():
+        summary[count_field] = 0
+        summary[ids_field] = []
+    return summary
+
+
+def added_update(kind, item_id, recent_items=config.community_recent_items):
+    """
+    Returns the community update recording a new post or event: the count goes up and its id becomes the newest of
+    the recent ids, the oldest being dropped past recent_items.
+    """
+    count_field, ids_field, _, _ = SUMMARY_FIELDS[kind]
+    return {"$inc": {count_field: 1},
+            "$push": {ids_field: {"$each": [item_id], "$position": 0, "$slice": recent_items}}}
+
+
+def removed_update(kind, item_id):
+    """
+    Returns the community update recording a deleted post or event. The recent ids are not refilled, so they may
+    list fewer than recent_items ids until more items are added. Items embedded by the old layout were never
+    counted, so the counts of a community that still has some are only exact once the migration recomputed them.
+    """
+    count_field, ids_field, embedded_field, id_field = SUMMARY_FIELDS[kind]
+    return {"$inc": {count_field: -1},
+            "$pull": {ids_field: item_id, embedded_field: {id_field: item_id}}}
+
+
+def recent_items(community, kind, collection, recent_items=config.community_recent_items):
+    """
+    Returns the latest posts or events of a community, newest first: the ones listed in its recent ids, read from
+    their collection with one $in query, followed by the ones still embedded in the community by the old layout.
+
+    Parameters:
+    - community (dict): The community document.
+    - kind (str): 'posts' or 'events'.
+    - collection (Collection): The 'posting' or 'events' collection.
+    - recent_items (int): The most items returned.
+    """
+    _, ids_field, embedded_field, id_field = SUMMARY_FIELDS[kind]
+    recent_ids = community.get(ids_field) or []
+
+    items = []
+    if recent_ids:
+        found = {item[id_field]: item for item in collection.find({id_field: {"$in": recent_ids}}, {"_id": 0})}
+        items = [found[item_id] for item_id in recent_ids if item_id in found]
+
+    seen = {item[id_field] for item in items}
+    for item in reversed(community.get(embedded_field) or []):
+        if item.get(id_field) not in seen:
+            items.append({field: value for field, value in item.items() if field != "_id"})
+    return items[:recent_items]
@@ -1,42 +1,220 @@
-from pymongo import MongoClient
+import os
+import threading
+
+from flask import g, has_app_context
+from pymongo import MongoClient, monitoring
+
+from Infrastructure.Files import config
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    """
+    Counts the commands (round trips) sent to MongoDB while handling the current request, in g.mongo_round_trips
+    (reset to 0 by app.py at the start of every request).
+    Commands sent outside of an app context, and the 'hello' probe of DataBase.supports_transactions, are not
+    counted.
+    """
+
+    def started(self, event):
+        if has_app_context() and event.command_name != "hello":
+            g.mongo_round_trips = g.get('mongo_round_trips', 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+round_trip_counter = RoundTripCounter()
+
+# Actions deferred by DataBase.after_transaction until the transaction running on the current thread has ended
+transaction_state = threading.local()
 
 
 class DataBase:
     """
-    A class for managing a connection to a MongoDB database and accessing its data.
+    A class for managing the process-wide connection to the MongoDB database and accessing its data.
+
+    Every DataBase instance shares a single MongoClient (and therefore a single connection pool) per process.
+    The client is created lazily on first use and re-created when the process id changes, so a worker forked
+    from a parent that already used the database never shares the parent's sockets or monitor threads.
 
     Attributes:
-        client (MongoClient): A MongoClient object that represents a connection to the MongoDB instance.
-        db (Database): A Database object that represents the specific database accessed within MongoDB.
+        client (MongoClient): The shared MongoClient of the current process.
+        db (DatabaseProxy): The 'UrbanHive' database. Collections taken from it (e.g. db['users']) resolve to
+            the current process's client on every call, so they are safe to create at import time.
 
     Methods:
-        __init__: Initializes a new DataBase instance, connecting to a MongoDB database.
+        __init__: Initializes a new DataBase instance that uses the shared connection.
+        init_app: Applies the connection settings of a Flask application. Called by create_app.
+        get_client: Returns the shared MongoClient, creating it if needed.
+        get_database: Returns the database of the shared MongoClient.
+        supports_transactions: Tells whether the deployment can run multi-document transactions.
+        run_transaction: Runs a group of writes in a transaction when the deployment supports it.
     """
 
+    # Connection settings, from Infrastructure/Files/config.py unless init_app overrides them
+    settings = {
+        "uri": config.mongo_uri,
+        "database": config.mongo_database,
+        "maxPoolSize": config.mongo_max_pool_size,
+        "minPoolSize": config.mongo_min_pool_size,
+        "waitQueueTimeoutMS": config.mongo_wait_queue_timeout_ms,
+        "serverSelectionTimeoutMS": config.mongo_server_selection_timeout_ms
+    }
+
+    _client = None
+    _client_pid = None
+    _lock = threading.Lock()
+    # Whether the deployment of _transactions_client supports transactions
+    _transactions_client = None
+    _transactions_supported = False
+
     def __init__(self):
         """
-        Initializes a new instance of the DataBase class, setting up a connection to the MongoDB database
-        running on the local machine via the default port.
-
-        The method sets up a client to interact with the MongoDB instance at the specified URI,
-        and selects a specific database named 'UrbanHive' for data operations.
+        Initializes a new instance of the DataBase class. No connection is opened here; the shared client is
+        created the first time the database is used in this process.
 
-        MongoDB URI is predefined as 'mongodb://localhost:27017/UrbanHive'. This URI indicates that
-        MongoDB is expected to be running locally on the default MongoDB port, 27017. The 'UrbanHive'
-        part of the URI specifies the database to be accessed.
+        The MongoDB URI, database name and pool settings come from Infrastructure/Files/config.py, which reads
+        them from the environment (URBANHIVE_MONGO_URI, URBANHIVE_MONGO_MAX_POOL_SIZE, ...). The default URI is
+        'mongodb://localhost:27017/UrbanHive'.
 
         Note:
-            Ensure MongoDB is running on localhost:27017 before initializing this class. The 'UrbanHive'
-            database should also exist or should be creatable by the MongoDB permissions set for the
-            localhost connection.
+            Ensure MongoDB is reachable at the configured URI before the database is used.
+        """
+        self.db = DatabaseProxy()
+
+    @property
+    def client(self):
+        return DataBase.get_client()
+
+    @classmethod
+    def init_app(cls, app):
+        """
+        Applies the connection settings of a Flask application and drops any client created with older settings.
+
+        The settings are read from app.config keys MONGO_URI, MONGO_DATABASE, MONGO_MAX_POOL_SIZE,
+        MONGO_MIN_POOL_SIZE, MONGO_WAIT_QUEUE_TIMEOUT_MS and MONGO_SERVER_SELECTION_TIMEOUT_MS, which create_app
+        fills from config.py.
+        """
+        with cls._lock:
+            cls.settings = {
+                "uri": app.config["MONGO_URI"],
+                "database": app.config["MONGO_DATABASE"],
+                "maxPoolSize": app.config["MONGO_MAX_POOL_SIZE"],
+                "minPoolSize": app.config["MONGO_MIN_POOL_SIZE"],
+                "waitQueueTimeoutMS": app.config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+                "serverSelectionTimeoutMS": app.config["MONGO_SERVER_SELECTION_TIMEOUT_MS"]
+            }
+            if cls._client is not None and cls._client_pid == os.getpid():
+                cls._client.close()
+            cls._client = None
+            cls._client_pid = None
+
+    @classmethod
+    def get_client(cls):
+        """
+        Returns the MongoClient of the current process, creating it on first use or after a fork.
 
         Raises:
-            pymongo.errors.ConnectionFailure: If the MongoClient cannot make a connection to the database.
-            pymongo.errors.ConfigurationError: If the URI provided is malformed or the database is not reachable.
+            pymongo.errors.ConfigurationError: If the configured URI or pool settings are invalid.
+        """
+        pid = os.getpid()
+        if cls._client is None or cls._client_pid != pid:
+            with cls._lock:
+                if cls._client is None or cls._client_pid != pid:
+                    # A client inherited from a parent process is abandoned, not closed: its sockets and
+                    # threads belong to the parent
+                    settings = dict(cls.settings)
+                    uri = settings.pop("uri")
+                    settings.pop("database")
+                    cls._client = MongoClient(uri, connect=False, event_listeners=[round_trip_counter], **settings)
+                    cls._client_pid = pid
+        return cls._client
+
+    @classmethod
+    def get_database(cls):
+        """
+        Returns the 'UrbanHive' database (or the configured database name) of the shared client.
+        """
+        return cls.get_client()[cls.settings["database"]]
+
+    @classmethod
+    def supports_transactions(cls):
+        """
+        Returns True if the deployment is a replica set or a sharded cluster. A standalone server, like the default
+        'mongodb://localhost:27017', cannot run multi-document transactions. The answer is cached per client.
+        """
+        client = cls.get_client()
+        if cls._transactions_client is not client:
+            hello = client.admin.command("hello")
+            cls._transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+            cls._transactions_client = client
+        return cls._transactions_supported
+
+    @classmethod
+    def run_transaction(cls, callback):
+        """
+        Runs callback(session) in a multi-document transaction, retried on transient errors, so its writes are
+        applied all together or not at all. On a deployment without transactions callback(None) runs the same
+        writes without one.
+
+        Parameters:
+        - callback (callable): Issues the writes, passing session=session to every collection call.
+
+        Returns:
+        - The return value of callback.
+        """
+        if not cls.supports_transactions():
+            return callback(None)
+
+        transaction_state.after = []
+        try:
+            with cls.get_client().start_session() as session:
+                return session.with_transaction(callback)
+        finally:
+            actions, transaction_state.after = transaction_state.after, None
+            for action in actions:
+                action()
+
+    @classmethod
+    def after_transaction(cls, action):
         """
+        Runs action() once the transaction running on this thread has ended, whether it committed or aborted, or
+        right away when no transaction is running. Until then, other requests still read the data as it was.
+        """
+        actions = getattr(transaction_state, "after", None)
+        if actions is None:
+            action()
+        else:
+            actions.append(action)
+
+
+class DatabaseProxy:
+    """
+    Stands in for the pymongo Database of the shared client. Item access returns collection proxies and
+    attribute access is forwarded to the current process's Database (e.g. db.command or db.users).
+    """
+
+    def __getitem__(self, name):
+        return CollectionProxy(name)
+
+    def __getattr__(self, name):
+        return getattr(DataBase.get_database(), name)
+
+
+class CollectionProxy:
+    """
+    Stands in for a pymongo Collection of the shared client. Every attribute access is forwarded to the
+    collection of the current process's client, so module-level collections survive a fork.
+    """
+
+    def __init__(self, name):
+        self.name = name
 
-        # Connect to the local MongoDB instance running on the default port 27017
-        self.client = MongoClient('mongodb://localhost:27017/UrbanHive')
+    def __getattr__(self, attribute):
+        return getattr(DataBase.get_database()[self.name], attribute)
 
-        # Access a database named 'UrbanHive'
-        self.db = self.client['UrbanHive']
+    def __repr__(self):
+        return f"CollectionProxy({self.name!r})"
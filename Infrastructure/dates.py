@@ -0,0 +1,37 @@
+"""
+Dates sent by clients.
+
+Dates are stored as BSON dates, which MongoDB compares and indexes chronologically, instead of the strings clients
+send. Like PyMongo, the module works with naive datetimes in UTC.
+"""
+import datetime
+
+
+def parse_date(value):
+    """
+    Converts a client date to a naive UTC datetime.
+
+    Parameters:
+    - value (str or datetime): An ISO 8601 date or date and time, e.g. '2022-06-01', '2022-06-01T19:00:00Z' or
+      '2022-06-01T21:00:00+02:00'. Times without an offset are taken as UTC.
+
+    Returns:
+    - datetime: The date in UTC, without tzinfo.
+
+    Raises:
+        ValueError: If the value is not an ISO 8601 date.
+    """
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    elif isinstance(value, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(value.strip())
+        except ValueError:
+            raise ValueError(f"Invalid date: {value}")
+    else:
+        raise ValueError(f"Invalid date: {value}")
+
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    # BSON dates have millisecond precision
+    return parsed.replace(microsecond=parsed.microsecond // 1000 * 1000)
@@ -0,0 +1,54 @@
+"""
+A per-request identity map: the documents read while handling one request, keyed by (collection, key).
+
+A handler that looks up the same user or event twice gets the second copy from here instead of MongoDB.
+The map lives on Flask's g and app.py replaces it at the start of every request, so it never shares documents
+between requests, even when they run inside one long-lived app context.
+"""
+import copy
+
+from flask import g, has_app_context
+
+
+class IdentityMap:
+    """
+    Documents read during one request, keyed by (collection, key). Documents are copied on the way in and out,
+    so handlers may modify the documents they get.
+    """
+
+    def __init__(self):
+        self._documents = {}
+
+    def get(self, collection, key):
+        """
+        Returns a copy of the document read earlier in the request, or None.
+        """
+        document = self._documents.get((collection, key))
+        return copy.deepcopy(document) if document is not None else None
+
+    def put(self, collection, key, document):
+        """
+        Remembers a document for the rest of the request.
+        """
+        self._documents[(collection, key)] = copy.deepcopy(document)
+
+    def invalidate(self, collection, key=None):
+        """
+        Forgets the document of a key, or every document of the collection when key is None.
+        """
+        if key is not None:
+            self._documents.pop((collection, key), None)
+            return
+        for entry_key in [entry_key for entry_key in self._documents if entry_key[0] == collection]:
+            del self._documents[entry_key]
+
+
+def request_identity_map():
+    """
+    Returns the identity map of the current request, or None outside of an app context (e.g. in scripts).
+    """
+    if not has_app_context():
+        return None
+    if 'identity_map' not in g:
+        g.identity_map = IdentityMap()
+    return g.identity_map
@@ -0,0 +1,196 @@
+"""
+The inbox: friend requests, community invitations and join requests, and event invitations and join requests, one
+document per request in the 'inbox' collection.
+
+Requests used to be pushed into the 'requests' array of the users (community invitations into a 'communityRequest'
+field, community join requests into a 'join_request' field that the next request overwrote) and removed again by
+matching the whole value. A request is now:
+
+    {"request_id": "<uuid>", "kind": "friend", "sender_id": "311156616", "recipient_id": "311285514",
+     "status": "pending", "created_at": <date>, "expires_at": <date>, "payload": {...}}
+
+Community join requests are addressed to the community (its area is the recipient_id) and event join requests to
+the event's initiator. A recipient's requests are listed newest first from the (recipient_id, status, created_at)
+index. A request is answered with one find_one_and_update that only matches it while it is pending, so it is
+answered exactly once. MongoDB's TTL monitor deletes a request once its 'expires_at' has passed: pending requests
+after config.inbox_pending_ttl_days, answered ones config.inbox_resolved_ttl_days after the answer.
+
+The blueprint owning a kind of request registers the function that applies an answer to it with responds_to; the
+generic POST /inbox/respond (RESTInbox.py) dispatches to it by the kind of the request. A responder reads the
+request (find_request) and checks the users or the event it refers to before answering it, so a failed check leaves
+the request pending even on a deployment without transactions.
+"""
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import DESCENDING, ReturnDocument
+
+from Infrastructure.Files import config
+
+# kind -> function(filter, accept) that answers the pending request matching filter and returns a Flask response
+responders = {}
+
+
+def responds_to(kind):
+    """
+    Registers the decorated function as the one answering requests of this kind.
+    """
+    def register(function):
+        responders[kind] = function
+        return function
+    return register
+
+
+class Inbox:
+    """
+    Sends, lists and answers the requests stored in the inbox collection.
+    """
+
+    FRIEND = "friend"
+    COMMUNITY_INVITE = "community_invite"
+    COMMUNITY_JOIN = "community_join"
+    EVENT_INVITE = "event_invite"
+    EVENT_JOIN = "event_join"
+    KINDS = (FRIEND, COMMUNITY_INVITE, COMMUNITY_JOIN, EVENT_INVITE, EVENT_JOIN)
+
+    PENDING = "pending"
+    ACCEPTED = "accepted"
+    DECLINED = "declined"
+    STATUSES = (PENDING, ACCEPTED, DECLINED)
+
+    # Newest first, matching the (recipient_id | sender_id, status, created_at, _id) indexes
+    SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+    def __init__(self, collection, pending_ttl_days=config.inbox_pending_ttl_days,
+                 resolved_ttl_days=config.inbox_resolved_ttl_days, clock=datetime.utcnow):
+        """
+        Initializes the inbox.
+
+        Parameters:
+        - collection (Collection): The inbox collection.
+        - pending_ttl_days (float): How long a request waits for an answer before it expires.
+        - resolved_ttl_days (float): How long an answered request is kept.
+        - clock (callable): Returns the current time as a naive UTC datetime, like PyMongo does.
+        """
+        self.collection = collection
+        self.pending_ttl = timedelta(days=pending_ttl_days)
+        self.resolved_ttl = timedelta(days=resolved_ttl_days)
+        self._clock = clock
+
+    @staticmethod
+    def between(user_id, other_id):
+        """
+        Returns the filter of the requests sent by either user to the other, e.g. a friend request whichever of the
+        two sent it.
+        """
+        return {"$or": [{"sender_id": user_id, "recipient_id": other_id},
+                        {"sender_id": other_id, "recipient_id": user_id}]}
+
+    def new_request(self, kind, sender_id, recipient_id, payload=None):
+        """
+        Returns a pending request document, without storing it.
+        """
+        now = self._clock()
+        return {
+            "request_id": str(uuid.uuid4()),
+            "kind": kind,
+            "sender_id": sender_id,
+            "recipient_id": recipient_id,
+            "status": self.PENDING,
+            "created_at": now,
+            "expires_at": now + self.pending_ttl,
+            "payload": payload or {}
+        }
+
+    def send(self, kind, sender_id, recipient_id, payload=None, session=None):
+        """
+        Stores a new pending request.
+
+        Returns:
+        - dict: The stored request.
+        """
+        document = self.new_request(kind, sender_id, recipient_id, payload)
+        self.collection.insert_one(document, session=session)
+        return document
+
+    def send_many(self, documents, session=None):
+        """
+        Stores requests built with new_request in one round trip.
+
+        Returns:
+        - int: The number of stored requests.
+        """
+        if documents:
+            self.collection.insert_many(documents, ordered=False, session=session)
+        return len(documents)
+
+    def find_request(self, filter, status=PENDING, session=None):
+        """
+        Returns the request matching filter with this status (the newest if several), without answering it, so the
+        users or the event it refers to can be checked before it is answered.
+
+        Returns:
+        - dict: The request, or None if none matches.
+        """
+        return self.collection.find_one({**filter, "status": status}, sort=self.SORT, session=session)
+
+    def answer(self, filter, accept, session=None):
+        """
+        Marks the pending request matching filter as accepted or declined and restarts its expiry.
+
+        Returns:
+        - dict: The answered request, or None if no pending request matches (never sent, expired or already
+          answered).
+        """
+        now = self._clock()
+        return self.collection.find_one_and_update(
+            {**filter, "status": self.PENDING},
+            {"$set": {"status": self.ACCEPTED if accept else self.DECLINED, "answered_at": now,
+                      "expires_at": now + self.resolved_ttl}},
+            sort=self.SORT,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+    def withdraw(self, filter, session=None):
+        """
+        Marks the accepted request matching filter as declined, for a recipient who changes their mind, and
+        restarts its expiry.
+
+        Returns:
+        - dict: The withdrawn request, or None if no accepted request matches.
+        """
+        now = self._clock()
+        return self.collection.find_one_and_update(
+            {**filter, "status": self.ACCEPTED},
+            {"$set": {"status": self.DECLINED, "answered_at": now, "expires_at": now + self.resolved_ttl}},
+            sort=self.SORT,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+    @classmethod
+    def listing_query(cls, owner_id, box="received", status=PENDING, kind=None):
+        """
+        Builds the filter of a listing.
+
+        Parameters:
+        - owner_id (str): The user id, or the community area for community join requests.
+        - box (str): 'received' for the requests sent to the owner, 'sent' for the ones the owner sent.
+        - status (str): One of STATUSES.
+        - kind (str): One of KINDS, or None for every kind.
+
+        Raises:
+            ValueError: If box, status or kind is not one of the allowed values.
+        """
+        if box not in ("received", "sent"):
+            raise ValueError(f"Invalid box: {box}")
+        if status not in cls.STATUSES:
+            raise ValueError(f"Invalid status: {status}")
+        if kind is not None and kind not in cls.KINDS:
+            raise ValueError(f"Invalid kind: {kind}")
+
+        query = {"recipient_id" if box == "received" else "sender_id": owner_id, "status": status}
+        if kind is not None:
+            query["kind"] = kind
+        return query
@@ -0,0 +1,194 @@
+"""
+Declares the indexes every collection needs and makes sure they exist.
+
+Each entry of REQUIRED_INDEXES mirrors a filter the routes use (users by 'id', communities by 'area', night
+watches by 'watch_id', ...). create_app runs IndexManager.bootstrap at startup: missing indexes are created and
+any drift between the declared and the existing indexes is logged.
+
+Usage (from the repository root), to print the drift report without creating anything:
+    python Infrastructure/indexes.py
+"""
+import os
+import sys
+import threading
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import PyMongoError
+
+if __name__ == "__main__":
+    # Make the repository root and the Infrastructure directory importable, like app.py expects
+    infrastructure_path = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, infrastructure_path)
+    sys.path.insert(0, os.path.dirname(infrastructure_path))
+
+from Infrastructure.Files import config
+from Logic.app_logger import setup_logger
+
+# Ensure the log file directory exists
+log_file_path = os.path.join(config.application_file_path, "logs/indexes/indexes.log")
+os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+
+# Initialize the logger
+try:
+    index_logger = setup_logger('index_logger', log_file_path)
+except Exception as e:
+    print(f"Error setting up logger: {e}")
+
+# collection -> [(keys, options)]
+REQUIRED_INDEXES = {
+    "users": [
+        ([("id", ASCENDING)], {"unique": True}),
+        # Only users that have an email take part in the uniqueness check
+        ([("email", ASCENDING)], {"unique": True, "sparse": True}),
+    ],
+    "communities": [
+        ([("area", ASCENDING)], {"unique": True}),
+        ([("communityMembers.id", ASCENDING)], {}),
+        ([("geo", GEOSPHERE)], {}),
+    ],
+    "events": [
+        ([("event_id", ASCENDING)], {"unique": True}),
+        # The events of a community, newest first (see community_summary.py)
+        ([("community_name", ASCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "rsvps": [
+        ([("event_id", ASCENDING), ("user_id", ASCENDING)], {"unique": True}),
+        # Who's coming (or waiting), in the order they answered, and a user's events, soonest first (see attendance.py)
+        ([("event_id", ASCENDING), ("status", ASCENDING), ("responded_at", ASCENDING), ("_id", ASCENDING)], {}),
+        ([("user_id", ASCENDING), ("start_time", ASCENDING), ("_id", ASCENDING)], {}),
+    ],
+    "night_watch": [
+        ([("watch_id", ASCENDING)], {"unique": True}),
+        ([("community_area", ASCENDING), ("watch_date", ASCENDING)], {}),
+    ],
+    "inbox": [
+        ([("request_id", ASCENDING)], {"unique": True}),
+        # A user's (or a community's) requests by status, newest first; '_id' breaks ties for the keyset pagination
+        ([("recipient_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        ([("sender_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        ([("payload.event_id", ASCENDING)], {"sparse": True}),
+        # Requests are deleted by MongoDB once their 'expires_at' has passed
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "posting": [
+        ([("post_id", ASCENDING)], {"unique": True}),
+        # The feed of a community, newest first; '_id' breaks ties for the keyset pagination
+        ([("community_area", ASCENDING), ("post_date", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "comments": [
+        ([("comment_id", ASCENDING)], {"unique": True}),
+        # The thread of a post, oldest first; '_id' breaks ties for the keyset pagination
+        ([("post_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)], {}),
+    ],
+}
+
+# Index options that are part of the declaration and compared by the drift report
+COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+class IndexManager:
+    """
+    Creates the indexes declared in REQUIRED_INDEXES and reports how the existing indexes differ from them.
+    """
+
+    def __init__(self, db, required_indexes=None):
+        """
+        Initializes the manager.
+
+        Parameters:
+        - db (Database): The UrbanHive database.
+        - required_indexes (dict): Declared indexes per collection. Defaults to REQUIRED_INDEXES.
+        """
+        self.db = db
+        self.required_indexes = REQUIRED_INDEXES if required_indexes is None else required_indexes
+
+    def drift(self):
+        """
+        Compares the declared indexes with the ones in the database.
+
+        Returns:
+        - dict: collection -> {"missing": [keys], "mismatched": [(keys, declared, existing)], "unexpected": [keys]},
+          only for collections with drift. Indexes are matched by their keys.
+        """
+        report = {}
+        for collection_name, declared in self.required_indexes.items():
+            existing = {}
+            for info in self.db[collection_name].index_information().values():
+                existing[tuple((field, direction) for field, direction in info["key"])] = info
+
+            missing = []
+            mismatched = []
+            for keys, options in declared:
+                info = existing.pop(tuple(keys), None)
+                if info is None:
+                    missing.append(keys)
+                    continue
+                wanted = {option: options[option] for option in COMPARED_OPTIONS if option in options}
+                # expireAfterSeconds may legitimately be 0, so only unset and False options are left out
+                found = {option: info[option] for option in COMPARED_OPTIONS if info.get(option, False) is not False}
+                if wanted != found:
+                    mismatched.append((keys, wanted, found))
+
+            unexpected = [list(keys) for keys in existing if keys != (("_id", 1),)]
+            if missing or mismatched or unexpected:
+                report[collection_name] = {"missing": missing, "mismatched": mismatched, "unexpected": unexpected}
+        return report
+
+    def ensure_indexes(self):
+        """
+        Creates the declared indexes that do not exist yet, one create_indexes call per collection.
+        Mismatched indexes are only reported; rebuilding them (e.g. making an index unique) is left to an operator.
+
+        Returns:
+        - dict: The drift report taken before the indexes were created.
+        """
+        report = self.drift()
+        for collection_name, collection_drift in report.items():
+            if not collection_drift["missing"]:
+                continue
+            models = [IndexModel(keys, background=True, **options)
+                      for keys, options in self.required_indexes[collection_name]
+                      if keys in collection_drift["missing"]]
+            try:
+                created = self.db[collection_name].create_indexes(models)
+                index_logger.info(f"Created indexes on '{collection_name}': {created}")
+            except PyMongoError as e:
+                # Typically a unique index over existing duplicates; the routes keep working without it
+                index_logger.error(f"Could not create indexes on '{collection_name}': {e}")
+
+        for collection_name, collection_drift in report.items():
+            for keys, wanted, found in collection_drift["mismatched"]:
+                index_logger.warning(f"Index {keys} on '{collection_name}' is {found or 'plain'}, declared {wanted}")
+            for keys in collection_drift["unexpected"]:
+                index_logger.warning(f"Index {keys} on '{collection_name}' is not declared in REQUIRED_INDEXES")
+        return report
+
+    def bootstrap(self, background=True):
+        """
+        Runs ensure_indexes, in a daemon thread when background is True so startup is not blocked by index builds.
+
+        Returns:
+        - threading.Thread or dict: The started thread, or the drift report when run in the foreground.
+        """
+        if not background:
+            return self.ensure_indexes()
+
+        def run():
+            try:
+                self.ensure_indexes()
+            except PyMongoError as e:
+                index_logger.error(f"Index bootstrap failed: {e}")
+
+        thread = threading.Thread(target=run, name="index-bootstrap", daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == "__main__":
+    from database import DataBase
+
+    drift_report = IndexManager(DataBase().db).drift()
+    if not drift_report:
+        print("All declared indexes exist")
+    for name, collection_report in drift_report.items():
+        print(f"{name}: {collection_report}")
@@ -0,0 +1,135 @@
+"""
+Sends event invitations to guest lists of any size.
+
+Every guest gets an 'event_invite' request in the inbox (see inbox.py). The requests are written with one
+insert_many per batch of guests, so inviting 300 guests costs the same single round trip as inviting 3. Guest lists
+longer than the defer threshold are sent by a background worker once the event exists, so add_event returns without
+waiting for them.
+
+Benchmark against one insert per guest (needs a MongoDB server; uses a scratch collection), from the repository
+root:
+    python Infrastructure/invitations.py
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo.errors import PyMongoError
+
+if __name__ == "__main__":
+    # Make the repository root and the Infrastructure directory importable, like app.py expects
+    infrastructure_path = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, infrastructure_path)
+    sys.path.insert(0, os.path.dirname(infrastructure_path))
+
+from Infrastructure.Files import config
+from inbox import Inbox
+from Logic.app_logger import setup_logger
+
+# Ensure the log file directory exists
+log_file_path = os.path.join(config.application_file_path, "logs/invitations/invitations.log")
+os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+
+# Initialize the logger
+try:
+    invitation_logger = setup_logger('invitation_logger', log_file_path)
+except Exception as e:
+    print(f"Error setting up logger: {e}")
+
+
+def unique_guests(guest_list):
+    """
+    Returns the guest ids in their original order without duplicates, so nobody is invited twice.
+    """
+    return list(dict.fromkeys(guest_list))
+
+
+class InvitationFanOut:
+    """
+    Stores an event invitation in the inbox of many guests with batched inserts.
+    """
+
+    def __init__(self, inbox, batch_size=config.invitation_batch_size,
+                 defer_threshold=config.invitation_defer_threshold, max_workers=2):
+        """
+        Initializes the fan-out.
+
+        Parameters:
+        - inbox (Inbox): Where the invitations are stored.
+        - batch_size (int): The number of invitations written by one insert_many.
+        - defer_threshold (int): Guest lists longer than this are sent in the background (see should_defer).
+        - max_workers (int): The number of background workers.
+        """
+        self.inbox = inbox
+        self.batch_size = batch_size
+        self.defer_threshold = defer_threshold
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def should_defer(self, guest_ids):
+        return len(guest_ids) > self.defer_threshold
+
+    def send(self, invitation, sender_id, guest_ids, session=None):
+        """
+        Stores the invitation, sent by sender_id, in the inbox of every guest.
+
+        Returns:
+        - int: The number of invitations sent.
+        """
+        sent = 0
+        for start in range(0, len(guest_ids), self.batch_size):
+            batch = [self.inbox.new_request(Inbox.EVENT_INVITE, sender_id, guest_id, invitation)
+                     for guest_id in guest_ids[start:start + self.batch_size]]
+            sent += self.inbox.send_many(batch, session=session)
+        return sent
+
+    def defer(self, invitation, sender_id, guest_ids):
+        """
+        Sends the invitations from a background worker. Failures are logged, since nobody waits for the result.
+
+        Returns:
+        - Future: Resolves to the number of invitations sent.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="invitations")
+
+        def run():
+            try:
+                return self.send(invitation, sender_id, guest_ids)
+            except PyMongoError as e:
+                invitation_logger.error(f"Sending the invitations of event {invitation.get('event_id')} "
+                                        f"failed: {e}")
+                raise
+
+        return self._executor.submit(run)
+
+
+if __name__ == "__main__":
+    from database import DataBase
+
+    scratch = DataBase().db["invitation_benchmark"]
+    fan_out = InvitationFanOut(Inbox(scratch))
+    invitation = {"event_request": "Benchmark", "event_id": "benchmark"}
+
+    print(f"{'guests':>7} {'per guest ms':>13} {'fan-out ms':>11}")
+    try:
+        for guest_count in (10, 100, 300, 1000, 3000):
+            guest_ids = [f"guest{i}" for i in range(guest_count)]
+            scratch.drop()
+
+            start = time.perf_counter()
+            for guest_id in guest_ids:
+                fan_out.inbox.send(Inbox.EVENT_INVITE, "initiator", guest_id, invitation)
+            per_guest_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            fan_out.send(invitation, "initiator", guest_ids)
+            fan_out_ms = (time.perf_counter() - start) * 1000
+
+            print(f"{guest_count:>7} {per_guest_ms:>13.1f} {fan_out_ms:>11.1f}")
+    finally:
+        scratch.drop()
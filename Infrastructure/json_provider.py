@@ -0,0 +1,135 @@
+"""
+The JSON provider of the Flask application, built on orjson.
+
+Flask 2.3 ignores app.json_encoder, so MongoDB types have to be handled by a JSON provider. This one serializes
+ObjectId (as its hex string), datetime (RFC 3339), bytes (base64) and numpy values natively, which lets the
+routes pass MongoDB documents straight to jsonify without rewriting their '_id' fields.
+
+Benchmark against the standard library encoder (from the repository root):
+    python -m Infrastructure.json_provider
+"""
+import base64
+import datetime
+import json
+import time
+import uuid
+from decimal import Decimal
+
+import orjson
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from flask.json.provider import JSONProvider
+
+# PyMongo returns naive datetimes in UTC
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC
+
+
+def default(obj):
+    """
+    Serializes the types orjson does not handle by itself.
+
+    Raises:
+        TypeError: If the object is not serializable, like json.JSONEncoder.default.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(obj)).decode("ascii")
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class MongoJSONProvider(JSONProvider):
+    """
+    A Flask JSON provider that serializes MongoDB documents with orjson.
+
+    Usage:
+        app.json = MongoJSONProvider(app)
+    """
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        """
+        Serializes obj to a JSON string. Keyword arguments of json.dumps are accepted and ignored.
+        """
+        return orjson.dumps(obj, default=default, option=OPTIONS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        """
+        Deserializes a JSON string or bytes.
+        """
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """
+        Serializes the arguments like jsonify and wraps the bytes in a response without an extra decode.
+        """
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=default, option=OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+class StdlibMongoJSONEncoder(json.JSONEncoder):
+    """
+    The standard library equivalent of the provider, used as the baseline of the benchmark.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, (datetime.datetime, datetime.date)):
+            return obj.isoformat()
+        if isinstance(obj, uuid.UUID):
+            return str(obj)
+        try:
+            return default(obj)
+        except TypeError:
+            return super().default(obj)
+
+
+def main():
+    # Microbenchmark: serialize documents shaped like the users and communities collections
+    now = datetime.datetime.now(datetime.timezone.utc)
+    friends = [{"id": f"{300000000 + i}", "name": f"Friend {i}"} for i in range(50)]
+    user = {
+        "_id": ObjectId(), "id": "311156616", "name": "danor", "email": "danors@gmail.com",
+        "phoneNumber": "1234567890", "location": {"latitude": 37.4219909, "longitude": -122.0839496},
+        "friends": friends, "requests": friends[:10], "communities": ["TestArea", "NewArea"],
+        "events": [{"event_id": str(uuid.uuid4()), "community_name": "TestArea"} for _ in range(20)],
+        "radius": 2.5, "status": 1,
+    }
+    community = {
+        "_id": ObjectId(), "area": "TestArea", "radius": 3,
+        "location": {"latitude": 37.4219909, "longitude": -122.0839496},
+        "geo": {"type": "Point", "coordinates": [-122.0839496, 37.4219909]},
+        "communityMembers": friends * 4,
+        "posts": [{"post_id": str(uuid.uuid4()), "user_id": "311156616", "content": "Lost cat near the park " * 5,
+                   "timestamp": now,
+                   "comments": [{"comment_id": str(uuid.uuid4()), "text": "Seen it!", "timestamp": now}] * 5}
+                  for _ in range(100)],
+    }
+
+    encoder = StdlibMongoJSONEncoder()
+    print(f"{'document':>12} {'size KB':>8} {'stdlib ms':>10} {'orjson ms':>10} {'speedup':>8}")
+    for name, document, repeat in (("user", user, 2000), ("community", community, 200),
+                                    ("user page", {"users": [user] * 100}, 50)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            encoded = encoder.encode(document)
+        stdlib_ms = (time.perf_counter() - start) * 1000 / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            orjson.dumps(document, default=default, option=OPTIONS)
+        orjson_ms = (time.perf_counter() - start) * 1000 / repeat
+
+        print(f"{name:>12} {len(encoded) / 1024:>8.1f} {stdlib_ms:>10.3f} {orjson_ms:>10.3f} "
+              f"{stdlib_ms / orjson_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Keyset pagination for the list endpoints.
+
+Pages are read in '_id' order and each page starts after the last '_id' of the previous one, so every page is an
+index range scan on the default '_id' index no matter how deep the client pages. The position is handed to clients
+as an opaque 'next' token. Collections listed in another order (e.g. the inbox, newest first) pass a sort that ends
+with '_id', and an index matching it; the token then holds the sort values of the last document.
+"""
+import base64
+
+import bson
+from bson.errors import BSONError
+
+from Infrastructure.Files import config
+
+
+class KeysetPagination:
+    """
+    Reads a collection one page at a time, ordered by '_id'.
+
+    Query parameters:
+    - limit: The page size, between 1 and max_limit. Defaults to default_limit.
+    - next: The token returned with the previous page. Omitted for the first page.
+    """
+
+    def __init__(self, default_limit=config.page_default_limit, max_limit=config.page_max_limit):
+        """
+        Initializes the paginator.
+
+        Parameters:
+        - default_limit (int): The page size used when the request has no 'limit'.
+        - max_limit (int): The largest page size a request may ask for.
+        """
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+
+    @staticmethod
+    def encode_token(last_id):
+        """
+        Encodes the '_id' of the last document of a page (or its sort values) into an opaque, URL-safe token.
+        """
+        return base64.urlsafe_b64encode(bson.encode({"after": last_id})).decode("ascii")
+
+    @staticmethod
+    def decode_token(token):
+        """
+        Decodes a token produced by encode_token.
+
+        Raises:
+            ValueError: If the token is malformed.
+        """
+        try:
+            return bson.decode(base64.urlsafe_b64decode(token.encode("ascii")))["after"]
+        except (BSONError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid page token: {token}") from e
+
+    def parse(self, args):
+        """
+        Reads the page size and position of a request.
+
+        Parameters:
+        - args (MultiDict): The request's query parameters.
+
+        Returns:
+        - tuple: (limit, after) where after is the '_id' to continue from, or None for the first page.
+
+        Raises:
+            ValueError: If 'limit' is not an integer in range or 'next' is not a valid token.
+        """
+        limit = args.get('limit', self.default_limit)
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid limit: {limit}")
+        if not 1 <= limit <= self.max_limit:
+            raise ValueError(f"limit must be between 1 and {self.max_limit}")
+
+        token = args.get('next')
+        return limit, self.decode_token(token) if token else None
+
+    @staticmethod
+    def after_filter(sort, after):
+        """
+        Returns the filter of the documents that come after the given position in the sort order, e.g. for
+        [("created_at", -1), ("_id", -1)] the documents created earlier, or at the same time with a smaller '_id'.
+        """
+        if len(sort) == 1:
+            field, direction = sort[0]
+            return {field: {"$gt" if direction == 1 else "$lt": after}}
+        if not isinstance(after, list) or len(after) != len(sort):
+            raise ValueError("Invalid page token for this listing")
+
+        branches = []
+        for position, (field, direction) in enumerate(sort):
+            branch = {previous: value for (previous, _), value in zip(sort[:position], after)}
+            branch[field] = {"$gt" if direction == 1 else "$lt": after[position]}
+            branches.append(branch)
+        return {"$or": branches}
+
+    @classmethod
+    def cursor(cls, collection, limit, after=None, query=None, projection=None, sort=None):
+        """
+        Returns a cursor over one page plus one extra document, which tells whether another page follows.
+        sort defaults to [("_id", 1)]; a longer sort must end with '_id' so every position is unique.
+        """
+        sort = sort or [("_id", 1)]
+        query = dict(query or {})
+        if after is not None:
+            after_query = cls.after_filter(sort, after)
+            query = {"$and": [query, after_query]} if query else after_query
+        return collection.find(query, projection).sort(sort).limit(limit + 1)
+
+    def page(self, collection, limit, after=None, query=None, projection=None, sort=None):
+        """
+        Reads one page.
+
+        Returns:
+        - tuple: (documents, next_token) where next_token is None on the last page.
+        """
+        # The '_id' is needed for the token even when the client excluded it; it is dropped after paging
+        hide_id = bool(projection) and projection.get("_id") == 0
+        if hide_id:
+            projection = {name: value for name, value in projection.items() if name != "_id"} or None
+
+        documents = list(self.cursor(collection, limit, after, query, projection, sort))
+        next_token = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            last = documents[-1]
+            if sort and len(sort) > 1:
+                next_token = self.encode_token([last.get(field) for field, _ in sort])
+            else:
+                next_token = self.encode_token(last[sort[0][0] if sort else "_id"])
+
+        if hide_id:
+            for document in documents:
+                document.pop("_id", None)
+        return documents, next_token
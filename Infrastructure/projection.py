@@ -0,0 +1,83 @@
+"""
+Field projections for the read endpoints.
+
+Clients pass ?fields=id,name (only these fields) or ?exclude=friends,requests (everything but these) and the
+list becomes a MongoDB projection, so large embedded arrays that a view does not need are never read or sent.
+Nested fields use dot notation, e.g. ?fields=area,communityMembers.id.
+"""
+
+
+class FieldProjection:
+    """
+    Turns the 'fields' and 'exclude' query parameters into MongoDB projections.
+    """
+
+    MAX_FIELDS = 50
+
+    @staticmethod
+    def parse(args):
+        """
+        Reads the projection of a request.
+
+        Parameters:
+        - args (MultiDict): The request's query parameters.
+
+        Returns:
+        - dict or None: {"field": 1, ...} for 'fields', {"field": 0, ...} for 'exclude', None if neither is given.
+
+        Raises:
+            ValueError: If both parameters are given or a field name is invalid.
+        """
+        fields = args.get('fields')
+        exclude = args.get('exclude')
+        if fields and exclude:
+            raise ValueError("Use either fields or exclude, not both")
+        if not fields and not exclude:
+            return None
+
+        names = [name.strip() for name in (fields or exclude).split(',')]
+        if len(names) > FieldProjection.MAX_FIELDS:
+            raise ValueError(f"At most {FieldProjection.MAX_FIELDS} fields can be selected")
+        for name in names:
+            if not name or name.startswith('$') or '..' in name or name.startswith('.') or name.endswith('.'):
+                raise ValueError(f"Invalid field name: '{name}'")
+
+        value = 1 if fields else 0
+        return {name: value for name in names}
+
+    @staticmethod
+    def hide(projection, *hidden):
+        """
+        Returns a projection that never returns the given fields, whatever the client asked for.
+
+        Parameters:
+        - projection (dict or None): A projection returned by parse.
+        - hidden (str): Fields to leave out, e.g. 'password'.
+
+        Returns:
+        - dict: The projection with the hidden fields removed (inclusion) or excluded (exclusion or None).
+
+        Raises:
+            ValueError: If the client asked only for hidden fields.
+        """
+        if projection and 1 in projection.values():
+            visible = {name: value for name, value in projection.items()
+                       if name not in hidden and not any(name.startswith(field + '.') for field in hidden)}
+            if '_id' in hidden:
+                visible['_id'] = 0
+            # Asking only for hidden fields would leave an empty inclusion, which returns whole documents
+            if not any(value == 1 for value in visible.values()):
+                raise ValueError("None of the requested fields can be returned")
+            return visible
+        return {**(projection or {}), **{field: 0 for field in hidden}}
+
+    @staticmethod
+    def includes(projection, field):
+        """
+        Returns whether documents read with the projection contain the given top-level field.
+        """
+        if not projection:
+            return True
+        if 1 in projection.values():
+            return field in projection
+        return projection.get(field) != 0
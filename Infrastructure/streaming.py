@@ -0,0 +1,57 @@
+"""
+Streaming JSON responses for bulk reads.
+
+Instead of loading a whole collection into a list and serializing it with jsonify, the cursor is iterated in
+batches and every document is written out as one element of a JSON array as soon as it is read. Worker memory
+stays at about one cursor batch and the first bytes reach the client right away.
+"""
+from flask import Response, current_app, stream_with_context
+
+from Infrastructure.Files import config
+
+
+def wants_stream(args):
+    """
+    Returns True if the request asked for the streaming mode with ?stream=1 (or true).
+    """
+    return args.get('stream', '').lower() in ('1', 'true')
+
+
+def stream_json_array(cursor, prefix='', suffix='', transform=None, logger=None,
+                      batch_size=config.stream_batch_size):
+    """
+    Returns a response that streams the documents of a cursor as a JSON array.
+
+    Parameters:
+    - cursor (Cursor): The PyMongo cursor to stream. It is read batch_size documents per round trip.
+    - prefix (str): JSON written before the array, e.g. '{"users": ' to wrap it in an object.
+    - suffix (str): JSON written after the array, e.g. '}'.
+    - transform (callable): Applied to every document before it is serialized.
+    - logger (Logger): Where an error raised mid-stream is logged. The status code has been sent by then,
+      so the client sees a truncated (invalid) JSON document.
+    - batch_size (int): Documents fetched per round trip.
+
+    Returns:
+    - Response: A chunked 'application/json' response.
+    """
+    cursor = cursor.batch_size(batch_size)
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield prefix + '['
+        try:
+            separator = ''
+            for document in cursor:
+                if transform is not None:
+                    document = transform(document)
+                yield separator + dumps(document)
+                separator = ','
+        except Exception as e:
+            if logger is not None:
+                logger.error(f"Streaming stopped: {e}")
+            raise
+        finally:
+            cursor.close()
+        yield ']' + suffix
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,122 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class EntityCache:
+    """
+    An LRU/TTL cache of documents keyed by (collection, key), e.g. ("users", "311156616").
+
+    Entries are dropped when they expire, when the cache is full (least recently used first) and when a write
+    invalidates them. Every collection has its own generation counter, so a document read before a write to its
+    collection is not stored after it. Documents are copied on the way in and out, so callers may modify them.
+    """
+
+    def __init__(self, max_entries=2048, ttl_seconds=30.0, clock=time.monotonic):
+        """
+        Initializes an empty cache.
+
+        Parameters:
+        - max_entries (int): The number of documents kept before the least recently used one is evicted.
+        - ttl_seconds (float): How long a document may be served after it was stored.
+        - clock (callable): Returns the current time in seconds.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+
+        self._entries = OrderedDict()  # (collection, key) -> (stored_at, document)
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._counters = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _count(self, collection, counter, amount=1):
+        counters = self._counters.setdefault(collection, {"hits": 0, "misses": 0, "evictions": 0,
+                                                          "expirations": 0, "invalidations": 0})
+        counters[counter] += amount
+
+    def generation(self, collection):
+        """
+        Returns the generation of a collection, to be passed to put with a document read afterwards.
+        """
+        with self._lock:
+            return self._generations.get(collection, 0)
+
+    def get(self, collection, key):
+        """
+        Returns a copy of the cached document, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get((collection, key))
+            if entry is not None and self._clock() - entry[0] > self.ttl_seconds:
+                del self._entries[(collection, key)]
+                self._count(collection, "expirations")
+                entry = None
+
+            if entry is None:
+                self._count(collection, "misses")
+                return None
+
+            self._entries.move_to_end((collection, key))
+            self._count(collection, "hits")
+            document = entry[1]
+        return copy.deepcopy(document)
+
+    def put(self, collection, key, document, generation):
+        """
+        Stores a copy of a document, unless its collection was written to since generation was read.
+        """
+        document = copy.deepcopy(document)
+        with self._lock:
+            if generation != self._generations.get(collection, 0):
+                return
+            self._entries[(collection, key)] = (self._clock(), document)
+            self._entries.move_to_end((collection, key))
+            while len(self._entries) > self.max_entries:
+                (evicted_collection, _), _ = self._entries.popitem(last=False)
+                self._count(evicted_collection, "evictions")
+
+    def invalidate(self, collection, key=None):
+        """
+        Drops the document of a key, or every document of the collection when key is None.
+        """
+        with self._lock:
+            if key is None:
+                stale = [entry_key for entry_key in self._entries if entry_key[0] == collection]
+            else:
+                stale = [(collection, key)] if (collection, key) in self._entries else []
+            for entry_key in stale:
+                del self._entries[entry_key]
+            self._count(collection, "invalidations", len(stale))
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+
+    def clear(self):
+        """
+        Drops every document. The counters are kept.
+        """
+        with self._lock:
+            for collection, _ in self._entries:
+                self._count(collection, "invalidations")
+            self._entries.clear()
+            for collection in list(self._generations):
+                self._generations[collection] += 1
+
+    def stats(self):
+        """
+        Returns per-collection entry counts, hit/miss counts, hit ratios, and eviction, expiration and
+        invalidation counts.
+        """
+        with self._lock:
+            report = {}
+            for collection, counters in self._counters.items():
+                lookups = counters["hits"] + counters["misses"]
+                report[collection] = {
+                    "entries": sum(1 for entry_key in self._entries if entry_key[0] == collection),
+                    **counters,
+                    "hit_ratio": counters["hits"] / lookups if lookups else None
+                }
+            return report
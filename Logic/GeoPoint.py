@@ -0,0 +1,31 @@
+class GeoPoint:
+    """
+    Helpers for converting the app's {'latitude', 'longitude'} location dictionaries into the
+    GeoJSON representation MongoDB needs for 2dsphere indexes and geospatial queries.
+    """
+
+    @staticmethod
+    def from_location(location):
+        """
+        Convert a location dictionary into a GeoJSON Point.
+
+        Parameters:
+        - location (dict): A dictionary with 'latitude' and 'longitude' keys. Values may be numbers or
+          numeric strings, as older documents store them as strings.
+
+        Returns:
+        - dict: A GeoJSON Point, e.g. {"type": "Point", "coordinates": [longitude, latitude]}.
+
+        Raises:
+        - KeyError: If the latitude or longitude key is missing.
+        - ValueError: If the coordinates are not numeric or are outside the valid range.
+        """
+        latitude = float(location["latitude"])
+        longitude = float(location["longitude"])
+
+        # MongoDB rejects 2dsphere keys outside these ranges, so fail early with a clear error
+        if not -90.0 <= latitude <= 90.0 or not -180.0 <= longitude <= 180.0:
+            raise ValueError(f"Coordinates out of range: latitude={latitude}, longitude={longitude}")
+
+        # GeoJSON orders coordinates as [longitude, latitude]
+        return {"type": "Point", "coordinates": [longitude, latitude]}
@@ -0,0 +1,74 @@
+class Geohash:
+    """
+    Encoding of coordinates into geohash strings, where every extra character narrows the cell.
+    Nearby coordinates share a prefix, which makes geohashes convenient for snapping locations to a grid.
+    """
+
+    BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+    @staticmethod
+    def encode(latitude, longitude, precision=6):
+        """
+        Encode coordinates into a geohash.
+
+        Parameters:
+        - latitude (float): Latitude in degrees.
+        - longitude (float): Longitude in degrees.
+        - precision (int): Number of characters (6 characters is a cell of about 1.2 km x 0.6 km).
+
+        Returns:
+        - str: The geohash of the cell containing the coordinates.
+        """
+        lat_range = [-90.0, 90.0]
+        lon_range = [-180.0, 180.0]
+        geohash = []
+        bits = 0
+        bit_count = 0
+        even_bit = True  # geohash bits alternate between longitude and latitude, starting with longitude
+
+        while len(geohash) < precision:
+            value, value_range = (longitude, lon_range) if even_bit else (latitude, lat_range)
+            middle = (value_range[0] + value_range[1]) / 2
+            bits <<= 1
+            if value >= middle:
+                bits |= 1
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            even_bit = not even_bit
+
+            bit_count += 1
+            if bit_count == 5:
+                geohash.append(Geohash.BASE32[bits])
+                bits = 0
+                bit_count = 0
+
+        return "".join(geohash)
+
+    @staticmethod
+    def bounds(geohash):
+        """
+        Decode a geohash into the bounds of its cell.
+
+        Parameters:
+        - geohash (str): A geohash string.
+
+        Returns:
+        - tuple: (min_lat, max_lat, min_lon, max_lon) in degrees.
+        """
+        lat_range = [-90.0, 90.0]
+        lon_range = [-180.0, 180.0]
+        even_bit = True
+
+        for character in geohash:
+            bits = Geohash.BASE32.index(character)
+            for shift in range(4, -1, -1):
+                value_range = lon_range if even_bit else lat_range
+                middle = (value_range[0] + value_range[1]) / 2
+                if (bits >> shift) & 1:
+                    value_range[0] = middle
+                else:
+                    value_range[1] = middle
+                even_bit = not even_bit
+
+        return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
@@ -1,4 +1,43 @@
-import math
+from functools import lru_cache
+
+import numpy as np
+
+from Logic.PositionAssignmentSolver import PositionAssignmentSolver
+
+# Earth's radius in kilometers (approximation)
+EARTH_RADIUS_KM = 6371.0
+
+
+@lru_cache(maxsize=1024)
+def _circle_layout(lat, lon, radius, points_amount):
+    """
+    Computes the positions of a circle layout in one vectorized pass. Results are memoized by
+    (center, radius, count), so recalculating an unchanged watch is a dictionary lookup.
+
+    Returns:
+    - tuple: (latitudes, longitudes) as tuples of floats in degrees.
+    """
+    # Convert latitude and longitude from degrees to radians for calculation
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+
+    # Calculate angular distance covered on Earth's surface for the given radius
+    angular_distance = radius / EARTH_RADIUS_KM
+
+    # The center and the radius are shared by every point, so their trigonometry is computed only once
+    sin_lat, cos_lat = np.sin(lat_rad), np.cos(lat_rad)
+    sin_distance, cos_distance = np.sin(angular_distance), np.cos(angular_distance)
+
+    # Bearings of all the points, evenly spaced around the circle
+    angles = np.radians(np.arange(points_amount) * (360 / points_amount))
+
+    # Calculate the latitudes and longitudes of all the points using spherical trigonometry
+    point_lat_rad = np.arcsin(sin_lat * cos_distance + cos_lat * sin_distance * np.cos(angles))
+    point_lon_rad = lon_rad + np.arctan2(np.sin(angles) * sin_distance * cos_lat,
+                                         cos_distance - sin_lat * np.sin(point_lat_rad))
+
+    # Convert the points' latitudes and longitudes back to degrees from radians
+    return tuple(np.degrees(point_lat_rad).tolist()), tuple(np.degrees(point_lon_rad).tolist())
 
 
 class NightWatchPositionsCalculator:
@@ -13,9 +52,9 @@ class NightWatchPositionsCalculator:
         Parameters:
         - location (dict): A dictionary with 'latitude' and 'longitude' keys for the central location.
         """
-        # Store latitude and longitude from the provided location dictionary
-        self.lat = location["latitude"]
-        self.lon = location["longitude"]
+        # Store latitude and longitude from the provided location dictionary (older documents store strings)
+        self.lat = float(location["latitude"])
+        self.lon = float(location["longitude"])
 
     def generate_circle_positions(self, radius, points_amount):
         """
@@ -28,53 +67,84 @@ class NightWatchPositionsCalculator:
         Returns:
         - list: A list of dictionaries, each containing the 'Latitude' and 'Longitude' of a point.
         """
-        # Convert latitude and longitude from degrees to radians for calculation
-        lat_rad = math.radians(self.lat)
-        lon_rad = math.radians(self.lon)
-
-        # Earth's radius in kilometers (approximation)
-        earth_radius = 6371.0
+        if points_amount <= 0:
+            return []
 
-        # Calculate angular distance covered on Earth's surface for the given radius
-        angular_distance = radius / earth_radius
+        latitudes, longitudes = _circle_layout(self.lat, self.lon, float(radius), int(points_amount))
 
-        # Initialize a list to hold the generated positions
-        points = []
-        for i in range(points_amount):
-            # Calculate the angle for this point
-            angle = math.radians((360 / points_amount) * i)
+        # Build fresh dictionaries so callers can't modify the memoized layout
+        return [{"Latitude": point_lat, "Longitude": point_lon} for point_lat, point_lon in zip(latitudes, longitudes)]
 
-            # Calculate the latitude and longitude of the point using spherical trigonometry
-            point_lat_rad = math.asin(math.sin(lat_rad) * math.cos(angular_distance) +
-                                      math.cos(lat_rad) * math.sin(angular_distance) * math.cos(angle))
-            point_lon_rad = lon_rad + math.atan2(math.sin(angle) * math.sin(angular_distance) * math.cos(lat_rad),
-                                                 math.cos(angular_distance) - math.sin(lat_rad) * math.sin(
-                                                     point_lat_rad))
-
-            # Convert the point's latitude and longitude back to degrees from radians
-            point_lat = math.degrees(point_lat_rad)
-            point_lon = math.degrees(point_lon_rad)
-
-            # Add the point to the list as a dictionary
-            points.append({"Latitude": point_lat, "Longitude": point_lon})
+    @staticmethod
+    def layout_cache_info():
+        """
+        Returns the hit, miss and size counters of the memoized circle layouts.
+        """
+        return _circle_layout.cache_info()
 
-        return points
+    @staticmethod
+    def member_coordinates(member):
+        """
+        Returns the (latitude, longitude) of a member's stored location, or None if it is missing or invalid.
+        """
+        try:
+            return float(member["location"]["latitude"]), float(member["location"]["longitude"])
+        except (KeyError, TypeError, ValueError):
+            return None
 
-    def assign_member_to_position(self, positions, members):
+    def assign_member_to_position(self, positions, members, objective="total"):
         """
-        Assigns members to specified positions.
+        Assigns members to specified positions, minimizing how far the members travel from their stored
+        locations. Members without a location take the positions left over by the others.
 
         Parameters:
         - positions (list): A list of dictionaries containing position 'Latitude' and 'Longitude'.
-        - members (list): A list of dictionaries, each containing 'id' and 'name' of a member.
+        - members (list): A list of dictionaries, each containing 'id' and 'name' of a member, and optionally
+          their 'location' with 'latitude' and 'longitude'.
+        - objective (str): "total" minimizes the total travel distance, "max" the longest single trip.
 
         Returns:
-        - list: A list of dictionaries, each representing a member with their 'id', 'name', and assigned 'position'.
+        - list: A list of dictionaries, each representing a member with their 'id', 'name', assigned 'position',
+          and the 'slot' (index of the position in the positions list).
         """
+        if not positions or not members:
+            return []
+
+        # Distance matrix in one vectorized pass; rows of members without a location stay 0 (no preference)
+        distances = np.zeros((len(members), len(positions)))
+        located = [(row, coordinates) for row, coordinates in enumerate(map(self.member_coordinates, members))
+                   if coordinates is not None]
+        if located:
+            rows, coordinates = zip(*located)
+            member_lat, member_lon = zip(*coordinates)
+            distances[list(rows)] = PositionAssignmentSolver.distance_matrix(
+                member_lat, member_lon,
+                [position["Latitude"] for position in positions], [position["Longitude"] for position in positions])
+
         # Initialize a list to hold the information about members and their assigned positions
         inlays = []
-        for pos, mem in zip(positions, members):
+        for row, slot in sorted(PositionAssignmentSolver().solve(distances, objective)):
             # Combine the member info with their assigned position into a new dictionary
-            inlay = {"id": mem["id"], "name": mem["name"], "position": pos}
+            member = members[row]
+            inlay = {"id": member["id"], "name": member["name"], "position": positions[slot], "slot": slot}
             inlays.append(inlay)
         return inlays
+
+    def nearest_free_slot(self, positions, free_slots, member):
+        """
+        Returns the free slot closest to a member's stored location, or the first free slot if the member has
+        no location.
+
+        Parameters:
+        - positions (list): A list of dictionaries containing position 'Latitude' and 'Longitude'.
+        - free_slots (list): Indexes of the positions nobody holds.
+        - member (dict): The member, optionally with a 'location'.
+        """
+        coordinates = self.member_coordinates(member)
+        if coordinates is None:
+            return free_slots[0]
+
+        distances = PositionAssignmentSolver.distance_matrix(
+            [coordinates[0]], [coordinates[1]],
+            [positions[slot]["Latitude"] for slot in free_slots], [positions[slot]["Longitude"] for slot in free_slots])
+        return free_slots[int(np.argmin(distances[0]))]
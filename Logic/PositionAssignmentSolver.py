@@ -0,0 +1,172 @@
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from Logic.RadiusCalculator import RadiusCalculator
+
+
+class PositionAssignmentSolver:
+    """
+    Assigns night watch members to positions so that the members travel as little as possible.
+
+    The objective is either the total travel distance ("total") or the longest single trip ("max").
+    Watches up to hungarian_limit members are solved exactly with the Hungarian algorithm; larger ones use a
+    greedy assignment improved by pairwise swaps until the time budget runs out.
+    """
+
+    def __init__(self, hungarian_limit=1000, time_budget=0.05):
+        """
+        Initializes the solver.
+
+        Parameters:
+        - hungarian_limit (int): The largest number of members solved exactly.
+        - time_budget (float): Seconds the heuristic may spend improving the greedy assignment.
+        """
+        self.hungarian_limit = hungarian_limit
+        self.time_budget = time_budget
+
+    @staticmethod
+    def distance_matrix(member_latitudes, member_longitudes, position_latitudes, position_longitudes):
+        """
+        Calculates the Haversine distance from every member to every position in one vectorized pass.
+
+        Returns:
+        - numpy.ndarray: A (members, positions) float64 matrix of distances in kilometers.
+        """
+        member_lat = np.radians(np.asarray(member_latitudes, dtype=np.float64))[:, None]
+        member_lon = np.radians(np.asarray(member_longitudes, dtype=np.float64))[:, None]
+        position_lat = np.radians(np.asarray(position_latitudes, dtype=np.float64))[None, :]
+        position_lon = np.radians(np.asarray(position_longitudes, dtype=np.float64))[None, :]
+
+        a = (np.sin((position_lat - member_lat) / 2) ** 2 +
+             np.cos(member_lat) * np.cos(position_lat) * np.sin((position_lon - member_lon) / 2) ** 2)
+        return 2 * RadiusCalculator.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def solve(self, distances, objective="total"):
+        """
+        Finds an assignment of members (rows) to positions (columns). Every member gets a distinct position
+        as long as there are enough positions; otherwise only as many members as positions are assigned.
+
+        Parameters:
+        - distances (numpy.ndarray): A (members, positions) distance matrix.
+        - objective (str): "total" minimizes the sum of the distances, "max" minimizes the longest distance
+          (and then the sum among the assignments with that longest distance).
+
+        Returns:
+        - list: (member index, position index) pairs.
+        """
+        distances = np.asarray(distances, dtype=np.float64)
+        if distances.size == 0:
+            return []
+        if objective not in ("total", "max"):
+            raise ValueError(f"Unknown assignment objective: {objective}")
+
+        if min(distances.shape) > self.hungarian_limit:
+            return self._greedy(distances, objective)
+        if objective == "max":
+            return self._bottleneck(distances)
+
+        rows, columns = linear_sum_assignment(distances)
+        return list(zip(rows.tolist(), columns.tolist()))
+
+    def _bottleneck(self, distances):
+        """
+        Minimizes the longest distance by binary searching the smallest threshold that still allows a full
+        assignment, then minimizes the total distance using only pairs within that threshold.
+        """
+        assigned = min(distances.shape)
+        thresholds = np.unique(distances)
+        penalty = float(distances.max()) * assigned + 1.0
+
+        low, high = 0, len(thresholds) - 1
+        while low < high:
+            middle = (low + high) // 2
+            over = (distances > thresholds[middle]).astype(np.float64)
+            rows, columns = linear_sum_assignment(over)
+            if over[rows, columns].sum() == 0:
+                high = middle
+            else:
+                low = middle + 1
+
+        cost = np.where(distances > thresholds[low], penalty, distances)
+        rows, columns = linear_sum_assignment(cost)
+        return list(zip(rows.tolist(), columns.tolist()))
+
+    def _greedy(self, distances, objective):
+        """
+        Assigns every member their nearest free position, then swaps the positions of member pairs while it
+        improves the objective and the time budget allows.
+        """
+        deadline = time.perf_counter() + self.time_budget
+        members, positions = distances.shape
+
+        # Members whose nearest position is closest pick first, each taking their nearest free position
+        position_of = np.full(members, -1)
+        free = np.ones(positions, dtype=bool)
+        for member in np.argsort(distances.min(axis=1), kind="stable")[:positions]:
+            position = int(np.argmin(np.where(free, distances[member], np.inf)))
+            position_of[member] = position
+            free[position] = False
+
+        assigned = np.flatnonzero(position_of >= 0)
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for member in assigned:
+                if time.perf_counter() >= deadline:
+                    break
+                current = distances[member, position_of[member]]
+                others = position_of[assigned]
+                # Cost of swapping this member's position with each other assigned member, all at once
+                swapped_self = distances[member, others]
+                swapped_other = distances[assigned, position_of[member]]
+                if objective == "max":
+                    before = np.maximum(current, distances[assigned, others])
+                    gain = before - np.maximum(swapped_self, swapped_other)
+                else:
+                    gain = current + distances[assigned, others] - swapped_self - swapped_other
+                best = int(np.argmax(gain))
+                if gain[best] > 1e-12:
+                    other = assigned[best]
+                    position_of[member], position_of[other] = position_of[other], position_of[member]
+                    improved = True
+
+        return [(int(member), int(position_of[member])) for member in assigned]
+
+
+def main():
+    # Benchmark: solve time versus member count, for members scattered around a neighborhood.
+    # Run from the repository root with: python -m Logic.PositionAssignmentSolver
+    solver = PositionAssignmentSolver()
+    rng = np.random.default_rng(0)
+    center_lat, center_lon = 37.7749, -122.4194
+
+    print(f"{'members':>8} {'method':>10} {'objective':>9} {'seconds':>9} {'total km':>9} {'max km':>7}")
+    for members in (10, 50, 100, 200, 500, 1000, 2000, 4000):
+        angles = np.linspace(0, 2 * np.pi, members, endpoint=False)
+        position_lat = center_lat + 0.01 * np.sin(angles)
+        position_lon = center_lon + 0.013 * np.cos(angles)
+        member_lat = center_lat + rng.uniform(-0.02, 0.02, members)
+        member_lon = center_lon + rng.uniform(-0.025, 0.025, members)
+
+        start = time.perf_counter()
+        distances = solver.distance_matrix(member_lat, member_lon, position_lat, position_lon)
+        matrix_seconds = time.perf_counter() - start
+
+        for objective in ("total", "max"):
+            start = time.perf_counter()
+            pairs = solver.solve(distances, objective)
+            seconds = time.perf_counter() - start
+            trips = distances[tuple(np.array(pairs).T)]
+            method = "hungarian" if members <= solver.hungarian_limit else "greedy"
+            print(f"{members:>8} {method:>10} {objective:>9} {seconds:>9.4f} {trips.sum():>9.2f} {trips.max():>7.3f}")
+
+        # The previous behaviour, zipping members with positions in list order, for comparison
+        zipped = distances[np.arange(members), np.arange(members)]
+        print(f"{members:>8} {'list order':>10} {'':>9} {'':>9} {zipped.sum():>9.2f} {zipped.max():>7.3f}")
+        print(f"{members:>8} distance matrix built in {matrix_seconds:.4f} seconds")
+
+
+if __name__ == "__main__":
+    main()
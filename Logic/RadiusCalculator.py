@@ -1,7 +1,19 @@
-from math import radians, sin, cos, sqrt, atan2
+from math import radians, degrees, sin, cos, sqrt, atan2, asin
+
+import numpy as np
 
 
 class RadiusCalculator:
+    # Mean radius of the Earth in kilometers.
+    EARTH_RADIUS_KM = 6371.0
+
+    # The fast tier uses the equirectangular approximation only for radii up to this size (km)...
+    FAST_MAX_RADIUS_KM = 50.0
+    # ...and only for centers closer to the equator than this latitude (degrees).
+    FAST_MAX_LATITUDE = 70.0
+    # Approximated distances within this fraction of the radius from the boundary are re-checked exactly.
+    FAST_BOUNDARY_TOLERANCE = 0.01
+
     def calculate_distance(self, lat1, lon1, lat2, lon2):
         """
         Calculate the great-circle distance between two points on the Earth using the Haversine formula.
@@ -16,7 +28,7 @@ class RadiusCalculator:
         float: Distance between the two points in kilometers.
         """
         # Radius of the Earth in kilometers.
-        radius_of_earth = 6371.0
+        radius_of_earth = self.EARTH_RADIUS_KM
 
         # Convert latitude and longitude from degrees to radians for the Haversine formula.
         lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
@@ -35,6 +47,172 @@ class RadiusCalculator:
 
         return distance
 
+    def distances_from(self, center_location, latitudes, longitudes):
+        """
+        Calculate the Haversine distance from a center location to many points in one vectorized pass.
+
+        Parameters:
+        center_location (tuple): A tuple (lat, lon) representing the center location, in degrees.
+        latitudes (array-like): Latitudes of the points in degrees (converted to a float64 NumPy column).
+        longitudes (array-like): Longitudes of the points in degrees, in the same order as latitudes.
+
+        Returns:
+        numpy.ndarray: A float64 array with the distance of each point from the center, in kilometers.
+        """
+        latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+
+        # The center is fixed, so convert it to radians and take its cosine only once.
+        center_lat = radians(float(center_location[0]))
+        center_lon = radians(float(center_location[1]))
+
+        a = (np.sin((latitudes - center_lat) / 2) ** 2 +
+             cos(center_lat) * np.cos(latitudes) * np.sin((longitudes - center_lon) / 2) ** 2)
+
+        # 2 * asin(sqrt(a)) equals 2 * atan2(sqrt(a), sqrt(1 - a)); clipping guards against rounding above 1.
+        return 2 * self.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def bounding_box(self, center_location, radius):
+        """
+        Calculate the latitude/longitude box that encloses a circle on the Earth.
+
+        Parameters:
+        center_location (tuple): A tuple (lat, lon) representing the center of the circle, in degrees.
+        radius (float): The radius of the circle in kilometers.
+
+        Returns:
+        tuple: (min_lat, max_lat, lon_delta) in degrees. Points inside the circle have a latitude between
+               min_lat and max_lat and a longitude within lon_delta of the center. lon_delta is None when the
+               circle contains a pole, in which case every longitude is inside the box.
+        """
+        center_lat = float(center_location[0])
+        angular_radius = radius / self.EARTH_RADIUS_KM
+        lat_delta = degrees(angular_radius)
+        min_lat = center_lat - lat_delta
+        max_lat = center_lat + lat_delta
+
+        cos_lat = cos(radians(center_lat))
+        if min_lat <= -90.0 or max_lat >= 90.0 or sin(angular_radius) >= cos_lat:
+            return max(min_lat, -90.0), min(max_lat, 90.0), None
+
+        # Widest longitude offset of the circle (reached north/south of the center's parallel)
+        return min_lat, max_lat, degrees(asin(sin(angular_radius) / cos_lat))
+
+    def within_radius(self, center_location, radius, latitudes, longitudes, mode="exact"):
+        """
+        Find which points lie within a radius of a center location, working on coordinate columns.
+
+        Parameters:
+        center_location (tuple): A tuple (lat, lon) representing the center location.
+        radius (float): The radius within which to find points, in kilometers.
+        latitudes (array-like): Latitudes of the points in degrees.
+        longitudes (array-like): Longitudes of the points in degrees.
+        mode (str): "exact" runs the Haversine formula on every point. "fast" first rejects points outside the
+                    bounding box of the circle, then approximates distances inside it (see within_radius_fast).
+
+        Returns:
+        tuple: (distances, mask) where distances is a float64 array in kilometers and mask is a boolean
+               array that is True for every point within the radius. In "fast" mode, points rejected by the
+               bounding box get an infinite distance.
+        """
+        if mode == "exact":
+            distances = self.distances_from(center_location, latitudes, longitudes)
+            return distances, distances <= radius
+        if mode == "fast":
+            distances, mask, _ = self.within_radius_fast(center_location, radius, latitudes, longitudes)
+            return distances, mask
+        raise ValueError(f"Unknown distance mode: {mode}")
+
+    def within_radius_fast(self, center_location, radius, latitudes, longitudes):
+        """
+        Find which points lie within a radius of a center location using cheap tiers before Haversine.
+
+        1. Points outside the bounding box of the circle are rejected with comparisons only.
+        2. For small radii away from the poles, distances inside the box use the equirectangular
+           approximation, which needs no per-point trigonometry.
+        3. Points whose approximate distance is close to the radius, and every point when the radius is large
+           or the center is at a high latitude, are measured with the exact Haversine formula.
+
+        Parameters:
+        center_location (tuple): A tuple (lat, lon) representing the center location.
+        radius (float): The radius within which to find points, in kilometers.
+        latitudes (array-like): Latitudes of the points in degrees.
+        longitudes (array-like): Longitudes of the points in degrees.
+
+        Returns:
+        tuple: (distances, mask, tiers) where distances is a float64 array in kilometers (infinite for points
+               rejected by the bounding box), mask is a boolean array of the points within the radius, and tiers
+               is a dict counting how many points each tier handled.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        center_lat = float(center_location[0])
+        center_lon = float(center_location[1])
+
+        # Tier 1: bounding box. Longitude offsets are wrapped into [-180, 180) to handle the antimeridian.
+        min_lat, max_lat, lon_delta = self.bounding_box(center_location, radius)
+        lon_offsets = (longitudes - center_lon + 180.0) % 360.0 - 180.0
+        in_box = (latitudes >= min_lat) & (latitudes <= max_lat)
+        if lon_delta is not None:
+            in_box &= np.abs(lon_offsets) <= lon_delta
+
+        distances = np.full(latitudes.shape, np.inf)
+        candidates = in_box.nonzero()[0]
+        tiers = {"rejected_by_box": int(len(latitudes) - len(candidates)), "approximated": 0, "exact": 0}
+
+        if radius <= self.FAST_MAX_RADIUS_KM and abs(center_lat) <= self.FAST_MAX_LATITUDE:
+            # Tier 2: equirectangular approximation, scaling longitude by the cosine of the center latitude.
+            scale = radians(1.0) * self.EARTH_RADIUS_KM
+            x = lon_offsets[candidates] * cos(radians(center_lat))
+            y = latitudes[candidates] - center_lat
+            distances[candidates] = scale * np.sqrt(x * x + y * y)
+
+            # Tier 3 only for the points near the boundary, where the approximation could flip the answer.
+            near_boundary = candidates[np.abs(distances[candidates] - radius) <= radius * self.FAST_BOUNDARY_TOLERANCE]
+            tiers["approximated"] = int(len(candidates) - len(near_boundary))
+        else:
+            near_boundary = candidates
+
+        # Tier 3: exact Haversine.
+        if len(near_boundary):
+            distances[near_boundary] = self.distances_from(center_location, latitudes[near_boundary],
+                                                           longitudes[near_boundary])
+        tiers["exact"] = int(len(near_boundary))
+
+        return distances, distances <= radius, tiers
+
+    def accuracy_report(self, center_location, radius, latitudes, longitudes):
+        """
+        Compare the fast tier against the exact Haversine formula on the same points.
+
+        Parameters:
+        center_location (tuple): A tuple (lat, lon) representing the center location.
+        radius (float): The radius in kilometers.
+        latitudes (array-like): Latitudes of the points in degrees.
+        longitudes (array-like): Longitudes of the points in degrees.
+
+        Returns:
+        dict: The tier counts of the fast run, the maximum and mean absolute distance error (km) and the maximum
+              relative error over the points the fast tier measured, and how many points were classified
+              differently (mask_mismatches should be 0).
+        """
+        exact_distances = self.distances_from(center_location, latitudes, longitudes)
+        fast_distances, fast_mask, tiers = self.within_radius_fast(center_location, radius, latitudes, longitudes)
+
+        measured = np.isfinite(fast_distances)
+        errors = np.abs(fast_distances[measured] - exact_distances[measured])
+        relative_errors = errors / np.maximum(exact_distances[measured], 1e-9)
+
+        return {
+            "points": int(len(exact_distances)),
+            **tiers,
+            "within_radius": int(fast_mask.sum()),
+            "mask_mismatches": int(np.count_nonzero(fast_mask != (exact_distances <= radius))),
+            "max_abs_error_km": float(errors.max()) if len(errors) else 0.0,
+            "mean_abs_error_km": float(errors.mean()) if len(errors) else 0.0,
+            "max_relative_error": float(relative_errors.max()) if len(errors) else 0.0
+        }
+
     def locations_within_radius(self, center_location, radius, locations):
         """
         Find all locations within a specified radius of a center location.
@@ -48,20 +226,16 @@ class RadiusCalculator:
         Returns:
         list: A list of locations within the specified radius.
         """
-        within_radius = []  # Initialize an empty list to hold locations within the radius.
+        if not locations:
+            return []
 
-        # Iterate through each location in the list.
-        for location in locations:
-            # Calculate the distance from the center location to the current location.
-            distance = self.calculate_distance(center_location[0], center_location[1], location["latitude"],
-                                               location["longitude"])
+        # Thin wrapper over the batch API: build the coordinate columns once and keep the matching dicts.
+        latitudes = [location["latitude"] for location in locations]
+        longitudes = [location["longitude"] for location in locations]
+        _, mask = self.within_radius(center_location, radius, latitudes, longitudes)
 
-            # Check if the distance is within the specified radius.
-            if distance <= radius:
-                # If within the radius, add the location to the list.
-                within_radius.append(location)
+        return [location for location, inside in zip(locations, mask) if inside]
 
-        return within_radius
 
 def main():
     # Instance of the RadiusCalculator class.
@@ -87,5 +261,19 @@ def main():
         print(location["name"])
         print(location["latitude"],location["longitude"])
 
+    # Batch API over coordinate columns, e.g. for sorting many points by distance.
+    rng = np.random.default_rng(0)
+    latitudes = rng.uniform(50.0, 53.0, 50_000)
+    longitudes = rng.uniform(-2.0, 1.5, 50_000)
+    distances, mask = calculator.within_radius(center_location, radius, latitudes, longitudes)
+    nearest = np.argsort(distances)[:3]
+    print(f"{int(mask.sum())} of {len(latitudes)} random points are within {radius} kilometers of London")
+    print(f"Nearest distances: {distances[nearest]}")
+
+    # Accuracy of the fast tier against the exact formula for typical neighborhood radii.
+    for neighborhood_radius in (1.0, 5.0, 25.0):
+        report = calculator.accuracy_report(center_location, neighborhood_radius, latitudes, longitudes)
+        print(f"Fast tier accuracy for {neighborhood_radius} kilometers: {report}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from Logic.Geohash import Geohash
+from Logic.RadiusCalculator import RadiusCalculator
+
+
+class RadiusSearchCache:
+    """
+    An LRU/TTL cache of radius search results keyed by a snapped center and a radius bucket.
+
+    The center of a search is snapped to its geohash cell and the radius is rounded up to a power of two.
+    An entry holds every community within the coverage circle of its key (the rounded radius plus the distance
+    from the cell center to its farthest corner), so it contains the answer of every search that maps to the key.
+    Callers filter the cached communities against their exact center and radius.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=60.0, geohash_precision=6, clock=time.monotonic):
+        """
+        Initializes an empty cache.
+
+        Parameters:
+        - max_entries (int): The number of keys kept before the least recently used one is evicted.
+        - ttl_seconds (float): How long an entry may be served after it was stored.
+        - geohash_precision (int): Geohash length used to snap search centers.
+        - clock (callable): Returns the current time in seconds.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.geohash_precision = geohash_precision
+        self._clock = clock
+        self._calculator = RadiusCalculator()
+
+        self._entries = OrderedDict()  # key -> (stored_at, coverage, communities, community_keys)
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so results read before an invalidation are not stored after it
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key_for(self, latitude, longitude, radius):
+        """
+        Returns the cache key of a search: (geohash of the center, radius rounded up to a power of two in km).
+        """
+        radius_bucket = 2.0 ** max(0, math.ceil(math.log2(radius))) if radius > 0 else 1.0
+        return Geohash.encode(latitude, longitude, self.geohash_precision), radius_bucket
+
+    def coverage(self, key):
+        """
+        Returns the circle an entry has to cover: (latitude, longitude, radius in km).
+        """
+        geohash, radius_bucket = key
+        min_lat, max_lat, min_lon, max_lon = Geohash.bounds(geohash)
+        center_lat = (min_lat + max_lat) / 2
+        center_lon = (min_lon + max_lon) / 2
+
+        # Distance from the cell center to its farthest corner (corners mirror each other in longitude)
+        half_diagonal = max(self._calculator.calculate_distance(center_lat, center_lon, corner_lat, min_lon)
+                            for corner_lat in (min_lat, max_lat))
+        return center_lat, center_lon, radius_bucket + half_diagonal
+
+    def get(self, key):
+        """
+        Returns the communities cached for a key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, communities, generation, community_key=lambda community: community.get('area')):
+        """
+        Stores the communities found within the coverage circle of a key.
+
+        Parameters:
+        - key (tuple): A key returned by key_for.
+        - communities (list): The community documents within coverage(key).
+        - generation (int): The cache generation read before the communities were fetched. Nothing is stored if
+          an invalidation happened since then.
+        - community_key (callable): Returns the identifier used by invalidate_community for a document.
+        """
+        coverage = self.coverage(key)
+        community_keys = {community_key(community) for community in communities}
+
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (self._clock(), coverage, communities, community_keys)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_location(self, latitude, longitude):
+        """
+        Drops the entries whose coverage circle contains a location, e.g. after a community is added there.
+        """
+        with self._lock:
+            stale = [key for key, (_, (center_lat, center_lon, radius), _, _) in self._entries.items()
+                     if self._calculator.calculate_distance(center_lat, center_lon, latitude, longitude) <= radius]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            self.generation += 1
+
+    def invalidate_community(self, community_key):
+        """
+        Drops the entries that hold a given community, e.g. after its document changed.
+        """
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if community_key in entry[3]]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            self.generation += 1
+
+    def clear(self):
+        """
+        Drops every entry. The counters are kept.
+        """
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        """
+        Returns the cache size, hit/miss counts, hit ratio, and eviction, expiration and invalidation counts.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
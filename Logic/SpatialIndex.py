@@ -0,0 +1,187 @@
+import math
+import threading
+from collections import defaultdict
+
+from Logic.RadiusCalculator import RadiusCalculator
+
+
+class SpatialIndex:
+    """
+    An in-memory grid index of points (community centers) on the Earth.
+
+    Points are bucketed into fixed-size latitude/longitude cells. A radius query only visits the cells
+    that can intersect the search circle, and then filters the points of those cells with the exact
+    Haversine distance from RadiusCalculator. The index is updated incrementally with insert/remove, and
+    keeps counters that show how selective queries are.
+    """
+
+    def __init__(self, cell_size_degrees=0.05, distance_mode="exact"):
+        """
+        Initializes an empty index.
+
+        Parameters:
+        - cell_size_degrees (float): The side of a grid cell in degrees (0.05 degrees is about 5.5 km of latitude).
+        - distance_mode (str): The RadiusCalculator.within_radius mode used to filter candidates ("exact" or "fast").
+        """
+        self.cell_size = float(cell_size_degrees)
+        self.distance_mode = distance_mode
+        self.rows = math.ceil(180.0 / self.cell_size)
+        self.columns = math.ceil(360.0 / self.cell_size)
+
+        self._cells = defaultdict(dict)  # (row, column) -> {key: (latitude, longitude)}
+        self._points = {}  # key -> (latitude, longitude, cell)
+        self._lock = threading.Lock()
+        self._calculator = RadiusCalculator()
+
+        # Selectivity counters
+        self.queries = 0
+        self.cells_visited = 0
+        self.candidates = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell_of(self, latitude, longitude):
+        """
+        Returns the (row, column) of the cell containing the given coordinates.
+        """
+        row = min(int((latitude + 90.0) // self.cell_size), self.rows - 1)
+        column = int((longitude + 180.0) // self.cell_size) % self.columns
+        return row, column
+
+    def insert(self, key, latitude, longitude):
+        """
+        Adds a point to the index, or moves it if the key is already indexed.
+
+        Parameters:
+        - key (hashable): The identifier returned by queries (e.g. the community _id).
+        - latitude (float): Latitude in degrees.
+        - longitude (float): Longitude in degrees.
+        """
+        latitude = float(latitude)
+        longitude = float(longitude)
+        cell = self._cell_of(latitude, longitude)
+
+        with self._lock:
+            self._discard(key)
+            self._cells[cell][key] = (latitude, longitude)
+            self._points[key] = (latitude, longitude, cell)
+
+    def remove(self, key):
+        """
+        Removes a point from the index. Unknown keys are ignored.
+        """
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        """
+        Removes all points from the index. The counters are kept.
+        """
+        with self._lock:
+            self._cells.clear()
+            self._points.clear()
+
+    def _discard(self, key):
+        # Callers must hold the lock
+        point = self._points.pop(key, None)
+        if point is None:
+            return
+        cell = point[2]
+        del self._cells[cell][key]
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def _candidate_cells(self, latitude, longitude, radius):
+        """
+        Returns the occupied cells that can contain points within the radius of the center.
+        """
+        # Angular radius of the search circle
+        angular_radius = radius / RadiusCalculator.EARTH_RADIUS_KM
+        lat_delta = math.degrees(angular_radius)
+        min_lat = latitude - lat_delta
+        max_lat = latitude + lat_delta
+
+        min_row = self._cell_of(max(min_lat, -90.0), 0.0)[0]
+        max_row = self._cell_of(min(max_lat, 90.0), 0.0)[0]
+
+        # Widest longitude offset of the circle; if it contains a pole every longitude is a candidate
+        cos_lat = math.cos(math.radians(latitude))
+        if min_lat <= -90.0 or max_lat >= 90.0 or math.sin(angular_radius) >= cos_lat:
+            column_span = self.columns
+        else:
+            lon_delta = math.degrees(math.asin(math.sin(angular_radius) / cos_lat))
+            column_span = min(self.columns, 2 * math.ceil(lon_delta / self.cell_size) + 1)
+
+        rows = max_row - min_row + 1
+        # Big radii touch more cells than are occupied, so scanning the occupied cells is cheaper
+        if rows * column_span >= len(self._cells):
+            return [cell for cell in self._cells if min_row <= cell[0] <= max_row]
+
+        if column_span >= self.columns:
+            columns = range(self.columns)
+        else:
+            center_column = self._cell_of(latitude, longitude)[1]
+            half_span = column_span // 2
+            columns = [(center_column + offset) % self.columns for offset in range(-half_span, half_span + 1)]
+
+        return [(row, column) for row in range(min_row, max_row + 1) for column in columns
+                if (row, column) in self._cells]
+
+    def query_radius(self, center_location, radius):
+        """
+        Finds all indexed points within a radius of a center location.
+
+        Parameters:
+        - center_location (tuple): A tuple (lat, lon) representing the center location.
+        - radius (float): The search radius in kilometers.
+
+        Returns:
+        - list: (key, distance) tuples for the points within the radius, sorted by distance in kilometers.
+        """
+        latitude = float(center_location[0])
+        longitude = float(center_location[1])
+
+        with self._lock:
+            cells = self._candidate_cells(latitude, longitude, radius)
+            keys = []
+            latitudes = []
+            longitudes = []
+            for cell in cells:
+                for key, (point_lat, point_lon) in self._cells[cell].items():
+                    keys.append(key)
+                    latitudes.append(point_lat)
+                    longitudes.append(point_lon)
+
+        matches = []
+        if keys:
+            distances, mask = self._calculator.within_radius((latitude, longitude), radius, latitudes, longitudes,
+                                                             mode=self.distance_mode)
+            matches = sorted(((keys[i], float(distances[i])) for i in mask.nonzero()[0]), key=lambda match: match[1])
+
+        with self._lock:
+            self.queries += 1
+            self.cells_visited += len(cells)
+            self.candidates += len(keys)
+            self.hits += len(matches)
+
+        return matches
+
+    def stats(self):
+        """
+        Returns the index size and selectivity counters.
+
+        Returns:
+        - dict: Point and cell counts, query totals, and the share of scanned candidates that were hits.
+        """
+        with self._lock:
+            return {
+                "points": len(self._points),
+                "occupied_cells": len(self._cells),
+                "queries": self.queries,
+                "cells_visited": self.cells_visited,
+                "candidates": self.candidates,
+                "hits": self.hits,
+                "hit_ratio": self.hits / self.candidates if self.candidates else None
+            }
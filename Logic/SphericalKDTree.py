@@ -0,0 +1,150 @@
+import threading
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from Logic.RadiusCalculator import RadiusCalculator
+
+
+class SphericalKDTree:
+    """
+    A k-nearest-neighbour index of points on the Earth.
+
+    Points are stored as 3D unit vectors in a KD-tree. The straight-line (chord) distance between unit vectors
+    grows monotonically with the great-circle distance, so the nearest points by chord are the nearest points on
+    the sphere, and a chord converts exactly into kilometers.
+
+    The tree itself is static, so inserts and removals are kept in a small patch (a list of pending points
+    searched by brute force and a set of stale tree entries) until the patch grows past a threshold and the tree
+    is rebuilt.
+    """
+
+    def __init__(self, rebuild_threshold=64):
+        """
+        Initializes an empty tree.
+
+        Parameters:
+        - rebuild_threshold (int): How many pending inserts and removals are patched before the tree is rebuilt.
+        """
+        self.rebuild_threshold = rebuild_threshold
+
+        self._points = {}  # key -> (latitude, longitude) of every live point
+        self._tree = None
+        self._tree_keys = []  # tree row -> key
+        self._tree_rows = {}  # key -> tree row
+        self._stale_rows = set()  # tree rows removed or moved since the last build
+        self._pending = {}  # key -> unit vector of points inserted since the last build
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._points)
+
+    @staticmethod
+    def to_unit_vectors(latitudes, longitudes):
+        """
+        Converts coordinates in degrees into an (n, 3) array of unit vectors.
+        """
+        latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+        cos_lat = np.cos(latitudes)
+        return np.column_stack((cos_lat * np.cos(longitudes), cos_lat * np.sin(longitudes), np.sin(latitudes)))
+
+    @staticmethod
+    def chord_to_kilometers(chords):
+        """
+        Converts chord lengths between unit vectors into great-circle distances in kilometers.
+        """
+        chords = np.asarray(chords, dtype=np.float64)
+        return 2 * RadiusCalculator.EARTH_RADIUS_KM * np.arcsin(np.clip(chords / 2, 0.0, 1.0))
+
+    def build(self, points):
+        """
+        Replaces the content of the tree.
+
+        Parameters:
+        - points (iterable): (key, latitude, longitude) tuples.
+        """
+        with self._lock:
+            self._points = {key: (float(latitude), float(longitude)) for key, latitude, longitude in points}
+            self._rebuild()
+
+    def _rebuild(self):
+        # Callers must hold the lock
+        self._tree_keys = list(self._points)
+        self._tree_rows = {key: row for row, key in enumerate(self._tree_keys)}
+        self._stale_rows = set()
+        self._pending = {}
+
+        if self._tree_keys:
+            latitudes, longitudes = zip(*(self._points[key] for key in self._tree_keys))
+            self._tree = cKDTree(self.to_unit_vectors(latitudes, longitudes))
+        else:
+            self._tree = None
+
+    def insert(self, key, latitude, longitude):
+        """
+        Adds a point, or moves it if the key already exists. The tree is patched, not rebuilt, until the
+        number of pending changes reaches the rebuild threshold.
+        """
+        with self._lock:
+            self._discard(key)
+            self._points[key] = (float(latitude), float(longitude))
+            self._pending[key] = self.to_unit_vectors([latitude], [longitude])[0]
+            self._maybe_rebuild()
+
+    def remove(self, key):
+        """
+        Removes a point. Unknown keys are ignored.
+        """
+        with self._lock:
+            if self._points.pop(key, None) is not None:
+                self._discard(key)
+                self._maybe_rebuild()
+
+    def _discard(self, key):
+        # Callers must hold the lock
+        self._pending.pop(key, None)
+        row = self._tree_rows.pop(key, None)
+        if row is not None:
+            self._stale_rows.add(row)
+
+    def _maybe_rebuild(self):
+        # Callers must hold the lock
+        if len(self._pending) + len(self._stale_rows) > self.rebuild_threshold:
+            self._rebuild()
+
+    def nearest(self, center_location, k):
+        """
+        Finds the k points closest to a center location.
+
+        Parameters:
+        - center_location (tuple): A tuple (lat, lon) representing the center location.
+        - k (int): How many points to return.
+
+        Returns:
+        - list: Up to k (key, distance) tuples sorted by distance, with distances in kilometers.
+        """
+        center = self.to_unit_vectors([center_location[0]], [center_location[1]])[0]
+
+        with self._lock:
+            candidates = []
+
+            # Query extra neighbours so that k live points remain after skipping the stale rows
+            tree_size = len(self._tree_keys)
+            query_size = min(tree_size, k + len(self._stale_rows))
+            if query_size:
+                chords, rows = self._tree.query(center, k=query_size)
+                for chord, row in zip(np.atleast_1d(chords), np.atleast_1d(rows)):
+                    if row not in self._stale_rows:
+                        candidates.append((self._tree_keys[row], chord))
+
+            if self._pending:
+                pending_keys = list(self._pending)
+                pending_chords = np.linalg.norm(np.array([self._pending[key] for key in pending_keys]) - center,
+                                                axis=1)
+                candidates.extend(zip(pending_keys, pending_chords))
+
+        candidates.sort(key=lambda candidate: candidate[1])
+        candidates = candidates[:k]
+        distances = self.chord_to_kilometers([chord for _, chord in candidates])
+        return [(key, float(distance)) for (key, _), distance in zip(candidates, distances)]
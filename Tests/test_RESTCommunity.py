@@ -9,6 +9,7 @@ infrastructure_path = '/Users/saharoz/Desktop/Study/personal/UrbanHiveServer/Inf
 sys.path.insert(0, infrastructure_path)
 
 from Infrastructure.app import create_app
+from database import DataBase
 from flask_pymongo import PyMongo
 from flask_testing import TestCase
 
@@ -62,6 +63,9 @@ class TestRESTCommunity(TestCase):
             mongo = PyMongo(self.app)
             mongo.db.users.drop()
             mongo.db.communities.drop()
+            mongo.db.inbox.drop()
+            mongo.db.events.drop()
+            mongo.db.rsvps.drop()
 
     def test_add_and_get_communities(self):
         # Deleting the community database for the test
@@ -109,27 +113,95 @@ class TestRESTCommunity(TestCase):
         response = self.client.post('/communities/add_user_to_community', json=data)
         self.assertEqual(response.status_code, 200)
 
-        # Fetch both users from the database to check their community requests
+        # The invitation is waiting in the receiver's inbox, and listed as sent in the sender's
+        received = self.client.get('/inbox/311285514', query_string={"kind": "community_invite"}).json['requests']
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]['request_id'], response.json['request_id'])
+        self.assertEqual(received[0]['sender_id'], '311156616')
+        self.assertEqual(received[0]['payload']['area'], 'TestArea')
+
+        sent = self.client.get('/inbox/311156616', query_string={"box": "sent"}).json['requests']
+        self.assertEqual([invitation['request_id'] for invitation in sent], [response.json['request_id']])
+
+        # Accepting it by its id makes the receiver a member; it cannot be answered twice
+        response = self.client.post('/inbox/respond', json={"request_id": received[0]['request_id'], "response": 1})
+        self.assertEqual(response.status_code, 200)
         with self.app.app_context():
             mongo = PyMongo(self.app)
-            sender_user = mongo.db.users.find_one({"id": data['sender_id']})
-            receiver_user = mongo.db.users.find_one({"id": data['receiver_id']})
+            community = mongo.db.communities.find_one({"area": "TestArea"})
+            self.assertIn("311285514", [member['id'] for member in community['communityMembers']])
+            self.assertIn("TestArea", mongo.db.users.find_one({"id": "311285514"})['communities'])
+
+        response = self.client.post('/inbox/respond', json={"request_id": received[0]['request_id'], "response": 0})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get('/inbox/311285514').json['requests'], [])
+
+    def test_respond_to_community_request_round_trips(self):
+        response = self.client.post('/communities/add_user_to_community', json={
+            "receiver_id": "311285514",
+            "sender_id": "311156616",
+            "community area": "TestArea"
+        })
+        self.assertEqual(response.status_code, 200)
 
-            # Validate that the community request was added correctly
-            # Assuming community_requests attribute stores the requests, change as per actual implementation
-            self.assertIn('communityRequest', sender_user)
-            self.assertIn('communityRequest', receiver_user)
+        # The invitation and the receiver are read, then the invitation is answered and the community and the
+        # receiver updated, all in one transaction
+        self.app.config["MONGO_ROUND_TRIP_HEADER"] = True
+        response = self.client.post('/communities/respond_to_community_request', json={
+            "receiver_id": "311285514",
+            "sender_id": "311156616",
+            "area": "TestArea",
+            "response": 1
+        })
+        self.assertEqual(response.status_code, 200)
+        commit = 1 if DataBase.supports_transactions() else 0
+        self.assertEqual(response.headers['X-Mongo-Round-Trips'], str(5 + commit))
+
+    def test_invitation_to_missing_user_stays_pending(self):
+        response = self.client.post('/communities/add_user_to_community', json={
+            "receiver_id": "311285514",
+            "sender_id": "311156616",
+            "community area": "TestArea"
+        })
+        request_id = response.get_json()["request_id"]
+
+        # Accepting fails while the receiver does not exist, and leaves the invitation to be answered later
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            receiver = mongo.db.users.find_one_and_delete({"id": "311285514"})
+        response = self.client.post('/inbox/respond', json={"request_id": request_id, "response": 1})
+        self.assertEqual(response.status_code, 404)
+
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            self.assertEqual(mongo.db.inbox.find_one({"request_id": request_id})['status'], "pending")
+            self.assertNotIn("311285514", [member['id'] for member in
+                                           mongo.db.communities.find_one({"area": "TestArea"})['communityMembers']])
+            mongo.db.users.insert_one(receiver)
+        response = self.client.post('/inbox/respond', json={"request_id": request_id, "response": 1})
+        self.assertEqual(response.status_code, 200)
 
-            # Validate the details of the request stored in the community_requests attribute
-            # Here you will check if the details of the request including the ids and statuses are correct
-            sender_request = sender_user['communityRequest']
-            receiver_request = receiver_user['communityRequest']
+    def test_join_requests_are_kept(self):
+        # Each join request waits in the community's inbox instead of overwriting the previous one
+        first = self.client.post('/communities/request_to_join',
+                                 json={"area": "TestArea", "sender_id": "311285514", "sender_name": "sahar"})
+        second = self.client.post('/communities/request_to_join',
+                                  json={"area": "TestArea", "sender_id": "311156616", "sender_name": "danor"})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
 
-            self.assertEqual(sender_request['community request'], 'TestArea')
-            self.assertEqual(sender_request['status'], 'pending from 311285514')
+        pending = self.client.get('/inbox/TestArea', query_string={"limit": 1})
+        self.assertEqual(pending.json['requests'][0]['request_id'], second.json['request_id'])
+        pending = self.client.get('/inbox/TestArea', query_string={"limit": 1, "next": pending.json['next']})
+        self.assertEqual(pending.json['requests'][0]['request_id'], first.json['request_id'])
+        self.assertIsNone(pending.json['next'])
 
-            self.assertEqual(receiver_request['community request'], 'TestArea')
-            self.assertEqual(receiver_request['status'], 'waiting for your response')
+        response = self.client.post('/communities/respond_to_join_request',
+                                    json={"request_id": first.json['request_id'], "response": 1})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/communities/respond_to_join_request',
+                                    json={"request_id": first.json['request_id'], "response": 1})
+        self.assertEqual(response.status_code, 404)
 
     def test_delete_user_from_community(self):
         # First, add a user to a community to ensure there's something to delete
@@ -158,6 +230,100 @@ class TestRESTCommunity(TestCase):
             user = mongo.db.users.find_one({"id": "311285514"})
             self.assertNotIn("TestArea", user.get("communities", []))
 
+    def test_delete_user_from_community_frees_their_seats(self):
+        # sahar takes the last seat of danor's event in TestArea and a third guest is waitlisted
+        event_id = self.client.post('/events/add_event', json={
+            "initiator": "311156616",
+            "community_name": "TestArea",
+            "location": {"latitude": 37.4219909, "longitude": -122.0839496},
+            "event_name": "Garden Day",
+            "event_type": "Gathering",
+            "start_time": "2022-05-01T10:00:00Z",
+            "end_time": "2022-05-01T14:00:00Z",
+            "guest_list": ["311285514", "311000000"],
+            "capacity": 2
+        }).get_json()["event_id"]
+        for user_id in ["311285514", "311000000"]:
+            response = self.client.post('/events/respond_to_event_request', json={
+                "user_id": user_id, "community_name": "TestArea", "event_name": "Garden Day", "response": 1})
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.post('/communities/delete_user_from_community', json={
+            "user_to_delete_id": "311285514",
+            "area": "TestArea"
+        })
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/events/attendees/{event_id}')
+        self.assertEqual([attendee['user_id'] for attendee in response.get_json()["attendees"]],
+                         ["311156616", "311000000"])
+
+    def test_get_communities_by_radius_and_location(self):
+        # Add one community close to the search center and one far away from it
+        self.client.post('/communities/add_community', json={
+            "manager_id": "311156616",
+            "area": "NearArea",
+            "location": {"latitude": "37.4300000", "longitude": "-122.0900000"}
+        })
+        self.client.post('/communities/add_community', json={
+            "manager_id": "311285514",
+            "area": "FarArea",
+            "location": {"latitude": "40.7128000", "longitude": "-74.0060000"}
+        })
+
+        response = self.client.post('/communities/get_communities_by_radius_and_location', json={
+            "radius": 5,
+            "location": {"latitude": "37.4219909", "longitude": "-122.0839496"}
+        })
+        self.assertEqual(response.status_code, 200)
+
+        local_communities = response.get_json()["local_communities"]
+        areas = [community['area'] for community in local_communities]
+        self.assertIn("NearArea", areas)
+        self.assertNotIn("FarArea", areas)
+
+        # Every result carries its distance in kilometers, sorted from nearest to farthest
+        distances = [community['distance'] for community in local_communities]
+        self.assertTrue(all(distance <= 5 for distance in distances))
+        self.assertEqual(distances, sorted(distances))
+
+    def test_get_nearest_communities(self):
+        # Add three communities at growing distances from the search center, where setUp's TestArea lies
+        for manager_id, area, latitude in [("311156616", "Nearest", "37.4300000"),
+                                           ("311285514", "Middle", "37.5000000"),
+                                           ("311156616", "Farthest", "38.0000000")]:
+            response = self.client.post('/communities/add_community', json={
+                "manager_id": manager_id,
+                "area": area,
+                "location": {"latitude": latitude, "longitude": "-122.0839496"}
+            })
+            self.assertEqual(response.status_code, 201)
+
+        response = self.client.post('/communities/get_nearest_communities', json={
+            "k": 3,
+            "location": {"latitude": "37.4219909", "longitude": "-122.0839496"}
+        })
+        self.assertEqual(response.status_code, 200)
+
+        nearest_communities = response.get_json()["nearest_communities"]
+        self.assertEqual([community['area'] for community in nearest_communities], ["TestArea", "Nearest", "Middle"])
+        self.assertLess(nearest_communities[1]['distance'], nearest_communities[2]['distance'])
+
+    def test_get_communities_by_radius_and_location_invalid_location(self):
+        response = self.client.post('/communities/get_communities_by_radius_and_location', json={
+            "radius": 5,
+            "location": {"latitude": "not a number", "longitude": "-122.0839496"}
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_communities_by_radius_and_location_invalid_radius(self):
+        for radius in ["inf", "nan", "-1"]:
+            response = self.client.post('/communities/get_communities_by_radius_and_location', json={
+                "radius": radius,
+                "location": {"latitude": "37.4219909", "longitude": "-122.0839496"}
+            })
+            self.assertEqual(response.status_code, 400)
+
 
 
 # To allow running the tests from the command line
@@ -1,7 +1,9 @@
 import json
 import sys
 import os
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 # Absolute path to the directory where app.py is located
 infrastructure_path = '/Users/saharoz/Desktop/Study/personal/UrbanHiveServer/Infrastructure'
@@ -9,6 +11,7 @@ infrastructure_path = '/Users/saharoz/Desktop/Study/personal/UrbanHiveServer/Inf
 sys.path.insert(0, infrastructure_path)
 
 from Infrastructure.app import create_app
+from database import DataBase
 from flask_pymongo import PyMongo
 from flask_testing import TestCase
 
@@ -55,6 +58,8 @@ class TestRESTEvents(TestCase):
             mongo.db.users.drop()
             mongo.db.communities.drop()
             mongo.db.events.drop()
+            mongo.db.inbox.drop()
+            mongo.db.rsvps.drop()
 
     def test_add_event(self):
         event_data = {
@@ -70,6 +75,154 @@ class TestRESTEvents(TestCase):
         response = self.client.post('/events/add_event', json=event_data)
         self.assertEqual(response.status_code, 201)
 
+    def test_add_event_round_trips(self):
+        # The invitations are sent with one insert, whatever the size of the guest list
+        self.app.config["MONGO_ROUND_TRIP_HEADER"] = True
+        event_data = dict(self.event, event_name="Block Party", guest_list=[f"user{i:03}" for i in range(2, 52)])
+        response = self.client.post('/events/add_event', json=event_data)
+        self.assertEqual(response.status_code, 201)
+        commit = 1 if DataBase.supports_transactions() else 0
+        self.assertEqual(response.headers['X-Mongo-Round-Trips'], str(4 + commit))
+        self.assertEqual(response.json['invitations'], 50)
+        self.assertFalse(response.json['invitations_deferred'])
+
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            rsvp = mongo.db.rsvps.find_one({"event_id": response.json['event_id'], "user_id": "user001"})
+            self.assertIsNotNone(rsvp, "The initiator attends the event")
+            self.assertEqual(mongo.db.inbox.count_documents({"payload.event_id": response.json['event_id']}), 50)
+
+    def test_event_attendance(self):
+        event_data = dict(self.event, event_name="Picnic", guest_list=["user002", "user003"])
+        event_id = self.client.post('/events/add_event', json=event_data).json['event_id']
+
+        for user_id in ["user002", "user003"]:
+            response = self.client.post('/events/respond_to_event_request',
+                                        json={"user_id": user_id, "community_name": "TestArea",
+                                              "event_name": "Picnic", "response": 1})
+            self.assertEqual(response.status_code, 200)
+
+        # Who's coming: the initiator, then the guests in the order they answered
+        response = self.client.get(f'/events/attendees/{event_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([attendee['user_id'] for attendee in response.json['attendees']],
+                         ["user001", "user002", "user003"])
+
+        response = self.client.get('/events/user_events/user002')
+        self.assertEqual([event['event_id'] for event in response.json['events']], [event_id])
+
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            self.assertEqual(mongo.db.events.find_one({"event_id": event_id})['attendee_count'], 3)
+
+    def test_user_events_are_sorted_chronologically(self):
+        # In UTC the first event starts at 05:00, before the second, although its string sorts after it
+        first = dict(self.event, event_name="Breakfast", start_time="2022-06-01T10:00:00+05:00",
+                     end_time="2022-06-01T11:00:00+05:00")
+        second = dict(self.event, event_name="Brunch", start_time="2022-06-01T07:00:00Z",
+                      end_time="2022-06-01T08:00:00Z")
+        event_ids = [self.client.post('/events/add_event', json=event).json['event_id'] for event in [second, first]]
+
+        response = self.client.get('/events/user_events/user001')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['event_id'] for event in response.json['events']], event_ids[::-1])
+
+    def test_add_event_invalid_time(self):
+        response = self.client.post('/events/add_event', json=dict(self.event, start_time="next Friday"))
+        self.assertEqual(response.status_code, 400)
+
+    def test_capacity_under_concurrent_rsvps(self):
+        # 40 guests accept at the same moment an event with 10 seats, one of which is the initiator's
+        guests = [f"guest{i:03}" for i in range(40)]
+        event_data = dict(self.event, event_name="Concert", guest_list=guests, capacity=10)
+        event_id = self.client.post('/events/add_event', json=event_data).json['event_id']
+
+        start = threading.Barrier(len(guests))
+
+        def accept(user_id):
+            client = self.app.test_client()
+            start.wait()
+            return client.post('/events/respond_to_event_request',
+                               json={"user_id": user_id, "community_name": "TestArea", "event_name": "Concert",
+                                     "response": 1})
+
+        with ThreadPoolExecutor(max_workers=len(guests)) as executor:
+            responses = list(executor.map(accept, guests))
+
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        statuses = [response.json['attendance'] for response in responses]
+        self.assertEqual(statuses.count("attending"), 9)
+        self.assertEqual(statuses.count("waitlisted"), 31)
+
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            event = mongo.db.events.find_one({"event_id": event_id})
+            self.assertEqual(event['attendee_count'], 10)
+            self.assertEqual(event['waitlist_count'], 31)
+            self.assertEqual(mongo.db.rsvps.count_documents({"event_id": event_id, "status": "attending"}), 10)
+
+        # A freed seat goes to the first user of the waitlist
+        waitlist = self.client.get(f'/events/attendees/{event_id}', query_string={"status": "waitlisted"}).json
+        first_waitlisted = waitlist['attendees'][0]['user_id']
+        leaving = statuses.index("attending")
+        response = self.client.post('/events/cancel_attendance',
+                                    json={"event_id": event_id, "user_id": guests[leaving]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['promoted'], [first_waitlisted])
+
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            event = mongo.db.events.find_one({"event_id": event_id})
+            self.assertEqual(event['attendee_count'], 10)
+            self.assertEqual(event['waitlist_count'], 30)
+
+    def test_decline_after_accepting_promotes_the_waitlist(self):
+        event_data = dict(self.event, event_name="Workshop", guest_list=["user002", "user003"], capacity=2)
+        event_id = self.client.post('/events/add_event', json=event_data).json['event_id']
+
+        for user_id, status in [("user002", "attending"), ("user003", "waitlisted")]:
+            response = self.client.post('/events/respond_to_event_request',
+                                        json={"user_id": user_id, "community_name": "TestArea",
+                                              "event_name": "Workshop", "response": 1})
+            self.assertEqual(response.json['attendance'], status)
+
+        # user002 changes their mind and their seat goes to user003
+        response = self.client.post('/events/respond_to_event_request',
+                                    json={"user_id": "user002", "community_name": "TestArea",
+                                          "event_name": "Workshop", "response": 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['promoted'], ["user003"])
+
+        response = self.client.get(f'/events/attendees/{event_id}')
+        self.assertEqual([attendee['user_id'] for attendee in response.json['attendees']], ["user001", "user003"])
+
+        # The invitation is declined now, so declining again finds nothing to answer
+        response = self.client.post('/events/respond_to_event_request',
+                                    json={"user_id": "user002", "community_name": "TestArea",
+                                          "event_name": "Workshop", "response": 0})
+        self.assertEqual(response.status_code, 404)
+
+    def test_confirm_event_request_round_trips(self):
+        event_data = dict(self.event, event_name="Hike", guest_list=[])
+        event_id = self.client.post('/events/add_event', json=event_data).json['event_id']
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            mongo.db.users.insert_one({"id": "user002", "name": "Jane Doe", "communities": ["TestArea"]})
+        response = self.client.post('/events/request_to_join_events',
+                                    json={"user_id": "user002", "community_name": "TestArea", "event_id": event_id})
+        self.assertEqual(response.status_code, 200)
+
+        # The manager and the user are read with one query and the event with another; the transaction reads the
+        # request and the event again, then answers the request and writes the seat and the RSVP
+        self.app.config["MONGO_ROUND_TRIP_HEADER"] = True
+        response = self.client.post('/events/confirm_or_decline_event_request',
+                                    json={"manager_id": "user001", "event_id": event_id, "user_id": "user002",
+                                          "community_name": "TestArea", "response": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['attendance'], "attending")
+        commit = 1 if DataBase.supports_transactions() else 0
+        self.assertEqual(response.headers['X-Mongo-Round-Trips'], str(7 + commit))
+
     def test_get_all_events(self):
         response = self.client.get('/events/get_all_events')
         self.assertEqual(response.status_code, 200)
@@ -77,6 +230,14 @@ class TestRESTEvents(TestCase):
         self.assertIsInstance(events, list)
         self.assertTrue(any(event['event_name'] == "Spring Fest" for event in events))
 
+    def test_get_all_events_stream(self):
+        response = self.client.get('/events/get_all_events', query_string={"stream": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        events = json.loads(response.data)
+        self.assertIsInstance(events, list)
+        self.assertTrue(any(event['event_name'] == "Spring Fest" for event in events))
+
     def test_delete_event(self):
         # First, add an event using the API
         event_data = {
@@ -103,23 +264,15 @@ class TestRESTEvents(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('Event deleted successfully!', response.get_json()['message'])
 
-        # Optionally, verify that the event is indeed removed from the database
+        # Verify that the event is removed from the database and from the summary of its community
         with self.app.app_context():
             mongo = PyMongo(self.app)
             event_after_deletion = mongo.db.events.find_one({"event_id": event_id})
             self.assertIsNone(event_after_deletion, "The event should be deleted from the database")
             community = mongo.db.communities.find_one({"area": "TestArea"})
-            print(community)
-            # Check if there is an event in the community's events array with the created event_id
             self.assertIsNotNone(community, "Community should exist")
-
-            if len(community['events']) is 0:  # in case that the deleted event was the only
-                self.assertTrue(True, True)
-            else:  # in case it is not the single event we make sure that the deleted events is no longer exists we
-                # checking it by id
-                self.assertTrue(any(event['event_id'] == event_id for event in community['events']),
-                                "The new event should be added to the community's events array")
-
+            self.assertNotIn(event_id, community['recent_event_ids'])
+            self.assertEqual(community['event_count'], 0)
 
 # To allow running the tests from the command line
 if __name__ == '__main__':
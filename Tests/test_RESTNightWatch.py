@@ -98,6 +98,60 @@ class TestRESTNightWatch(TestCase):
             self.assertEqual(night_watch['location']['latitude'], 37.7749)
             self.assertEqual(night_watch['location']['longitude'], -122.4194)
 
+    def test_join_and_leave_keep_position_layout(self):
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            mongo.db.users.insert_one({"id": "user002", "name": "Jane Doe"})
+            mongo.db.communities.update_one({"area": "TestArea"},
+                                            {"$set": {"location": {"latitude": 37.7749, "longitude": -122.4194}}})
+            watch_id = str(uuid.uuid4())
+            mongo.db.night_watch.insert_one({
+                "watch_id": watch_id,
+                "initiator_id": "user001",
+                "community_area": "TestArea",
+                "watch_date": "2023-12-31",
+                "watch_radius": 1,
+                "positions_amount": 3,
+                "watch_members": [],
+                "membership_version": 0,
+                "location": {"latitude": 37.7749, "longitude": -122.4194}
+            })
+
+        self.client.post('/night_watch/join_watch', json={"candidate_id": "user001", "night_watch_id": watch_id})
+        response = self.client.post('/night_watch/calculate_position_for_watch', json={"watch_id": watch_id})
+        self.assertEqual(response.status_code, 200)
+        first_position = response.get_json()['inlays'][0]['position']
+
+        # A second member takes a free slot without moving the first one
+        response = self.client.post('/night_watch/join_watch',
+                                    json={"candidate_id": "user002", "night_watch_id": watch_id})
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            watch = mongo.db.night_watch.find_one({"watch_id": watch_id})
+            self.assertEqual(watch['membership_version'], 2)
+            self.assertEqual(watch['layout_version'], 2)
+            inlays = {inlay['id']: inlay for inlay in watch['position_inlays']}
+            self.assertEqual(inlays['user001']['position'], first_position)
+            self.assertNotEqual(inlays['user001']['slot'], inlays['user002']['slot'])
+            self.assertIn('urgent_message', watch)
+
+        # Joining twice is rejected
+        response = self.client.post('/night_watch/join_watch',
+                                    json={"candidate_id": "user002", "night_watch_id": watch_id})
+        self.assertEqual(response.status_code, 409)
+
+        # Leaving frees only the member's slot
+        response = self.client.post('/night_watch/leave_watch',
+                                    json={"member_id": "user002", "night_watch_id": watch_id})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post('/night_watch/calculate_position_for_watch', json={"watch_id": watch_id})
+        inlays = response.get_json()['inlays']
+        self.assertEqual([inlay['id'] for inlay in inlays], ["user001"])
+        self.assertEqual(inlays[0]['position'], first_position)
+
     def test_close_night_watch(self):
         # First, add a night watch to close
         with self.app.app_context():
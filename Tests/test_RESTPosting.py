@@ -43,6 +43,7 @@ class TestRESTPosting(TestCase):
             mongo.db.users.drop()
             mongo.db.communities.drop()
             mongo.db.posting.drop()
+            mongo.db.comments.drop()
 
     def test_add_post(self):
         post_data = {
@@ -61,6 +62,12 @@ class TestRESTPosting(TestCase):
             post = mongo.db.posting.find_one({"user_id": "user001"})
             self.assertIsNotNone(post, "The post should exist in the database")
 
+            # The community only keeps the count and the ids of its latest posts
+            community = mongo.db.communities.find_one({"area": "TestArea"})
+            self.assertEqual(community['post_count'], 1)
+            self.assertEqual(community['recent_post_ids'], [response.get_json()['post_id']])
+            self.assertEqual(community['posts'], [])
+
     def test_delete_post(self):
         # First, add a post to delete
         post_data = {
@@ -135,6 +142,73 @@ class TestRESTPosting(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('Comment deleted successfully', response.get_json()['message'])
 
+    def test_community_feed(self):
+        # Post dates are stored as dates, so the feed is ordered by time whatever offset the clients sent
+        post_dates = ["2022-07-01T10:00:00Z", "2022-07-03T10:00:00+02:00", "2022-07-02T10:00:00Z"]
+        post_ids = []
+        for post_date in post_dates:
+            post_data = {
+                "user_id": "user001",
+                "community_area": "TestArea",
+                "post_content": {"header": "Feed", "body": post_date},
+                "post_date": post_date
+            }
+            add_response = self.client.post('/posting/add_post', json=post_data)
+            self.assertEqual(add_response.status_code, 201)
+            post_ids.append(add_response.get_json()['post_id'])
+
+        first_page = self.client.get('/posting/feed/TestArea', query_string={"limit": 2})
+        self.assertEqual(first_page.status_code, 200)
+        self.assertEqual([post['post_id'] for post in first_page.get_json()['posts']], [post_ids[1], post_ids[2]])
+
+        second_page = self.client.get('/posting/feed/TestArea',
+                                      query_string={"limit": 2, "next": first_page.get_json()['next']})
+        self.assertEqual([post['post_id'] for post in second_page.get_json()['posts']], [post_ids[0]])
+        self.assertIsNone(second_page.get_json()['next'])
+
+        # Refreshing only returns the posts dated after the newest one the client has
+        refresh = self.client.get('/posting/feed/TestArea', query_string={"since": "2022-07-02T10:00:00Z"})
+        self.assertEqual([post['post_id'] for post in refresh.get_json()['posts']], [post_ids[1]])
+
+        invalid = self.client.post('/posting/add_post', json=dict(post_data, post_date="next tuesday"))
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_comment_thread(self):
+        post_data = {
+            "user_id": "user001",
+            "community_area": "TestArea",
+            "post_content": {"header": "Important", "body": "Meeting at 10AM"},
+            "post_date": "2022-07-01T10:00:00Z"
+        }
+        post_id = self.client.post('/posting/add_post', json=post_data).get_json()['post_id']
+
+        comment_ids = []
+        for comment_text in ["First", "Second", "Third"]:
+            comment_data = {"post_id": post_id, "comment_text": comment_text, "user_id": "user001",
+                            "user_name": "John Doe"}
+            comment_ids.append(self.client.post('/posting/add_comment_to_post', json=comment_data)
+                               .get_json()['comment_id'])
+
+        # The thread is read page by page, oldest first
+        first_page = self.client.get(f'/posting/comments/{post_id}', query_string={"limit": 2})
+        self.assertEqual(first_page.status_code, 200)
+        self.assertEqual([comment['text'] for comment in first_page.get_json()['comments']], ["First", "Second"])
+        second_page = self.client.get(f'/posting/comments/{post_id}',
+                                      query_string={"limit": 2, "next": first_page.get_json()['next']})
+        self.assertEqual([comment['text'] for comment in second_page.get_json()['comments']], ["Third"])
+
+        response = self.client.delete('/posting/delete_comment_from_post',
+                                      json={"post_id": post_id, "comment_id": comment_ids[1]})
+        self.assertEqual(response.status_code, 200)
+
+        # The post only carries the count of its comments
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            post = mongo.db.posting.find_one({"post_id": post_id})
+            self.assertEqual(post['comment_count'], 2)
+            self.assertNotIn('comments', post)
+            self.assertEqual(mongo.db.comments.count_documents({"post_id": post_id}), 2)
+
 
 # To allow running the tests from the command line
 if __name__ == '__main__':
@@ -8,6 +8,8 @@ infrastructure_path = '/Users/saharoz/Desktop/Study/personal/UrbanHiveServer/Inf
 sys.path.insert(0, infrastructure_path)
 
 from Infrastructure.app import create_app  # This should work now that we've added the correct path
+from database import DataBase
+from cached_collection import CachedCollection, entity_cache
 from flask_pymongo import PyMongo
 from flask_testing import TestCase
 
@@ -48,6 +50,7 @@ class MyTest(TestCase):
         with self.app.app_context():
             mongo = PyMongo(self.app)
             mongo.db.users.drop()
+            mongo.db.inbox.drop()
 
     def test_get_users(self):
         # Call the get_users endpoint
@@ -76,6 +79,44 @@ class MyTest(TestCase):
         # Verify that the _id field has been converted to a string
         self.assertIsInstance(data['users'][0]['_id'], str)
 
+    def test_get_users_pages(self):
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            mongo.db.users.insert_many([{"id": f"user{i}", "name": f"user {i}"} for i in range(4)])
+
+        # Walk the pages with the 'next' token until the last page
+        ids = []
+        query = {"limit": 2}
+        while True:
+            response = self.client.get('/users', query_string=query)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data)
+            self.assertLessEqual(len(data['users']), 2)
+            ids.extend(user['id'] for user in data['users'])
+            if not data['next']:
+                break
+            query = {"limit": 2, "next": data['next']}
+
+        self.assertEqual(sorted(ids), sorted(["311156616", "user0", "user1", "user2", "user3"]))
+
+        response = self.client.get('/users', query_string={"next": "not-a-token"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_user_by_id_fields(self):
+        response = self.client.get('/user/311156616', query_string={"fields": "id,name,password"})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(set(data), {"_id", "id", "name"})
+
+        response = self.client.get('/user/311156616', query_string={"exclude": "location"})
+        data = json.loads(response.data)
+        self.assertNotIn('location', data)
+        self.assertNotIn('password', data)
+        self.assertEqual(data['email'], 'danors@gmail.com')
+
+        response = self.client.get('/user/311156616', query_string={"fields": "name", "exclude": "email"})
+        self.assertEqual(response.status_code, 400)
+
     def test_add_user_success(self):
         # Mock user data
         user_data = {
@@ -109,6 +150,19 @@ class MyTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('danor', response.json['name'])
 
+    def test_get_users_never_returns_passwords(self):
+        response = self.client.get('/users')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('password', response.json['users'][0])
+
+        response = self.client.get('/users', query_string={"stream": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('password', json.loads(response.data)['users'][0])
+
+        response = self.client.get('/users', query_string={"fields": "id,password"})
+        self.assertEqual(response.json['users'][0], {"_id": response.json['users'][0]['_id'], "id": "311156616"})
+        self.assertEqual(self.client.get('/users', query_string={"fields": "password"}).status_code, 400)
+
     def test_get_user_by_id_not_found(self):
         response = self.client.get('/user/nonexistentid')
         self.assertEqual(response.status_code, 404)
@@ -138,6 +192,32 @@ class MyTest(TestCase):
         response = self.client.post('/user/change-password', json=password_data)
         self.assertEqual(response.status_code, 200)
 
+    def test_password_is_never_cached(self):
+        # Reading the user caches it, without its password
+        self.client.get('/user/311156616')
+        self.assertNotIn('password', entity_cache.get('users', '311156616'))
+
+        # A password changed by another worker is checked right away
+        with self.app.app_context():
+            mongo = PyMongo(self.app)
+            mongo.db.users.update_one({"id": "311156616"}, {"$set": {"password": "changedelsewhere"}})
+        response = self.client.post('/users/password', json={"id": "311156616", "password": "Ds0502660865"})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post('/users/password', json={"id": "311156616", "password": "changedelsewhere"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_transaction_writes_are_invalidated_after_it_ends(self):
+        users = CachedCollection(DataBase().db['users'], 'id')
+
+        def rename(session):
+            users.update_one({"id": "311156616"}, {"$set": {"name": "renamed"}}, session=session)
+            # Like a concurrent request reading the user before the commit, which caches it as it was
+            users.find_one({"id": "311156616"})
+
+        with self.app.test_request_context():
+            DataBase.run_transaction(rename)
+        self.assertEqual(self.client.get('/user/311156616').json['name'], "renamed")
+
     def test_change_password_mismatch(self):
         password_data = {"id": "311156616", "new_password": "newpassword", "verify_new_password": "differentpassword"}
         response = self.client.post('/user/change-password', json=password_data)
@@ -147,6 +227,54 @@ class MyTest(TestCase):
         response = self.client.put('/user/311156616/radius', json={"radius": 5.0})
         self.assertEqual(response.status_code, 200)
 
+    def test_cached_user_is_invalidated_on_update(self):
+        # The second read is served from the entity cache
+        self.client.get('/user/311156616')
+        self.client.get('/user/311156616')
+        stats = self.client.get('/cache_stats').json['collections']['users']
+        self.assertGreaterEqual(stats['hits'], 1)
+
+        response = self.client.put('/user/311156616/radius', json={"radius": 7.5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/user/311156616').json['radius'], 7.5)
+
+    def test_delete_user_deletes_their_requests(self):
+        self.client.post('/user/', json={"id": "311285514", "name": "sahar", "email": "saharo@gmail.com",
+                                         "password": "So0509813056", "phoneNumber": "0987654321",
+                                         "location": {"latitude": 37.4219909, "longitude": -122.0839496}})
+        response = self.client.post('/user/add-friend', json={"sender_id": "311156616", "receiver_id": "311285514"})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.delete('/user/311156616')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/inbox/311285514').json['requests'], [])
+
+    def test_round_trip_header(self):
+        self.app.config["MONGO_ROUND_TRIP_HEADER"] = True
+        response = self.client.get('/user/311156616')
+        self.assertEqual(response.headers['X-Mongo-Round-Trips'], '1')
+
+        # Every request starts with its own count and identity map, even inside the test's app context: the same
+        # lookup is now an entity cache hit
+        response = self.client.get('/user/311156616')
+        self.assertEqual(response.headers['X-Mongo-Round-Trips'], '0')
+
+        # Both users of a friend request are fetched with a single query, and the request is one insert
+        self.client.post('/user/', json={"id": "311285514", "name": "sahar", "email": "saharo@gmail.com",
+                                         "password": "So0509813056", "phoneNumber": "0987654321",
+                                         "location": {"latitude": 37.4219909, "longitude": -122.0839496}})
+        response = self.client.post('/user/add-friend', json={"sender_id": "311156616", "receiver_id": "311285514"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Mongo-Round-Trips'], '2')
+
+        # The request is read and answered, and both friend lists are updated with a single bulk write. In a
+        # transaction both users are read again, from its snapshot, and the transaction is committed
+        response = self.client.post('/user/respond-to-request',
+                                    json={"receiver_id": "311285514", "sender_id": "311156616", "response": 1})
+        self.assertEqual(response.status_code, 200)
+        commit = 1 if DataBase.supports_transactions() else 0
+        self.assertEqual(response.headers['X-Mongo-Round-Trips'], str(3 + 2 * commit))
+
     def test_update_user_radius_invalid(self):
         response = self.client.put('/user/311156616/radius', json={"radius": "notafloat"})
         self.assertEqual(response.status_code, 400)
@@ -164,16 +292,20 @@ class MyTest(TestCase):
         response = self.client.post('/user/add-friend', json={"sender_id": "311156616", "receiver_id": "311285514"})
         self.assertEqual(response.status_code, 200)
 
-        # checking the request has been added to both data bases of both users (danor from set-up sahar from test)
-        response_user = self.client.get('/user/311285514')
-        self.assertEqual(response_user.status_code, 200)
-        self.assertIn('requests', response_user.json)
-        self.assertTrue(any(request['id'] == "311156616" for request in response_user.json['requests']))
+        # checking the request is in the receiver's inbox (sahar from test), and in the sent box of the sender (danor
+        # from set-up)
+        response_inbox = self.client.get('/inbox/311285514')
+        self.assertEqual(response_inbox.status_code, 200)
+        self.assertTrue(any(friend_request['sender_id'] == "311156616" and friend_request['kind'] == "friend"
+                            for friend_request in response_inbox.json['requests']))
+
+        response_inbox = self.client.get('/inbox/311156616', query_string={"box": "sent"})
+        self.assertEqual(response_inbox.status_code, 200)
+        self.assertTrue(any(friend_request['recipient_id'] == "311285514"
+                            for friend_request in response_inbox.json['requests']))
 
-        response_user = self.client.get('/user/311156616')
-        self.assertEqual(response_user.status_code, 200)
-        self.assertIn('requests', response_user.json)
-        self.assertTrue(any(request['id'] == "311285514" for request in response_user.json['requests']))
+        # The user documents no longer hold requests
+        self.assertNotIn('requests', self.client.get('/user/311285514').json)
 
     def test_respond_to_request_accept(self):
         user_data = {